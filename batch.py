@@ -0,0 +1,198 @@
+import os
+import numpy as np
+from typing import Tuple, Iterable
+from concurrent.futures import ProcessPoolExecutor
+
+from core import validate_input, calculate_drain_amount, check_coordinate_types
+
+
+def pack_walls(
+    walls: Iterable[Tuple[list, list, list]], integer_coordinates: bool = True
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list]:
+    """
+    Pack the rain drains of several walls into flat NumPy arrays.
+
+    The walls whose lists have values of the wrong type or different lengths cannot be packed: they are
+    replaced by empty walls and their error message is returned.
+
+    Args:
+        walls (Iterable[Tuple[list, list, list]]): height, left_x and right_x lists of each wall.
+        integer_coordinates (bool, optional): If True the walls are packed as int64, otherwise as float64.
+                                              Defaults to True.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list]: concatenated heights, left x-coordinates and
+                                                                     right x-coordinates, offsets of the walls (the
+                                                                     rain drains of wall w are at
+                                                                     offsets[w]:offsets[w + 1]) and, for each wall,
+                                                                     the packing error message or None.
+    """
+    dtype = np.int64 if integer_coordinates else np.float64
+    empty = np.empty(0, dtype=dtype)
+    heights, left_xs, right_xs, lengths, errors = [empty], [empty], [empty], [0], []
+
+    for height, left_x, right_x in walls:
+        try:
+            for name, values in (("height", height), ("left_x", left_x), ("right_x", right_x)):
+                check_coordinate_types(name, values, integer_coordinates)
+            if not (len(height) == len(left_x) == len(right_x)):
+                raise Exception(
+                    "The height, left_x and right_x input lists of the wall have different lengths."
+                )
+        except Exception as error:
+            height = left_x = right_x = empty
+            errors.append(str(error))
+        else:
+            errors.append(None)
+
+        heights.append(np.asarray(height, dtype=dtype))
+        left_xs.append(np.asarray(left_x, dtype=dtype))
+        right_xs.append(np.asarray(right_x, dtype=dtype))
+        lengths.append(len(height))
+
+    return (
+        np.concatenate(heights),
+        np.concatenate(left_xs),
+        np.concatenate(right_xs),
+        np.cumsum(lengths),
+        errors,
+    )
+
+
+def solve_packed_walls(
+    height: np.ndarray,
+    left_x: np.ndarray,
+    right_x: np.ndarray,
+    offsets: np.ndarray,
+    water_amount_per_unit_of_length: float,
+    method: str = "sweep",
+    validate: bool = True,
+) -> Tuple[np.ndarray, list]:
+    """
+    Validate and solve, one after the other, the walls packed by pack_walls().
+
+    Args:
+        height (np.ndarray): Concatenated heights.
+        left_x (np.ndarray): Concatenated left x-coordinates.
+        right_x (np.ndarray): Concatenated right x-coordinates.
+        offsets (np.ndarray): Offsets of the walls.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        method (str, optional): Resolution algorithm (see calculate_drain_amount()). Defaults to "sweep".
+        validate (bool, optional): If True, each wall is checked with validate_input() first. Defaults to True.
+
+    Returns:
+        Tuple[np.ndarray, list]: concatenated drain amounts (NaN for the walls that failed) and, for each wall,
+                                 the error message or None.
+    """
+    drain_amount = np.full(len(height), np.nan, dtype=np.float64)
+    errors = []
+
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        try:
+            if validate:
+                validate_input(
+                    height[start:end],
+                    left_x[start:end],
+                    right_x[start:end],
+                    end - start,
+                    water_amount_per_unit_of_length,
+                    integer_coordinates=(method == "dense"),
+                )
+            drain_amount[start:end] = calculate_drain_amount(
+                end - start,
+                height[start:end],
+                left_x[start:end],
+                right_x[start:end],
+                water_amount_per_unit_of_length,
+                method=method,
+                as_frame=False,
+            )
+            errors.append(None)
+        except Exception as error:
+            errors.append(str(error))
+
+    return drain_amount, errors
+
+
+def calculate_drain_amount_batch(
+    walls: Iterable[Tuple[list, list, list]],
+    water_amount_per_unit_of_length: float,
+    method: str = "sweep",
+    validate: bool = True,
+    max_workers: int = None,
+    walls_per_task: int = None,
+) -> Tuple[list, list]:
+    """
+    Calculate the drain amounts of many independent walls on a pool of processes.
+
+    The walls are packed into flat NumPy arrays and split into contiguous groups, one per task, so that each
+    task only exchanges a few arrays with the pool. An invalid wall does not stop the batch: its error message
+    is returned in place of its drain amounts.
+
+    Args:
+        walls (Iterable[Tuple[list, list, list]]): height, left_x and right_x lists of each wall.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        method (str, optional): Resolution algorithm (see calculate_drain_amount()). Defaults to "sweep".
+        validate (bool, optional): If True, each wall is checked with validate_input() first. Defaults to True.
+        max_workers (int, optional): Number of processes. Defaults to the number of available cores. With
+                                     max_workers=1 the walls are solved in the calling process.
+        walls_per_task (int, optional): Number of walls per task. Defaults to a value giving about four tasks
+                                        per process.
+
+    Returns:
+        Tuple[list, list]: for each wall, in input order, the float64 array of its drain amounts (None if it failed)
+                           and its error message (None if it succeeded).
+    """
+    height, left_x, right_x, offsets, packing_errors = pack_walls(
+        walls, integer_coordinates=(method == "dense")
+    )
+    n_walls = len(offsets) - 1
+
+    if max_workers is None:
+        if hasattr(os, "sched_getaffinity"):
+            max_workers = len(os.sched_getaffinity(0))
+        else:
+            max_workers = os.cpu_count()
+    if (type(max_workers) != int) or (max_workers <= 0):
+        raise Exception("max_workers must be a positive integer.")
+
+    if walls_per_task is None:
+        walls_per_task = max(1, -(-n_walls // (4 * max_workers)))
+
+    # Contiguous groups of walls, each of them solved by a single task
+    boundaries = list(range(0, n_walls, walls_per_task)) + [n_walls]
+    tasks = []
+    for first, last in zip(boundaries[:-1], boundaries[1:]):
+        start, end = offsets[first], offsets[last]
+        tasks.append(
+            (
+                height[start:end],
+                left_x[start:end],
+                right_x[start:end],
+                offsets[first : last + 1] - start,
+                water_amount_per_unit_of_length,
+                method,
+                validate,
+            )
+        )
+
+    if (max_workers == 1) or (len(tasks) <= 1):
+        results = [solve_packed_walls(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(solve_packed_walls, *zip(*tasks)))
+
+    drain_amounts = []
+    errors = []
+    for (drain_amount, task_errors), task in zip(results, tasks):
+        task_offsets = task[3]
+        for w, error in enumerate(task_errors):
+            error = packing_errors[len(errors)] or error
+            errors.append(error)
+            drain_amounts.append(
+                None
+                if error is not None
+                else drain_amount[task_offsets[w] : task_offsets[w + 1]]
+            )
+
+    return drain_amounts, errors
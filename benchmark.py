@@ -0,0 +1,494 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import numpy as np
+from typing import Callable, Tuple
+
+from functions import (
+    generate_random_drains,
+    validate_input,
+    calculate_drain_amount,
+    generate_raindrops,
+    process_to_height_and_raindrops,
+)
+from drain_network import DrainNetwork
+
+# Reference case and sweeps: each sweep changes one parameter of the reference case.
+#   n_drains: number of rain drains
+#   wall_width: width of the wall containing the rain drains
+#   num_drops: number of raindrops
+REFERENCE_CASE = {"n_drains": 1000, "wall_width": 100000, "num_drops": 100000}
+SWEEPS = {
+    "n_drains": [100, 1000, 10000],
+    "wall_width": [1000, 10000, 100000, 1000000],
+    "num_drops": [10000, 100000, 1000000],
+}
+QUICK_SWEEPS = {
+    "n_drains": [100, 1000],
+    "wall_width": [1000, 100000],
+    "num_drops": [10000, 100000],
+}
+
+# Precision benchmark: number of rain drains of the staircase layouts, whose cascades are as deep as the
+# number of rain drains, under a rainfall profile spanning RATE_DECADES orders of magnitude.
+PRECISION_SIZES = [1000, 10000, 100000]
+QUICK_PRECISION_SIZES = [1000, 10000]
+PRECISION_MODES = [
+    ("dense", "fast"),
+    ("sweep", "fast"),
+    ("sweep", "compensated"),
+    ("sweep", "exact"),
+]
+RATE_DECADES = 16
+
+# DrainNetwork benchmark: number of rain drains of the edited layouts, on a wall of NETWORK_WALL_WIDTH. The
+# "sparse" layouts have short rain drains, while every rain drain of the "dense" layouts of generate_case() spans a
+# large part of the wall, so that the x-range of an edit is crossed by a large fraction of the rain drains.
+NETWORK_SIZES = [10000, 100000]
+QUICK_NETWORK_SIZES = [10000]
+NETWORK_LAYOUTS = ["sparse", "dense"]
+NETWORK_WALL_WIDTH = 10**7
+NETWORK_EDITS = 20
+
+# The per-drain raindrop loop is O(N M): it is skipped above this number of drain/raindrop pairs.
+MAXIMUM_LOOP_PAIRS = 10**8
+
+SEED_VALUE = 0
+
+
+def measure(function: Callable, *args, repeat: int = 3, **kwargs) -> Tuple[float, int]:
+    """
+    Measure the wall-time and the peak memory of a function call.
+
+    Args:
+        function (Callable): Function to call.
+        repeat (int, optional): Number of timed calls, the fastest one is kept. Defaults to 3.
+
+    Returns:
+        Tuple[float, int]: wall-time in seconds and peak memory allocated during the call in bytes.
+    """
+    # Timed calls, without memory tracing which slows down the allocations
+    wall_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        wall_time = min(wall_time, time.perf_counter() - start)
+
+    # Traced call (NumPy reports its allocations to tracemalloc)
+    tracemalloc.start()
+    function(*args, **kwargs)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return wall_time, peak_memory
+
+
+def generate_case(n_drains: int, wall_width: int) -> Tuple[list, list, list]:
+    """
+    Generate the reproducible rain drain layout of a benchmark case.
+
+    Args:
+        n_drains (int): Number of rain drains.
+        wall_width (int): Width of the wall.
+
+    Returns:
+        Tuple[list, list, list]: Lists containing heights, left x-coordinates, and right x-coordinates of the rain drains.
+    """
+    height, left_x, right_x = generate_random_drains(
+        N=n_drains,
+        wall_left_x=0,
+        wall_right_x=wall_width,
+        wall_minimum_height=0,
+        wall_maximum_height=2 * n_drains,
+        maximum_n_drains_per_height=3,
+        seed_value=SEED_VALUE,
+        method="vectorized",
+    )
+
+    return height.tolist(), left_x.tolist(), right_x.tolist()
+
+
+def run_case(n_drains: int, wall_width: int, num_drops: int, repeat: int = 3) -> list:
+    """
+    Time the stages of the pipeline on a benchmark case.
+
+    Args:
+        n_drains (int): Number of rain drains.
+        wall_width (int): Width of the wall.
+        num_drops (int): Number of raindrops.
+        repeat (int, optional): Number of timed calls per stage. Defaults to 3.
+
+    Returns:
+        list: one record per stage with the case parameters, the wall-time and the peak memory.
+    """
+    height, left_x, right_x = generate_case(n_drains, wall_width)
+    N = len(height)
+    water_amount_per_unit_of_length = 1.0
+
+    stages = [
+        (
+            "validate_input",
+            validate_input,
+            (height, left_x, right_x, N, water_amount_per_unit_of_length),
+            {},
+        )
+    ]
+    for method in ("dense", "sweep"):
+        stages.append(
+            (
+                f"calculate_drain_amount[{method}]",
+                calculate_drain_amount,
+                (N, height, left_x, right_x, water_amount_per_unit_of_length),
+                {"method": method},
+            )
+        )
+    stages.append(
+        (
+            "generate_raindrops",
+            generate_raindrops,
+            (num_drops, min(left_x), max(right_x), min(height), max(height)),
+            {"seed_value": SEED_VALUE},
+        )
+    )
+
+    df = calculate_drain_amount(
+        N, height, left_x, right_x, water_amount_per_unit_of_length, method="sweep"
+    )
+    rain_drops_x, rain_drops_y = generate_raindrops(
+        num_drops, min(left_x), max(right_x), min(height), max(height), SEED_VALUE
+    )
+    for method in ("loop", "skyline"):
+        if (method == "loop") and (N * num_drops > MAXIMUM_LOOP_PAIRS):
+            continue
+        stages.append(
+            (
+                f"process_to_height_and_raindrops[{method}]",
+                process_to_height_and_raindrops,
+                (N, df, rain_drops_x, rain_drops_y),
+                {"method": method},
+            )
+        )
+
+    records = []
+    for stage, function, args, kwargs in stages:
+        wall_time, peak_memory = measure(function, *args, repeat=repeat, **kwargs)
+        records.append(
+            {
+                "stage": stage,
+                "n_drains": n_drains,
+                "wall_width": wall_width,
+                "num_drops": num_drops,
+                "wall_time_s": wall_time,
+                "peak_memory_bytes": peak_memory,
+            }
+        )
+        print(
+            f"{stage:45s} N={n_drains:<8d} width={wall_width:<8d} drops={num_drops:<8d} "
+            f"{wall_time * 1000:10.2f} ms {peak_memory / 2**20:10.2f} MiB"
+        )
+
+    return records
+
+
+def run_benchmarks(sweeps: dict = SWEEPS, repeat: int = 3) -> list:
+    """
+    Run the benchmark cases obtained by sweeping each parameter of the reference case.
+
+    Args:
+        sweeps (dict, optional): Values taken by each parameter. Defaults to SWEEPS.
+        repeat (int, optional): Number of timed calls per stage. Defaults to 3.
+
+    Returns:
+        list: records of all the stages of all the cases.
+    """
+    cases = []
+    for parameter, values in sweeps.items():
+        for value in values:
+            case = dict(REFERENCE_CASE, **{parameter: value})
+            if case not in cases:
+                cases.append(case)
+
+    records = []
+    for case in cases:
+        records += run_case(**case, repeat=repeat)
+
+    return records
+
+
+def generate_cascade_case(n_drains: int) -> Tuple[list, list, list, Tuple[list, list]]:
+    """
+    Generate a staircase layout where the water of every rain drain falls on the next one, with a rainfall
+    profile whose rates change at every unit of length.
+
+    Args:
+        n_drains (int): Number of rain drains.
+
+    Returns:
+        Tuple[list, list, list, Tuple[list, list]]: Lists containing heights, left x-coordinates, and right
+                                                    x-coordinates of the rain drains and rainfall profile.
+    """
+    height = list(range(n_drains, 0, -1))
+    left_x = [2 * k for k in range(n_drains)]
+    right_x = [2 * k + 3 for k in range(n_drains)]
+
+    rng = np.random.default_rng(SEED_VALUE)
+    breakpoints = list(range(2 * n_drains + 2))
+    rates = (10.0 ** rng.uniform(-RATE_DECADES / 2, RATE_DECADES / 2, len(breakpoints) - 1)).tolist()
+
+    return height, left_x, right_x, (breakpoints, rates)
+
+
+def run_precision_case(n_drains: int, repeat: int = 3) -> list:
+    """
+    Time the accumulation modes of calculate_drain_amount() on a staircase layout and measure their errors
+    with respect to the exact drain amounts.
+
+    Args:
+        n_drains (int): Number of rain drains.
+        repeat (int, optional): Number of timed calls per mode. Defaults to 3.
+
+    Returns:
+        list: one record per mode with the wall-time, the peak memory and the maximum relative error.
+    """
+    height, left_x, right_x, rainfall_profile = generate_cascade_case(n_drains)
+    N = len(height)
+    wall_width = max(right_x) - min(left_x)
+    exact_drain_amount = calculate_drain_amount(
+        N,
+        height,
+        left_x,
+        right_x,
+        1.0,
+        method="sweep",
+        as_frame=False,
+        rainfall_profile=rainfall_profile,
+        precision="exact",
+    )
+
+    records = []
+    for method, precision in PRECISION_MODES:
+        kwargs = {
+            "method": method,
+            "as_frame": False,
+            "rainfall_profile": rainfall_profile,
+            "precision": precision,
+        }
+        wall_time, peak_memory = measure(
+            calculate_drain_amount, N, height, left_x, right_x, 1.0, repeat=repeat, **kwargs
+        )
+        drain_amount = calculate_drain_amount(N, height, left_x, right_x, 1.0, **kwargs)
+        nonzero = exact_drain_amount != 0
+        relative_error = float(
+            np.max(
+                np.abs(drain_amount[nonzero] - exact_drain_amount[nonzero])
+                / np.abs(exact_drain_amount[nonzero]),
+                initial=0.0,
+            )
+        )
+
+        stage = f"calculate_drain_amount[{method},{precision}]"
+        records.append(
+            {
+                "stage": stage,
+                "n_drains": n_drains,
+                "wall_width": wall_width,
+                "num_drops": 0,
+                "wall_time_s": wall_time,
+                "peak_memory_bytes": peak_memory,
+                "max_relative_error": relative_error,
+            }
+        )
+        print(
+            f"{stage:45s} N={n_drains:<8d} width={wall_width:<8d} "
+            f"{wall_time * 1000:10.2f} ms {peak_memory / 2**20:10.2f} MiB error={relative_error:.3e}"
+        )
+
+    return records
+
+
+def generate_sparse_case(n_drains: int, wall_width: int) -> Tuple[list, list, list]:
+    """
+    Generate a reproducible layout of short rain drains at distinct heights, about 1000 units long on average.
+
+    Args:
+        n_drains (int): Number of rain drains.
+        wall_width (int): Width of the wall.
+
+    Returns:
+        Tuple[list, list, list]: Lists containing heights, left x-coordinates, and right x-coordinates of the rain drains.
+    """
+    rng = np.random.default_rng(SEED_VALUE)
+    height = rng.permutation(n_drains)
+    left_x = rng.integers(0, wall_width - 2000, n_drains)
+    right_x = left_x + rng.integers(1, 2000, n_drains)
+
+    return height.tolist(), left_x.tolist(), right_x.tolist()
+
+
+def run_network_case(n_drains: int, layout: str, repeat: int = 3) -> list:
+    """
+    Time the edits of a DrainNetwork, each rain drain being moved one unit to the right and back, and compare
+    them with a full resolution of the layout with the sweep method.
+
+    Args:
+        n_drains (int): Number of rain drains.
+        layout (str): "sparse" (see generate_sparse_case()) or "dense" (see generate_case()).
+        repeat (int, optional): Number of timed calls per stage. Defaults to 3.
+
+    Returns:
+        list: records of the construction of the network, of an edit and of a full resolution.
+    """
+    if layout == "sparse":
+        height, left_x, right_x = generate_sparse_case(n_drains, NETWORK_WALL_WIDTH)
+    else:
+        height, left_x, right_x = generate_case(n_drains, NETWORK_WALL_WIDTH)
+    N = len(height)
+    wall_width = max(right_x) - min(left_x)
+
+    network = DrainNetwork(height, left_x, right_x)
+    edited = np.random.default_rng(SEED_VALUE).choice(N, NETWORK_EDITS, replace=False).tolist()
+
+    def edit():
+        # The x-coordinates of the rain drains at a given height are distinct, so the shifted rain drains
+        # cannot overlap their neighbors
+        for i in edited:
+            network.move_drain(i, height[i], left_x[i] + 1, right_x[i] + 1)
+            network.move_drain(i, height[i], left_x[i], right_x[i])
+
+    stages = [
+        (f"DrainNetwork[{layout}]", lambda: DrainNetwork(height, left_x, right_x), 1),
+        (f"DrainNetwork.move_drain[{layout}]", edit, 2 * NETWORK_EDITS),
+        (
+            f"calculate_drain_amount[{layout}]",
+            lambda: calculate_drain_amount(
+                N, height, left_x, right_x, 1.0, method="sweep", as_frame=False
+            ),
+            1,
+        ),
+    ]
+
+    records = []
+    for stage, function, n_calls in stages:
+        wall_time, peak_memory = measure(function, repeat=repeat)
+        records.append(
+            {
+                "stage": stage,
+                "n_drains": n_drains,
+                "wall_width": wall_width,
+                "num_drops": 0,
+                "wall_time_s": wall_time / n_calls,
+                "peak_memory_bytes": peak_memory,
+            }
+        )
+        print(
+            f"{stage:45s} N={n_drains:<8d} width={wall_width:<8d} "
+            f"{wall_time / n_calls * 1000:10.2f} ms {peak_memory / 2**20:10.2f} MiB"
+        )
+
+    return records
+
+
+def compare_to_baseline(records: list, baseline: list, threshold: float = 1.25) -> list:
+    """
+    Compare benchmark records with the records of a baseline run.
+
+    Args:
+        records (list): Records of the current run.
+        baseline (list): Records of the baseline run.
+        threshold (float, optional): Ratio between the current and the baseline values above which a
+                                     regression is flagged. Defaults to 1.25.
+
+    Returns:
+        list: one message per regression of wall-time or peak memory.
+    """
+
+    def key(record):
+        return (
+            record["stage"],
+            record["n_drains"],
+            record["wall_width"],
+            record["num_drops"],
+        )
+
+    baseline = {key(record): record for record in baseline}
+
+    regressions = []
+    for record in records:
+        reference = baseline.get(key(record))
+        if reference is None:
+            continue
+        for metric in ("wall_time_s", "peak_memory_bytes"):
+            if (reference[metric] > 0) and (
+                record[metric] > threshold * reference[metric]
+            ):
+                regressions.append(
+                    f"{record['stage']} N={record['n_drains']} width={record['wall_width']} "
+                    f"drops={record['num_drops']}: {metric} {record[metric]:.6g} vs "
+                    f"{reference[metric]:.6g} ({record[metric] / reference[metric]:.2f}x)"
+                )
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the validation, the resolution and the raindrop processing."
+    )
+    parser.add_argument("--output", help="JSON file where the results are saved.")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare with.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown (or memory growth) ratio flagged as a regression.",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed calls per stage.")
+    parser.add_argument("--quick", action="store_true", help="Run the reduced sweeps.")
+    parser.add_argument(
+        "--precision",
+        action="store_true",
+        help="Run the precision-versus-speed benchmark of the accumulation modes instead.",
+    )
+    parser.add_argument(
+        "--network",
+        action="store_true",
+        help="Run the DrainNetwork edit benchmark on sparse and dense layouts instead.",
+    )
+    args = parser.parse_args()
+
+    if args.network:
+        records = []
+        for n_drains in QUICK_NETWORK_SIZES if args.quick else NETWORK_SIZES:
+            for layout in NETWORK_LAYOUTS:
+                records += run_network_case(n_drains, layout, args.repeat)
+    elif args.precision:
+        records = []
+        for n_drains in QUICK_PRECISION_SIZES if args.quick else PRECISION_SIZES:
+            records += run_precision_case(n_drains, args.repeat)
+    else:
+        records = run_benchmarks(QUICK_SWEEPS if args.quick else SWEEPS, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "records": records,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_to_baseline(
+                records, json.load(file)["records"], args.threshold
+            )
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            raise SystemExit(1)
@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Tuple
+
+from core import validate_input, validate_parameters, check_coordinate_types, calculate_drain_amount
+
+
+def layout_fingerprint(height: list, left_x: list, right_x: list) -> bytes:
+    """
+    Compute a fingerprint of a rain drain layout.
+
+    The three input lists are packed into contiguous NumPy arrays and hashed with BLAKE2b together with their
+    dtype and length, so that two layouts share a fingerprint only if they have the same rain drains in the
+    same order.
+
+    Args:
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+
+    Returns:
+        bytes: 16-byte fingerprint of the layout.
+    """
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for values in (height, left_x, right_x):
+        array = np.ascontiguousarray(values)
+        fingerprint.update(f"{array.dtype.str}{array.shape}".encode())
+        if array.dtype.hasobject:
+            # Lists with values of mixed types: the pointers of the objects cannot be hashed
+            fingerprint.update(repr(array.tolist()).encode())
+        else:
+            fingerprint.update(array.data)
+
+    return fingerprint.digest()
+
+
+class DrainCache:
+    """
+    Memoization of validate_input() and calculate_drain_amount() for repeated layouts.
+
+    The drain amounts are linear in the water amount per unit of length, so the cache stores the drain amounts of
+    each layout for a unit water amount and scales them for every request. The entries are evicted in least
+    recently used order when there are more than max_entries of them or when their arrays take more than
+    max_bytes. Requests with a rainfall profile are not cached.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 64 * 2**20):
+        """
+        Args:
+            max_entries (int, optional): Maximum number of cached entries. Defaults to 128.
+            max_bytes (int, optional): Maximum number of bytes of the cached drain amounts. Defaults to 64 MiB.
+        """
+        if (type(max_entries) != int) or (max_entries <= 0):
+            raise Exception("max_entries must be a positive integer.")
+        if (type(max_bytes) != int) or (max_bytes < 0):
+            raise Exception("max_bytes must be a non-negative integer.")
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "validate_hits": 0,
+            "validate_misses": 0,
+            "solve_hits": 0,
+            "solve_misses": 0,
+            "evictions": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """
+        Return the hit/miss counters of the cache.
+
+        Returns:
+            dict: numbers of hits and misses of validate_input() and calculate_drain_amount(), number of evicted
+                  entries, number of entries and bytes currently cached.
+        """
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._n_bytes)
+
+    def clear(self):
+        """
+        Remove all the entries of the cache (the counters are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+            self._n_bytes = 0
+
+    def validate_input(
+        self,
+        height: list,
+        left_x: list,
+        right_x: list,
+        N: int,
+        water_amount_per_unit_of_length: float,
+        rainfall_profile: Tuple[list, list] = None,
+        integer_coordinates: bool = True,
+    ):
+        """
+        Validate the inputs (see core.validate_input()), checking each layout only once.
+
+        Raises:
+            Exception: If the inputs are not valid.
+        """
+        validate_parameters(N, water_amount_per_unit_of_length, rainfall_profile)
+        # The fingerprint does not tell apart 1 from 1.0 or True, so the types of the values are checked on every call
+        for name, values in (("height", height), ("left_x", left_x), ("right_x", right_x)):
+            check_coordinate_types(name, values, integer_coordinates)
+
+        key = ("validate", layout_fingerprint(height, left_x, right_x), N, integer_coordinates)
+        if self._get(key, "validate") is not None:
+            return
+
+        validate_input(
+            height,
+            left_x,
+            right_x,
+            N,
+            water_amount_per_unit_of_length,
+            rainfall_profile=rainfall_profile,
+            integer_coordinates=integer_coordinates,
+        )
+        self._put(key, True, 0)
+
+    def calculate_drain_amount(
+        self,
+        N: int,
+        height: list,
+        left_x: list,
+        right_x: list,
+        water_amount_per_unit_of_length: float,
+        method: str = "dense",
+        as_frame: bool = True,
+        rainfall_profile: Tuple[list, list] = None,
+    ):
+        """
+        Calculate the drain amounts (see core.calculate_drain_amount()), solving each layout only once.
+
+        Returns:
+            df: Pandas DataFrame having height, left_x, right_x and drain_amount of the rain drains as columns,
+                or a float64 NumPy array with the drain amounts if as_frame is False.
+        """
+        if rainfall_profile is not None:
+            return calculate_drain_amount(
+                N,
+                height,
+                left_x,
+                right_x,
+                water_amount_per_unit_of_length,
+                method=method,
+                as_frame=as_frame,
+                rainfall_profile=rainfall_profile,
+            )
+
+        key = ("solve", layout_fingerprint(height, left_x, right_x), method)
+        unit_drain_amount = self._get(key, "solve")
+        if unit_drain_amount is None:
+            unit_drain_amount = calculate_drain_amount(
+                N, height, left_x, right_x, 1.0, method=method, as_frame=False
+            )
+            unit_drain_amount.flags.writeable = False
+            self._put(key, unit_drain_amount, unit_drain_amount.nbytes)
+
+        drain_amount = unit_drain_amount * water_amount_per_unit_of_length
+        if not as_frame:
+            return drain_amount
+
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "height": height,
+                "left_x": left_x,
+                "right_x": right_x,
+                "drain_amount": drain_amount,
+            }
+        )
+
+    def _get(self, key: tuple, kind: str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats[f"{kind}_misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats[f"{kind}_hits"] += 1
+            return value[0]
+
+    def _put(self, key: tuple, value, n_bytes: int):
+        with self._lock:
+            if n_bytes > self.max_bytes:
+                return
+            if key in self._entries:
+                self._n_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, n_bytes)
+            self._n_bytes += n_bytes
+
+            while (len(self._entries) > self.max_entries) or (
+                self._n_bytes > self.max_bytes
+            ):
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._n_bytes -= evicted_bytes
+                self._stats["evictions"] += 1
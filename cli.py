@@ -0,0 +1,261 @@
+import argparse
+import contextlib
+import os
+import sys
+import numpy as np
+from typing import Tuple
+
+from core import validate_input, calculate_drain_amount, calculate_to_height
+from instrumentation import stage, StageRecorder
+from packed_layout import PackedLayout
+
+LAYOUT_COLUMNS = ("height", "left_x", "right_x")
+FORMATS = (".csv", ".parquet", ".npz", ".npy")
+# Packed layouts (see packed_layout.py) are only read: their results are written as .npz by default
+PACKED_FORMAT = ".rdl"
+
+
+def load_layout(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Load a rain drain layout from a file.
+
+    Supported formats:
+        - .csv: columns height, left_x and right_x, read through a memory map.
+        - .parquet: columns height, left_x and right_x, read through a memory map (requires pyarrow).
+        - .npz: arrays height, left_x and right_x.
+        - .npy: N x 3 array (height, left_x, right_x) or structured array with the three fields, memory-mapped,
+                so that only the accessed pages of large layouts are read.
+        - .rdl: packed layout written by PackedLayout.save(), memory-mapped. The rain drains are returned in
+                sorting order (descending height, ascending left_x), not in the input order of the layout
+                (see process_layout()).
+
+    Args:
+        path (str): Path of the layout file.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: heights, left x-coordinates and right x-coordinates.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == PACKED_FORMAT:
+        return PackedLayout.load(path).columns()
+
+    if extension in (".csv", ".parquet"):
+        import pandas as pd
+
+        if extension == ".csv":
+            df = pd.read_csv(path, usecols=list(LAYOUT_COLUMNS), memory_map=True)
+        else:
+            df = pd.read_parquet(path, columns=list(LAYOUT_COLUMNS), memory_map=True)
+        return tuple(df[column].to_numpy() for column in LAYOUT_COLUMNS)
+
+    if extension == ".npz":
+        with np.load(path) as arrays:
+            return tuple(arrays[column] for column in LAYOUT_COLUMNS)
+
+    if extension == ".npy":
+        array = np.load(path, mmap_mode="r")
+        if array.dtype.names is not None:
+            return tuple(array[column] for column in LAYOUT_COLUMNS)
+        if (array.ndim != 2) or (array.shape[1] != 3):
+            raise Exception(
+                f"The layout array in {path} has shape {array.shape} instead of (N, 3)."
+            )
+        return array[:, 0], array[:, 1], array[:, 2]
+
+    raise Exception(
+        f"The layout file {path} has an unsupported format. Supported formats: {', '.join(FORMATS + (PACKED_FORMAT,))}."
+    )
+
+
+def save_results(path: str, results: dict):
+    """
+    Write the results of a layout to a file, in the format given by its extension.
+
+    Args:
+        path (str): Path of the output file (.csv, .parquet, .npz or .npy).
+        results (dict): Columns to write, as NumPy arrays of equal length.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in (".csv", ".parquet"):
+        import pandas as pd
+
+        df = pd.DataFrame(results)
+        if extension == ".csv":
+            df.to_csv(path, index=False)
+        else:
+            df.to_parquet(path, index=False)
+    elif extension == ".npz":
+        np.savez(path, **results)
+    elif extension == ".npy":
+        array = np.empty(
+            len(next(iter(results.values()))),
+            dtype=[(name, column.dtype) for name, column in results.items()],
+        )
+        for name, column in results.items():
+            array[name] = column
+        np.save(path, array)
+    else:
+        raise Exception(
+            f"The output file {path} has an unsupported format. Supported formats: {', '.join(FORMATS)}."
+        )
+
+
+def process_layout(
+    input_path: str,
+    output_path: str,
+    water_amount_per_unit_of_length: float,
+    method: str = "sweep",
+    validate: bool = True,
+):
+    """
+    Load, validate and solve a layout, and write its drain amounts and to_height values.
+
+    The rows and the receivers of the output are in the order of the layout file. For a packed layout, it is the
+    order of the lists given to PackedLayout.from_arrays(), restored with the order column.
+
+    Args:
+        input_path (str): Path of the layout file.
+        output_path (str): Path of the output file.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        method (str, optional): Resolution algorithm (see calculate_drain_amount()). Defaults to "sweep".
+        validate (bool, optional): If True, the layout is checked with validate_input() first. Defaults to True.
+    """
+    # The columns of packed layouts are already sorted: their results are written back in the input order of the
+    # layout, given by its order column
+    order = None
+    if os.path.splitext(input_path)[1].lower() == PACKED_FORMAT:
+        layout = PackedLayout.load(input_path)
+        height, left_x, right_x = layout.columns()
+        order = np.asarray(layout.order)
+    else:
+        height, left_x, right_x = load_layout(input_path)
+    N = len(height)
+    presorted = order is not None
+
+    if validate:
+        validate_input(
+            height,
+            left_x,
+            right_x,
+            N,
+            water_amount_per_unit_of_length,
+            integer_coordinates=(method == "dense"),
+            presorted=presorted,
+        )
+
+    drain_amount = calculate_drain_amount(
+        N,
+        height,
+        left_x,
+        right_x,
+        water_amount_per_unit_of_length,
+        method=method,
+        as_frame=False,
+        presorted=presorted,
+    )
+    to_height, receiver = calculate_to_height(height, left_x, right_x, presorted)
+
+    results = {
+        "height": np.asarray(height),
+        "left_x": np.asarray(left_x),
+        "right_x": np.asarray(right_x),
+        "drain_amount": drain_amount,
+        "to_height": to_height,
+        "receiver": receiver,
+    }
+    if order is not None:
+        results["receiver"] = np.where(receiver >= 0, order[receiver], -1)
+        for name, column in results.items():
+            results[name] = np.empty_like(column)
+            results[name][order] = column
+
+    with stage("save_results", n_drains=N):
+        save_results(output_path, results)
+
+
+def main(argv: list = None) -> int:
+    """
+    Command-line entry point: solve every layout file given on the command line in the same process.
+
+    Args:
+        argv (list, optional): Command-line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: exit status, 1 if at least one layout failed.
+    """
+    parser = argparse.ArgumentParser(
+        description="Calculate the drain amounts of rain drain layouts stored in files."
+    )
+    parser.add_argument(
+        "layouts", nargs="+", help="Layout files (.csv, .parquet, .npz, .npy or .rdl)."
+    )
+    parser.add_argument(
+        "-w",
+        "--water-amount",
+        type=float,
+        required=True,
+        help="Amount of water per unit of length flowing down from the top edge of the wall.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default=".",
+        help="Directory where the results are written. Defaults to the current directory.",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=[extension[1:] for extension in FORMATS],
+        help="Format of the results. Defaults to the format of each layout file.",
+    )
+    parser.add_argument(
+        "-m", "--method", choices=["dense", "sweep"], default="sweep", help="Resolution algorithm."
+    )
+    parser.add_argument(
+        "--no-validate", action="store_true", help="Skip the input validation."
+    )
+    parser.add_argument(
+        "--metrics",
+        help="JSON Lines file where the timings and sizes of the pipeline stages are written.",
+    )
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    recorder = StageRecorder()
+
+    n_failed = 0
+    with recorder if args.metrics else contextlib.nullcontext():
+        for input_path in args.layouts:
+            stem, extension = os.path.splitext(os.path.basename(input_path))
+            if args.format is not None:
+                extension = "." + args.format
+            elif extension == PACKED_FORMAT:
+                extension = ".npz"
+            output_path = os.path.join(args.output_dir, f"{stem}_drain_amount{extension}")
+
+            try:
+                with stage("process_layout", layout=input_path):
+                    process_layout(
+                        input_path,
+                        output_path,
+                        args.water_amount,
+                        method=args.method,
+                        validate=not args.no_validate,
+                    )
+            except Exception as error:
+                n_failed += 1
+                print(f"{input_path}: {error}", file=sys.stderr)
+            else:
+                print(f"{input_path} -> {output_path}")
+
+    if args.metrics:
+        recorder.write_records(args.metrics)
+
+    return 1 if n_failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1887 @@
+import numpy as np
+from fractions import Fraction
+from typing import Tuple, Iterator, Iterable
+
+from instrumentation import stage
+
+
+def generate_random_drains(
+    N: int,
+    wall_left_x: int,
+    wall_right_x: int,
+    wall_minimum_height: int,
+    wall_maximum_height: int,
+    maximum_n_drains_per_height: int = 3,
+    seed_value: int = None,
+    method: str = "legacy",
+) -> Tuple[list, list, list]:
+    """
+    Generate random rain drain coordinates based on given parameters.
+
+    Args:
+        N (int): Number of rain drains to generate.
+        wall_left_x (int): Left x-coordinate of the wall.
+        wall_right_x (int): Right x-coordinate of the wall.
+        wall_minimum_height (int): Minimum height of the wall.
+        wall_maximum_height (int): Maximum height of the wall.
+        maximum_n_drains_per_height (int, optional): Maximum number of drains per height. Defaults to 3.
+        seed_value (int, optional): Seed value for reproducible random generation. Defaults to None.
+        method (str, optional): "legacy" generates the heights one at a time with the global NumPy random generator,
+                                keeping the layouts of the previous versions for a given seed_value. "vectorized"
+                                generates all the rain drains at once with a local numpy.random.Generator and
+                                returns NumPy arrays. Defaults to "legacy".
+
+    Returns:
+        Tuple[list, list, list]: Lists containing heights, left x-coordinates, and right x-coordinates of generated rain drains.
+    """
+    if (type(N) != int) or (N <= 0):
+        raise Exception("N must be a positive integer.")
+
+    if (type(seed_value) != int) or (seed_value < 0):
+        if (seed_value) == None:
+            pass
+        else:
+            raise Exception("seed_value must be an integer greater than or equal to 0.")
+
+    if (type(maximum_n_drains_per_height) != int) or (maximum_n_drains_per_height <= 1):
+        raise Exception(
+            "maximum_n_drains_per_height must be a positive integer greater than 1."
+        )
+
+    if (
+        (type(wall_right_x) != int)
+        or (type(wall_left_x) != int)
+        or (wall_right_x <= wall_left_x)
+    ):
+        raise Exception(
+            "The right x-coordinate of the wall (wall_right_x) and the left x-coordinate (wall_left_x) must be integers. In particular, wall_right_x must be greater than wall_left_x."
+        )
+
+    if (
+        (type(wall_maximum_height) != int)
+        or (type(wall_minimum_height) != int)
+        or (wall_maximum_height <= wall_minimum_height)
+    ):
+        raise Exception(
+            "The wall maximum height (wall_maximum_height) and the wall minimum height (wall_minimum_height) must be integers. In particular, wall_maximum_height must be greater than wall_minimum_height."
+        )
+
+    if method == "vectorized":
+        return generate_random_drains_vectorized(
+            N,
+            wall_left_x,
+            wall_right_x,
+            wall_minimum_height,
+            wall_maximum_height,
+            maximum_n_drains_per_height,
+            seed_value,
+        )
+    elif method != "legacy":
+        raise Exception('The generation method must be either "legacy" or "vectorized".')
+
+    count = 0
+    height = []
+    left_x = []
+    right_x = []
+
+    if seed_value is not None:
+        np.random.seed(seed_value)
+
+    seed_value_list = np.random.randint(0, N, N)
+
+    while count != N:
+        flag = True
+
+        # We use the same seed value at each step to achieve reproducibility.
+        np.random.seed(seed_value_list[count])
+
+        while flag:
+
+            # Random generation of a new height coordinate
+            height_coordinate = np.random.randint(
+                wall_minimum_height, wall_maximum_height, 1
+            )[0]
+
+            # If we already generated rain drains for that specific height coordinate we move to another height coordinate
+            if height_coordinate not in height:
+                flag = False
+
+        # Number of rain drains at the chosen height coordinate
+        n_drains_per_height = np.random.randint(1, maximum_n_drains_per_height, 1)[0]
+
+        # We generate distinct random x-coordinates to avoid overlapping among the rain drains
+        x_coordinates = np.sort(
+            np.random.choice(
+                range(wall_left_x, wall_right_x), 2 * n_drains_per_height, replace=False
+            )
+        )
+
+        height += [int(height_coordinate)] * (len(x_coordinates) // 2)
+        count += len(x_coordinates) // 2
+
+        for i, component in enumerate(x_coordinates):
+            if i % 2 == 0:
+                left_x += [int(component)]
+            else:
+                right_x += [int(component)]
+
+        if count >= N:
+            height = height[:N]
+            left_x = left_x[:N]
+            right_x = right_x[:N]
+            break
+
+        if set(height) == set(range(wall_minimum_height, wall_maximum_height)):
+            raise Exception(
+                "Too many rain drains to fit in the specified wall. Please change the inputs given to the function."
+            )
+
+    return height, left_x, right_x
+
+
+def generate_random_drains_vectorized(
+    N: int,
+    wall_left_x: int,
+    wall_right_x: int,
+    wall_minimum_height: int,
+    wall_maximum_height: int,
+    maximum_n_drains_per_height: int = 3,
+    seed_value: int = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Generate random rain drain coordinates with a local random generator and without any loop over the drains.
+
+    As in generate_random_drains(), each randomly chosen height holds between 1 and maximum_n_drains_per_height - 1
+    rain drains, whose 2 * n x-coordinates are distinct and sorted. To draw k distinct sorted integers in
+    [0, W) at once for all the heights, k integers are drawn in [0, W - k], sorted, and shifted by 0, 1, ..., k - 1.
+    The inputs are expected to be already validated by generate_random_drains().
+
+    Args:
+        N (int): Number of rain drains to generate.
+        wall_left_x (int): Left x-coordinate of the wall.
+        wall_right_x (int): Right x-coordinate of the wall.
+        wall_minimum_height (int): Minimum height of the wall.
+        wall_maximum_height (int): Maximum height of the wall.
+        maximum_n_drains_per_height (int, optional): Maximum number of drains per height. Defaults to 3.
+        seed_value (int, optional): Seed value for reproducible random generation. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Arrays containing heights, left x-coordinates, and right
+                                                   x-coordinates of generated rain drains.
+    """
+    rng = np.random.default_rng(seed_value)
+
+    wall_width = wall_right_x - wall_left_x
+    n_heights = wall_maximum_height - wall_minimum_height
+
+    # Number of rain drains per height, limited by the number of distinct x-coordinates available.
+    # N heights are always enough, since each of them holds at least one rain drain.
+    maximum_n_drains = min(maximum_n_drains_per_height, wall_width // 2 + 1)
+    if maximum_n_drains <= 1:
+        raise Exception(
+            "The wall is too narrow to fit a rain drain. Please change the inputs given to the function."
+        )
+    n_drains_per_height = rng.integers(1, maximum_n_drains, min(N, n_heights))
+
+    cumulative_n_drains = np.cumsum(n_drains_per_height)
+    if cumulative_n_drains[-1] < N:
+        raise Exception(
+            "Too many rain drains to fit in the specified wall. Please change the inputs given to the function."
+        )
+    n_used_heights = int(np.searchsorted(cumulative_n_drains, N)) + 1
+    n_drains_per_height = n_drains_per_height[:n_used_heights]
+
+    # Distinct heights drawn without replacement
+    heights = wall_minimum_height + rng.choice(
+        n_heights, n_used_heights, replace=False
+    )
+
+    # Distinct sorted x-coordinates for all the heights at once
+    n_x_coordinates = 2 * n_drains_per_height
+    group = np.repeat(np.arange(n_used_heights), n_x_coordinates)
+    draws = rng.integers(0, wall_width - n_x_coordinates[group] + 1)
+    draws = draws[np.lexsort((draws, group))]
+    group_start = np.repeat(np.cumsum(n_x_coordinates) - n_x_coordinates, n_x_coordinates)
+    x_coordinates = wall_left_x + draws + (np.arange(len(draws)) - group_start)
+
+    height = np.repeat(heights, n_drains_per_height)[:N]
+    left_x = x_coordinates[0::2][:N]
+    right_x = x_coordinates[1::2][:N]
+
+    return height, left_x, right_x
+
+
+def validate_input(
+    height: list,
+    left_x: list,
+    right_x: list,
+    N: int,
+    water_amount_per_unit_of_length: float,
+    rainfall_profile: Tuple[list, list] = None,
+    integer_coordinates: bool = True,
+    presorted: bool = False,
+):
+    """
+    Validate input lists for correct dimensions and data types.
+
+    Args:
+        height (list): List of height values.
+        left_x (list): List of left_x values.
+        right_x (list): List of right_x values.
+        N (int): Expected length of the input lists. N is a positive integer.
+        water_amount_per_unit_of_length (float): the amount of water/length that is flowing down from the top edge of the wall
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+        integer_coordinates (bool, optional): If False, non-integer heights and x-coordinates are accepted, as
+                                              supported by calculate_drain_amount() with method="sweep".
+                                              Defaults to True.
+        presorted (bool, optional): If True the rain drains must be sorted by descending height and ascending
+                                    left_x, which is checked in O(N), and they are not sorted again.
+                                    Defaults to False.
+
+    Raises:
+        Exception: If input lists have incorrect dimensions or data types, if rain drains overlap, or if presorted
+                   rain drains are not sorted.
+    """
+    with stage("validate_input", n_drains=N):
+        validate_parameters(N, water_amount_per_unit_of_length, rainfall_profile)
+
+        if len(height) != N:
+            raise Exception(
+                f"The height input list has {len(height)} elements instead of {N}."
+            )
+        if len(left_x) != N:
+            raise Exception(
+                f"The left_x input list has {len(left_x)} elements instead of {N}."
+            )
+        if len(right_x) != N:
+            raise Exception(
+                f"The right_x input list has {len(right_x)} elements instead of {N}."
+            )
+
+        for name, values in (("height", height), ("left_x", left_x), ("right_x", right_x)):
+            check_coordinate_types(name, values, integer_coordinates)
+
+        height = np.asarray(height)
+        left_x = np.asarray(left_x)
+        right_x = np.asarray(right_x)
+
+        wrong_locations = np.flatnonzero(~(right_x > left_x))
+        if len(wrong_locations) > 0:
+            raise Exception(
+                f"The right x-coordinate of the raind drain must be greater than its left x-coordinate. At location {wrong_locations[0]} this is not verified."
+            )
+
+        if presorted:
+            check_sorting_order(height, left_x)
+
+        overlapping_drains = find_overlapping_drains(height, left_x, right_x, presorted)
+        if len(overlapping_drains) > 0:
+            raise Exception(
+                " ".join(
+                    f"The rain drain at location {i} overlaps the rain drain at location {j}."
+                    for i, j in overlapping_drains.tolist()
+                )
+            )
+
+
+def validate_parameters(
+    N: int,
+    water_amount_per_unit_of_length: float,
+    rainfall_profile: Tuple[list, list] = None,
+):
+    """
+    Validate the scalar inputs of the problem.
+
+    Args:
+        N (int): Expected length of the input lists. N is a positive integer.
+        water_amount_per_unit_of_length (float): the amount of water/length that is flowing down from the top edge of the wall
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+
+    Raises:
+        Exception: If N, the amount of water/length or the rainfall profile are not valid.
+    """
+    if (type(N) != int) or (N <= 0):
+        raise Exception("N must be a positive integer.")
+
+    if rainfall_profile is not None:
+        validate_rainfall_profile(rainfall_profile)
+    elif (type(water_amount_per_unit_of_length) != float) or (
+        water_amount_per_unit_of_length <= 0
+    ):
+        raise Exception(
+            "The amount of water/length (water_amount_per_unit_of_length) must be a positive float."
+        )
+
+
+def check_coordinate_types(name: str, values: list, integer_coordinates: bool = True):
+    """
+    Check at once that all the values of an input list are integers (or real numbers).
+
+    Args:
+        name (str): Name of the input list, used in the error message.
+        values (list): List of values.
+        integer_coordinates (bool, optional): If False, finite float values are accepted as well. Defaults to True.
+
+    Raises:
+        Exception: If the list contains a value of the wrong type.
+    """
+    if integer_coordinates:
+        allowed_kinds = "iu"
+        allowed_types = (int, np.integer)
+    else:
+        allowed_kinds = "iuf"
+        allowed_types = (int, float, np.integer, np.floating)
+
+    # NumPy arrays are checked through their dtype, lists through the set of the types of their values
+    # (bool is rejected even though it is a subclass of int).
+    if isinstance(values, np.ndarray):
+        valid_types = values.dtype.kind in allowed_kinds
+    else:
+        valid_types = all(
+            issubclass(value_type, allowed_types) and (value_type is not bool)
+            for value_type in set(map(type, values))
+        )
+
+    # Integer arrays are finite: they are not converted to float64
+    if valid_types and (
+        (isinstance(values, np.ndarray) and (values.dtype.kind in "iu"))
+        or np.all(np.isfinite(np.asarray(values, dtype=np.float64)))
+    ):
+        return
+
+    # Slow path, only taken to locate the first wrong value for the error message
+    for i, value in enumerate(values):
+        if (
+            isinstance(value, bool)
+            or (not isinstance(value, allowed_types))
+            or (not np.isfinite(value))
+        ):
+            wrong_type = str(type(value))
+            wrong_type = wrong_type[wrong_type.find("'") + 1 : -2]
+            expected_values = "integer" if integer_coordinates else "finite integer or float"
+            raise Exception(
+                f"The {name} input list has a {wrong_type} value at location {i}. The {name} list should only contain {expected_values} values."
+            )
+
+
+def sorting_order(height: np.ndarray, left_x: np.ndarray, presorted: bool = False) -> np.ndarray:
+    """
+    Compute the permutation sorting the rain drains by descending height and ascending left x-coordinate.
+
+    Args:
+        height (np.ndarray): Array of heights.
+        left_x (np.ndarray): Array of left x-coordinates.
+        presorted (bool, optional): If True the rain drains are already in sorting order (see packed_layout.py)
+                                    and the identity permutation is returned without sorting. Defaults to False.
+
+    Returns:
+        np.ndarray: permutation of the rain drains.
+    """
+    if presorted:
+        return np.arange(len(height))
+
+    return np.lexsort((left_x, -height))
+
+
+def check_sorting_order(height: np.ndarray, left_x: np.ndarray):
+    """
+    Check in O(N) that the rain drains are sorted by descending height and ascending left x-coordinate.
+
+    Args:
+        height (np.ndarray): Array of heights.
+        left_x (np.ndarray): Array of left x-coordinates.
+
+    Raises:
+        Exception: If two consecutive rain drains are not in sorting order.
+    """
+    height = np.asarray(height)
+    left_x = np.asarray(left_x)
+    wrong_locations = np.flatnonzero(
+        (height[1:] > height[:-1]) | ((height[1:] == height[:-1]) & (left_x[1:] < left_x[:-1]))
+    )
+    if len(wrong_locations) > 0:
+        raise Exception(
+            f"The rain drains are not sorted by descending height and ascending left x-coordinate. At location {wrong_locations[0] + 1} this is not verified."
+        )
+
+
+def find_overlapping_drains(
+    height: np.ndarray, left_x: np.ndarray, right_x: np.ndarray, presorted: bool = False
+) -> np.ndarray:
+    """
+    Find all the pairs of overlapping rain drains.
+
+    The rain drains are sorted by descending height and ascending left x-coordinate, so that the rain drains
+    at the same height are contiguous and ordered from left to right. A rain drain then overlaps exactly the
+    following rain drains at its height whose left x-coordinate is smaller than its right x-coordinate, which
+    are located with a single binary search. Rain drains touching each other at one end do not overlap.
+
+    Args:
+        height (np.ndarray): Array of heights.
+        left_x (np.ndarray): Array of left x-coordinates.
+        right_x (np.ndarray): Array of right x-coordinates.
+        presorted (bool, optional): If True the rain drains are already in sorting order. Defaults to False.
+
+    Returns:
+        np.ndarray: M x 2 integer array with the input locations of the M pairs of overlapping rain drains.
+    """
+    height = np.asarray(height)
+    left_x = np.asarray(left_x)
+    right_x = np.asarray(right_x)
+    # Presorted columns are used as they are, without copying them through the identity permutation
+    if presorted:
+        order = None
+    else:
+        order = sorting_order(height, left_x)
+        height, left_x, right_x = height[order], left_x[order], right_x[order]
+    N = len(height)
+
+    # The binary search is performed on a single integer key combining the rank of the height and the rank
+    # of the x-coordinate, which is sorted because of the sorting order of the rain drains. The heights being
+    # sorted, their ranks are obtained in O(N) by counting the changes of height.
+    height_rank = np.zeros(N, dtype=np.int64)
+    np.cumsum(height[1:] != height[:-1], out=height_rank[1:])
+    x_coordinates, x_rank = np.unique(np.concatenate((left_x, right_x)), return_inverse=True)
+    x_rank = x_rank.astype(np.int64).reshape(-1)
+    stride = len(x_coordinates) + 1
+    left_key = height_rank * stride + x_rank[:N]
+    right_key = height_rank * stride + x_rank[N:]
+
+    # Rain drains at sorted positions k + 1, ..., end[k] - 1 overlap the rain drain at sorted position k
+    positions = np.arange(N)
+    end = np.searchsorted(left_key, right_key, side="left")
+    n_overlaps = np.maximum(end - positions - 1, 0)
+
+    first = np.repeat(positions, n_overlaps)
+    offsets = np.arange(n_overlaps.sum()) - np.repeat(
+        np.cumsum(n_overlaps) - n_overlaps, n_overlaps
+    )
+    second = first + 1 + offsets
+
+    if presorted:
+        return np.column_stack((first, second))
+    return np.column_stack((order[first], order[second]))
+
+
+def validate_rainfall_profile(rainfall_profile: Tuple[list, list]):
+    """
+    Validate a piecewise-constant rainfall profile.
+
+    Args:
+        rainfall_profile (Tuple[list, list]): breakpoints and rates of the profile. The rate rates[k] is the amount
+                                              of water/length flowing down from the top edge of the wall between
+                                              breakpoints[k] and breakpoints[k + 1]. Outside the breakpoints no
+                                              water flows down.
+
+    Raises:
+        Exception: If the breakpoints and the rates are not consistent.
+    """
+    if (type(rainfall_profile) not in (tuple, list)) or (len(rainfall_profile) != 2):
+        raise Exception(
+            "The rainfall profile (rainfall_profile) must be a pair of lists: breakpoints and rates."
+        )
+
+    breakpoints = np.asarray(rainfall_profile[0], dtype=np.float64)
+    rates = np.asarray(rainfall_profile[1], dtype=np.float64)
+
+    if (rates.ndim != 1) or (len(rates) == 0):
+        raise Exception("The rates of the rainfall profile must be a non-empty list.")
+
+    if (breakpoints.ndim != 1) or (len(breakpoints) != len(rates) + 1):
+        raise Exception(
+            f"The rainfall profile has {len(breakpoints)} breakpoints instead of {len(rates) + 1}."
+        )
+
+    if np.any(np.diff(breakpoints) <= 0):
+        raise Exception(
+            "The breakpoints of the rainfall profile must be strictly increasing."
+        )
+
+    if np.any(rates < 0):
+        raise Exception("The rates of the rainfall profile must be non-negative.")
+
+
+def integrate_rainfall_profile(
+    rainfall_profile: Tuple[list, list], x: np.ndarray
+) -> np.ndarray:
+    """
+    Evaluate the amount of water flowing down from the top edge of the wall to the left of each x-coordinate.
+
+    The integral of a piecewise-constant profile is piecewise linear, so it is interpolated from its prefix
+    sums at the breakpoints. The water amount falling on [a, b) is then the difference of the integral at b and a.
+
+    Args:
+        rainfall_profile (Tuple[list, list]): breakpoints and rates of the profile (see validate_rainfall_profile()).
+        x (np.ndarray): Array of x-coordinates.
+
+    Returns:
+        np.ndarray: float64 array with the integral of the profile from its first breakpoint up to x.
+    """
+    breakpoints = np.asarray(rainfall_profile[0], dtype=np.float64)
+    rates = np.asarray(rainfall_profile[1], dtype=np.float64)
+
+    prefix_sums = np.concatenate(([0.0], np.cumsum(rates * np.diff(breakpoints))))
+
+    return np.interp(np.asarray(x, dtype=np.float64), breakpoints, prefix_sums)
+
+
+def compensated_prefix_sums(
+    breakpoints: np.ndarray, rates: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the prefix sums of a piecewise-constant rainfall profile at its breakpoints as float64 pairs.
+
+    The water amount of each piece is formed without rounding error as a value and an error term (TwoSum for the
+    width of the piece, Dekker's TwoProduct for its product with the rate), then the pieces are cumulated with a
+    Neumaier running sum keeping the compensation term of every prefix sum.
+
+    Args:
+        breakpoints (np.ndarray): float64 array with the breakpoints of the profile.
+        rates (np.ndarray): float64 array with the rates of the profile.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: float64 arrays with the rounded prefix sums and their compensation terms.
+    """
+    # TwoSum: width + width_error == breakpoints[k + 1] - breakpoints[k] exactly
+    upper = breakpoints[1:]
+    lower = -breakpoints[:-1]
+    width = upper + lower
+    virtual = width - upper
+    width_error = (upper - (width - virtual)) + (lower - virtual)
+
+    # TwoProduct: piece + piece_error == rates[k] * width exactly, by splitting the factors into 26-bit halves
+    def split(values):
+        scaled = 134217729.0 * values
+        high = scaled - (scaled - values)
+        return high, values - high
+
+    piece = rates * width
+    rate_high, rate_low = split(rates)
+    width_high, width_low = split(width)
+    piece_error = (
+        ((rate_high * width_high - piece) + rate_high * width_low + rate_low * width_high)
+        + rate_low * width_low
+        + rates * width_error
+    )
+
+    # Neumaier summation: the running compensation collects the low-order bits lost by the running sum
+    prefix_value = [0.0]
+    prefix_error = [0.0]
+    total = 0.0
+    compensation = 0.0
+    for value, error in zip(piece.tolist(), piece_error.tolist()):
+        new_total = total + value
+        if abs(total) >= abs(value):
+            compensation += (total - new_total) + value + error
+        else:
+            compensation += (value - new_total) + total + error
+        total = new_total
+        prefix_value.append(total)
+        prefix_error.append(compensation)
+
+    return np.array(prefix_value, dtype=np.float64), np.array(prefix_error, dtype=np.float64)
+
+
+def validate_capacity(capacity: list, N: int) -> np.ndarray:
+    """
+    Validate the capacities of the rain drains.
+
+    Args:
+        capacity (list): Maximum flow of each rain drain, as a float or a list of N floats.
+        N (int): Number of rain drains.
+
+    Returns:
+        np.ndarray: float64 array with the capacity of each rain drain.
+
+    Raises:
+        Exception: If the capacities are not N non-negative floats.
+    """
+    try:
+        capacity = np.broadcast_to(np.asarray(capacity, dtype=np.float64), (N,))
+    except (TypeError, ValueError):
+        raise Exception(
+            f"The capacities (capacity) must be a float or a list of {N} floats."
+        )
+    if np.any(np.isnan(capacity)) or np.any(capacity < 0):
+        raise Exception("The capacities (capacity) must be non-negative floats.")
+
+    return capacity
+
+
+def route_drains(
+    height: list,
+    left_x: list,
+    right_x: list,
+    presorted: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the routing of the water among the rain drains over the compressed x-coordinates.
+
+    The distinct left and right x-coordinates of the rain drains split the wall into elementary
+    segments. Each segment is either exposed to the top edge of the wall through exactly one rain
+    drain (the highest one covering it) or to none of them. The water falling from the right end of
+    a rain drain is captured by the first rain drain, in sorting order, that covers that x-coordinate.
+
+    Args:
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        presorted (bool, optional): If True the rain drains are already in sorting order. Defaults to False.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+            - order: permutation sorting the rain drains by descending height and ascending left_x.
+            - x_coordinates: sorted distinct x-coordinates delimiting the elementary segments.
+            - segment_owner: sorted position of the rain drain exposed on each elementary segment
+                             (-1 if the segment is not covered by any rain drain).
+            - receiver: sorted position of the rain drain receiving the water of each rain drain
+                        (-1 if the water falls to the ground).
+    """
+    height = np.asarray(height)
+    left_x = np.asarray(left_x)
+    right_x = np.asarray(right_x)
+
+    # Sorting step to order the rain drains from the top edge of the wall downwards
+    order = sorting_order(height, left_x, presorted)
+
+    # Coordinate compression: every rain drain covers the elementary segments [left_index, right_index).
+    # Presorted columns are used as they are, without copying them through the identity permutation.
+    if not presorted:
+        left_x, right_x = left_x[order], right_x[order]
+    x_coordinates = np.unique(np.concatenate((left_x, right_x)))
+    left_index = np.searchsorted(x_coordinates, left_x).tolist()
+    right_index = np.searchsorted(x_coordinates, right_x).tolist()
+    n_segments = len(x_coordinates) - 1
+    N = len(order)
+
+    # Segment tree over the elementary segments storing, for each node, the last rain drain painted
+    # on it together with the time of painting. The rain drains are painted from the bottom of the wall
+    # upwards, so the latest painting covering a segment is the highest rain drain above it.
+    painting_time = [-1] * (2 * n_segments)
+    painting_owner = [-1] * (2 * n_segments)
+    receiver = [-1] * N
+
+    for t, i in enumerate(range(N - 1, -1, -1)):
+        # Before painting the rain drain, the segment just after its right end is owned by the
+        # first rain drain below it (in sorting order) covering that position.
+        position = right_index[i]
+        if position < n_segments:
+            position += n_segments
+            latest_time = -1
+            while position >= 1:
+                if painting_time[position] > latest_time:
+                    latest_time = painting_time[position]
+                    receiver[i] = painting_owner[position]
+                position >>= 1
+
+        a = left_index[i] + n_segments
+        b = right_index[i] + n_segments
+        while a < b:
+            if a & 1:
+                painting_time[a] = t
+                painting_owner[a] = i
+                a += 1
+            if b & 1:
+                b -= 1
+                painting_time[b] = t
+                painting_owner[b] = i
+            a >>= 1
+            b >>= 1
+
+    # Resolution of the final owner of each elementary segment by walking all the leaves up to the root
+    # at once.
+    painting_time = np.array(painting_time)
+    painting_owner = np.array(painting_owner)
+    nodes = np.arange(n_segments, 2 * n_segments)
+    segment_time = np.full(n_segments, -1)
+    segment_owner = np.full(n_segments, -1)
+    while nodes.any():
+        newer = painting_time[nodes] > segment_time
+        segment_time[newer] = painting_time[nodes[newer]]
+        segment_owner[newer] = painting_owner[nodes[newer]]
+        nodes = nodes >> 1
+
+    return order, x_coordinates, segment_owner, np.array(receiver, dtype=np.int64)
+
+
+def calculate_receivers(
+    height: list, left_x: list, right_x: list, presorted: bool = False, routing: tuple = None
+) -> np.ndarray:
+    """
+    Calculate the receiver graph of the rain drains in O(N logN).
+
+    Args:
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        presorted (bool, optional): If True the rain drains are already in sorting order. Defaults to False.
+        routing (tuple, optional): Result of route_drains() for the same rain drains, reused instead of routing
+                                   them again. Defaults to None.
+
+    Returns:
+        np.ndarray: integer array containing, for each rain drain, the location in the input lists of the rain
+                    drain receiving the water falling from its right end (-1 if the water falls to the ground).
+    """
+    if routing is None:
+        routing = route_drains(height, left_x, right_x, presorted)
+    order, _, _, receiver = routing
+
+    # Conversion of the sorted positions into input locations
+    result = np.empty(len(order), dtype=np.int64)
+    result[order] = np.where(receiver >= 0, order[receiver], -1)
+
+    return result
+
+
+def calculate_to_height(
+    height: list, left_x: list, right_x: list, presorted: bool = False, routing: tuple = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the heights of the locations where the water amounts of the different rain drains fall.
+
+    Args:
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        presorted (bool, optional): If True the rain drains are already in sorting order. Defaults to False.
+        routing (tuple, optional): Result of route_drains() for the same rain drains, reused instead of routing
+                                   them again. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: height of the receiver of each rain drain (the minimum height of the rain
+                                       drains if the water falls to the ground) and receiver graph (see
+                                       calculate_receivers()).
+    """
+    height = np.asarray(height)
+    receiver = calculate_receivers(height, left_x, right_x, presorted, routing)
+    to_height = np.where(receiver >= 0, height[receiver], height.min())
+
+    return to_height, receiver
+
+
+def dense_drain_amount(
+    height: np.ndarray,
+    left_x: np.ndarray,
+    right_x: np.ndarray,
+    water_amount_per_unit_of_length: float,
+    rainfall_profile: Tuple[list, list] = None,
+    capacity: list = None,
+    presorted: bool = False,
+) -> np.ndarray:
+    """
+    Array-native resolution algorithm walking a NumPy array as long as the wall width.
+
+    Args:
+        height (np.ndarray): Array of integer heights.
+        left_x (np.ndarray): Array of integer left x-coordinates.
+        right_x (np.ndarray): Array of integer right x-coordinates.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+        capacity (list, optional): Maximum flow of each rain drain (see spill_drain_amount()). Defaults to None.
+        presorted (bool, optional): If True the rain drains are already in sorting order. Defaults to False.
+
+    Returns:
+        np.ndarray: float64 array with the drain amounts in the order of the input arrays.
+    """
+    height = np.asarray(height)
+    left_x = np.asarray(left_x)
+    right_x = np.asarray(right_x)
+    if capacity is not None:
+        capacity = validate_capacity(capacity, len(height))
+
+    # Sorting step to order the rain drains for the consequent analysis
+    with stage("dense_drain_amount.sort", n_drains=len(height)):
+        order = sorting_order(height, left_x, presorted)
+
+    # Initialization of the variables used in the loop:
+    #   min_x_left: it represents the minimum left x-coordinate among the left x-coordinates of the drains
+    #               Since this value might be different from zero, we need to take it into account
+    #               when evaluating the indexes used to extract the slices from "wall_rain_fall"
+    #               corresponding to the rain drain under analysis.
+    #   wall_with: it represents the width of the wall containing the rain drains. This value is used to
+    #              define the length of the "wall_rain_fall" array.
+    #   wall_rain_fall: this array has length equal to the "wall_width" and keeps track of the locations where
+    #                   the drains can receive rain drops directly from the top edge of the wall and from the
+    #                   right ends of the above rain drains
+    #   drain_amount: preallocated result, filled following the sorting order
+    min_x_left = left_x.min()
+    wall_width = int(right_x.max() - min_x_left)
+    if rainfall_profile is None:
+        wall_rain_fall = np.full(
+            wall_width, water_amount_per_unit_of_length, dtype=np.float64
+        )
+    else:
+        wall_rain_fall = np.diff(
+            integrate_rainfall_profile(
+                rainfall_profile, np.arange(min_x_left, min_x_left + wall_width + 1)
+            )
+        )
+    drain_amount = np.empty(len(order), dtype=np.float64)
+
+    if not presorted:
+        left_x, right_x = left_x[order], right_x[order]
+        if capacity is not None:
+            capacity = capacity[order]
+    left_index = (left_x - min_x_left).tolist()
+    right_index = (right_x - min_x_left).tolist()
+    if capacity is not None:
+        capacity = capacity.tolist()
+
+    with stage(
+        "dense_drain_amount.loop",
+        n_drains=len(order),
+        wall_width=wall_width,
+        wall_rain_fall_bytes=wall_rain_fall.nbytes,
+    ):
+        for k in range(len(order)):
+            l = left_index[k]
+            r = right_index[k]
+
+            # Determination of the water amount falling from the right end of the examined rain drain
+            # by summing the amount of water coming from the rain drops coming from the top edge of the wall
+            # plus potential water amounts falling from the above rain drains
+            amount = wall_rain_fall[l:r].sum()
+
+            # Updating the "wall_rain_fall" array by setting to zero its values at the positions coinciding with
+            # the rain drain under consideration, except for the entry corresponding to the position just after
+            # the right end of the rain drain. This latter entry is augmented by the value of the associated drain amount.
+            # With a capacity, the water exceeding it spills uniformly along the rain drain instead.
+            overflow = 0.0
+            if (capacity is not None) and (amount > capacity[k]):
+                overflow = amount - capacity[k]
+                amount = capacity[k]
+            wall_rain_fall[l:r] = overflow / (r - l)
+            if r < wall_width:
+                wall_rain_fall[r] += amount
+
+            drain_amount[k] = amount
+
+    # Rearranging the drain amounts to match the order of the provided input arrays.
+    if presorted:
+        return drain_amount
+    result = np.empty_like(drain_amount)
+    result[order] = drain_amount
+
+    return result
+
+
+def sweep_drain_amount(
+    height: np.ndarray,
+    left_x: np.ndarray,
+    right_x: np.ndarray,
+    water_amount_per_unit_of_length: float,
+    rainfall_profile: Tuple[list, list] = None,
+    capacity: list = None,
+    precision: str = "fast",
+    presorted: bool = False,
+) -> np.ndarray:
+    """
+    Array-native resolution algorithm working on the compressed x-coordinates of the rain drains.
+
+    Args:
+        height (np.ndarray): Array of heights.
+        left_x (np.ndarray): Array of left x-coordinates.
+        right_x (np.ndarray): Array of right x-coordinates.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+        capacity (list, optional): Maximum flow of each rain drain (see spill_drain_amount()). Defaults to None.
+        precision (str, optional): Accumulation of the water amounts. "fast" cascades the drain amounts down the
+                                   receiver graph, "compensated" and "exact" integrate the rainfall over the
+                                   catchment of each rain drain (see catchment_drain_amount()). Defaults to "fast".
+        presorted (bool, optional): If True the rain drains are already in sorting order. Defaults to False.
+
+    Returns:
+        np.ndarray: float64 array with the drain amounts in the order of the input arrays.
+    """
+    if precision not in ("fast", "compensated", "exact"):
+        raise Exception(
+            'The precision must be either "fast", "compensated" or "exact".'
+        )
+
+    if capacity is not None:
+        if precision != "fast":
+            raise Exception('The rain drain capacities require precision="fast".')
+        return spill_drain_amount(
+            height, left_x, right_x, water_amount_per_unit_of_length, capacity, rainfall_profile, presorted
+        )[0]
+
+    with stage("sweep_drain_amount.route", n_drains=len(height)) as routing:
+        order, x_coordinates, segment_owner, receiver = route_drains(
+            height, left_x, right_x, presorted
+        )
+        routing.set(n_segments=len(segment_owner))
+
+    if precision != "fast":
+        with stage("sweep_drain_amount.catchment", n_drains=len(order), precision=precision):
+            drain_amount = catchment_drain_amount(
+                x_coordinates,
+                segment_owner,
+                receiver,
+                water_amount_per_unit_of_length,
+                rainfall_profile,
+                exact=(precision == "exact"),
+            )
+        if presorted:
+            return drain_amount
+        result = np.empty_like(drain_amount)
+        result[order] = drain_amount
+        return result
+
+    with stage("sweep_drain_amount.accumulate", n_drains=len(order), n_segments=len(segment_owner)):
+        # Water captured directly from the top edge of the wall by the exposed segments of each rain drain
+        if rainfall_profile is None:
+            segment_rain_fall = water_amount_per_unit_of_length * np.diff(x_coordinates)
+        else:
+            segment_rain_fall = np.diff(
+                integrate_rainfall_profile(rainfall_profile, x_coordinates)
+            )
+        exposed = segment_owner >= 0
+        drain_amount = np.bincount(
+            segment_owner[exposed],
+            weights=segment_rain_fall[exposed],
+            minlength=len(order),
+        )
+        drain_amount = cascade_drain_amount(receiver, drain_amount)
+
+    # Rearranging the drain amounts to match the order of the provided input arrays.
+    if presorted:
+        return drain_amount
+    result = np.empty_like(drain_amount)
+    result[order] = drain_amount
+
+    return result
+
+
+def catchment_drain_amount(
+    x_coordinates: np.ndarray,
+    segment_owner: np.ndarray,
+    receiver: np.ndarray,
+    water_amount_per_unit_of_length: float,
+    rainfall_profile: Tuple[list, list] = None,
+    exact: bool = False,
+) -> np.ndarray:
+    """
+    High-accuracy resolution algorithm integrating the rainfall over the catchment of each rain drain.
+
+    The water flows rightwards and downwards, so the paths of two raindrops cannot cross: the top edge of the wall
+    draining into a rain drain is a single interval. Its bounds are cascaded down the receiver graph with min and
+    max, which are exact, and the drain amount is the integral of the rainfall between them, obtained as the
+    difference of two prefix sums instead of accumulating the water amounts along the cascade. The error does not
+    grow with the depth of the cascades nor depend on the order of the rain drains.
+
+    With exact=False the prefix sums of the rainfall profile are stored as float64 pairs (value and compensation
+    term, see compensated_prefix_sums()), so that the differences do not lose the small catchments of wide walls
+    (for a uniform rainfall the drain amount is simply the water amount per unit of length times the catchment
+    width). With exact=True the integrals
+    are computed with rational numbers and rounded once, which is slower but correctly rounded.
+
+    Args:
+        x_coordinates (np.ndarray): Sorted distinct x-coordinates, as returned by route_drains().
+        segment_owner (np.ndarray): Rain drain exposed on each elementary segment, as returned by route_drains().
+        receiver (np.ndarray): Receiver of each rain drain, as returned by route_drains().
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+        exact (bool, optional): If True the integrals are computed with rational numbers. Defaults to False.
+
+    Returns:
+        np.ndarray: float64 array with the drain amounts in sorting order.
+    """
+    n_drains = len(receiver)
+    n_segments = len(segment_owner)
+
+    # Catchment of each rain drain: elementary segments [first, last), empty if last <= first
+    exposed = np.flatnonzero(segment_owner >= 0)
+    first = np.full(n_drains, n_segments, dtype=np.int64)
+    last = np.zeros(n_drains, dtype=np.int64)
+    np.minimum.at(first, segment_owner[exposed], exposed)
+    np.maximum.at(last, segment_owner[exposed], exposed + 1)
+    first = first.tolist()
+    last = last.tolist()
+    for i, j in enumerate(receiver.tolist()):
+        if j >= 0:
+            first[j] = min(first[j], first[i])
+            last[j] = max(last[j], last[i])
+    first = np.array(first, dtype=np.int64)
+    last = np.array(last, dtype=np.int64)
+    empty = last <= first
+    first[empty] = 0
+    last[empty] = 0
+    start_x = x_coordinates[first]
+    end_x = x_coordinates[last]
+
+    if rainfall_profile is None:
+        if not exact:
+            return water_amount_per_unit_of_length * (end_x - start_x)
+        water = Fraction(water_amount_per_unit_of_length)
+        return np.array(
+            [
+                float(water * (Fraction(end) - Fraction(start)))
+                for start, end in zip(start_x.tolist(), end_x.tolist())
+            ],
+            dtype=np.float64,
+        )
+
+    # Piecewise-constant rainfall: the catchment bounds are clipped to the breakpoints since no water flows down
+    # outside of them
+    breakpoints = np.asarray(rainfall_profile[0], dtype=np.float64)
+    rates = np.asarray(rainfall_profile[1], dtype=np.float64)
+    start_x = np.clip(start_x, breakpoints[0], breakpoints[-1])
+    end_x = np.clip(end_x, breakpoints[0], breakpoints[-1])
+    start_k = np.clip(np.searchsorted(breakpoints, start_x, side="right") - 1, 0, len(rates) - 1)
+    end_k = np.clip(np.searchsorted(breakpoints, end_x, side="right") - 1, 0, len(rates) - 1)
+
+    if exact:
+        # Exact prefix sums at the breakpoints
+        prefix_sums = [Fraction(0)]
+        for k in range(len(rates)):
+            prefix_sums.append(
+                prefix_sums[-1]
+                + Fraction(rates[k]) * (Fraction(breakpoints[k + 1]) - Fraction(breakpoints[k]))
+            )
+
+        def integral(k, x):
+            return prefix_sums[k] + Fraction(rates[k]) * (Fraction(x) - Fraction(breakpoints[k]))
+
+        return np.array(
+            [
+                float(integral(k_end, end) - integral(k_start, start))
+                for k_start, start, k_end, end in zip(
+                    start_k.tolist(), start_x.tolist(), end_k.tolist(), end_x.tolist()
+                )
+            ],
+            dtype=np.float64,
+        )
+
+    # Compensated prefix sums: rounded value and compensation term
+    prefix_value, prefix_error = compensated_prefix_sums(breakpoints, rates)
+    start_partial = rates[start_k] * (start_x - breakpoints[start_k])
+    end_partial = rates[end_k] * (end_x - breakpoints[end_k])
+    drain_amount = (
+        (prefix_value[end_k] - prefix_value[start_k])
+        + (prefix_error[end_k] - prefix_error[start_k])
+        + (end_partial - start_partial)
+    )
+
+    # Catchments within a single piece of the profile
+    same_piece = start_k == end_k
+    drain_amount[same_piece] = rates[start_k[same_piece]] * (
+        end_x[same_piece] - start_x[same_piece]
+    )
+
+    return drain_amount
+
+
+def spill_drain_amount(
+    height: list,
+    left_x: list,
+    right_x: list,
+    water_amount_per_unit_of_length: float,
+    capacity: list,
+    rainfall_profile: Tuple[list, list] = None,
+    presorted: bool = False,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resolution algorithm for rain drains with a maximum flow capacity.
+
+    The water reaching a rain drain beyond its capacity does not flow to its right end: it spills uniformly along
+    the rain drain onto the rain drains (or the ground) beneath it. The rain drains are processed in sorting order,
+    from the top edge of the wall downwards, keeping the partition of the compressed x-coordinates into runs of
+    segments whose water comes from the same source: the top edge of the wall or the spill of the last rain drain
+    processed above them (see spill_pieces()). The resolution stays O(N logN).
+
+    Args:
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        capacity (list): Maximum flow of each rain drain, as a float or a list of N floats.
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+        presorted (bool, optional): If True the rain drains are already in sorting order. Defaults to False.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: float64 arrays with the drain amounts (water flowing from the right ends,
+                                       at most the capacities) and with the water spilled by each rain drain, in
+                                       the order of the input lists.
+    """
+    order, x_coordinates, _, receiver = route_drains(height, left_x, right_x, presorted)
+    capacity = validate_capacity(capacity, len(order))
+    left_x = np.asarray(left_x)
+    right_x = np.asarray(right_x)
+    if not presorted:
+        capacity, left_x, right_x = capacity[order], left_x[order], right_x[order]
+    capacity = capacity.tolist()
+    left_index = np.searchsorted(x_coordinates, left_x).tolist()
+    right_index = np.searchsorted(x_coordinates, right_x).tolist()
+    n_segments = len(x_coordinates) - 1
+
+    # Rain falling from the top edge of the wall on each elementary segment, cumulated over the segments
+    if rainfall_profile is None:
+        cumulative_rain_fall = water_amount_per_unit_of_length * (
+            x_coordinates - x_coordinates[0]
+        )
+    else:
+        cumulative_rain_fall = integrate_rainfall_profile(rainfall_profile, x_coordinates)
+    cumulative_rain_fall = cumulative_rain_fall.tolist()
+    x_coordinates = x_coordinates.tolist()
+
+    piece_offsets, piece_source, piece_start, piece_end = spill_pieces(
+        left_index, right_index, n_segments
+    )
+    piece_offsets = piece_offsets.tolist()
+    piece_source = piece_source.tolist()
+    piece_start = piece_start.tolist()
+    piece_end = piece_end.tolist()
+
+    inflow = [0.0] * len(order)
+    drain_amount = [0.0] * len(order)
+    overflow = [0.0] * len(order)
+    spill_rate = [0.0] * len(order)
+
+    for i in range(len(order)):
+        a = left_index[i]
+        b = right_index[i]
+
+        # Water of the runs covered by the rain drain: rain or spill of the rain drain above
+        amount = inflow[i]
+        for k in range(piece_offsets[i], piece_offsets[i + 1]):
+            source = piece_source[k]
+            start = piece_start[k]
+            end = piece_end[k]
+            if source < 0:
+                amount += cumulative_rain_fall[end] - cumulative_rain_fall[start]
+            else:
+                amount += spill_rate[source] * (x_coordinates[end] - x_coordinates[start])
+
+        # Water exceeding the capacity spills along the rain drain, the rest flows from its right end
+        if amount > capacity[i]:
+            overflow[i] = amount - capacity[i]
+            spill_rate[i] = overflow[i] / (x_coordinates[b] - x_coordinates[a])
+            amount = capacity[i]
+        drain_amount[i] = amount
+        j = receiver[i]
+        if j >= 0:
+            inflow[j] += amount
+
+    # Rearranging the results to match the order of the provided input lists.
+    if presorted:
+        return np.array(drain_amount, dtype=np.float64), np.array(overflow, dtype=np.float64)
+    result = np.empty(len(order), dtype=np.float64)
+    result[order] = drain_amount
+    result_overflow = np.empty(len(order), dtype=np.float64)
+    result_overflow[order] = overflow
+
+    return result, result_overflow
+
+
+def spill_pieces(
+    left_index: list, right_index: list, n_segments: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decompose the x-range of each rain drain into the runs of elementary segments through which it receives water
+    from above: the top edge of the wall or the spill of the last rain drain above covering them.
+
+    The rain drains are processed in sorting order keeping the partition of the segments into runs fed by the same
+    source. A rain drain collects the runs it covers and replaces them with a single run of its own, so it adds at
+    most two runs and the runs are visited O(N) times in total. The run starts are kept in a linked list, walked and
+    unlinked in O(1), and in a Fenwick tree locating the run containing the left end of a rain drain in O(logN).
+    The runs remaining at the end are the pieces of the ground, given after the pieces of the last rain drain.
+
+    Args:
+        left_index (list): Index of the first elementary segment of each rain drain, in sorting order.
+        right_index (list): Index of the elementary segment after each rain drain, in sorting order.
+        n_segments (int): Number of elementary segments.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: offsets of the pieces of each rain drain (the pieces
+                                                               of the rain drain at sorted position i are at
+                                                               offsets[i]:offsets[i + 1], the pieces of the ground
+                                                               at offsets[N]:), source of each piece (sorted
+                                                               position of the spilling rain drain, -1 for the top
+                                                               edge of the wall) and first and last + 1 segments
+                                                               of each piece.
+    """
+    # Runs of segments: the run starting at segment p covers the segments [p, next_start[p]) and receives the
+    # water of run_source[p]. run_count is a Fenwick tree over the segments counting the run starts, so that the
+    # run containing a segment is found with a prefix count followed by a binary lifting descent.
+    next_start = [n_segments] * n_segments
+    run_source = [-1] * n_segments
+    run_count = [0] * (n_segments + 1)
+    lifting_step = 1 << (n_segments.bit_length() - 1)
+
+    def add_run_start(p, delta):
+        p += 1
+        while p <= n_segments:
+            run_count[p] += delta
+            p += p & -p
+
+    def run_containing(p):
+        rank = 0
+        p += 1
+        while p > 0:
+            rank += run_count[p]
+            p -= p & -p
+        position = 0
+        step = lifting_step
+        while step:
+            if (position + step <= n_segments) and (run_count[position + step] < rank):
+                position += step
+                rank -= run_count[position]
+            step >>= 1
+        return position
+
+    add_run_start(0, 1)
+
+    offsets = [0]
+    piece_source = []
+    piece_start = []
+    piece_end = []
+
+    for i in range(len(left_index)):
+        a = left_index[i]
+        b = right_index[i]
+
+        # Runs covered by the rain drain. The runs starting inside the rain drain are unlinked, since the rain
+        # drain replaces them.
+        first = run_containing(a)
+        position = first
+        source = -1
+        while position < b:
+            following = next_start[position]
+            source = run_source[position]
+            piece_source.append(source)
+            piece_start.append(max(position, a))
+            piece_end.append(min(following, b))
+            if position > a:
+                add_run_start(position, -1)
+            position = following
+        offsets.append(len(piece_source))
+
+        # Runs after the painting: the run of the rain drain, followed by the rest of the last run it covers
+        if (b < n_segments) and (position > b):
+            run_source[b] = source
+            next_start[b] = position
+            add_run_start(b, 1)
+            position = b
+        if first < a:
+            next_start[first] = a
+            add_run_start(a, 1)
+        run_source[a] = i
+        next_start[a] = position
+
+    # Pieces of the ground
+    position = 0
+    while position < n_segments:
+        piece_source.append(run_source[position])
+        piece_start.append(position)
+        piece_end.append(next_start[position])
+        position = next_start[position]
+
+    return (
+        np.array(offsets, dtype=np.int64),
+        np.array(piece_source, dtype=np.int64),
+        np.array(piece_start, dtype=np.int64),
+        np.array(piece_end, dtype=np.int64),
+    )
+
+
+def cascade_drain_amount(receiver: np.ndarray, drain_amount: np.ndarray) -> np.ndarray:
+    """
+    Add the water amount of each rain drain to the one of its receiver.
+
+    Args:
+        receiver (np.ndarray): Sorted position of the receiver of each rain drain (-1 for the ground),
+                               as returned by route_drains().
+        drain_amount (np.ndarray): Water captured directly from the top edge of the wall by each rain drain,
+                                   in sorting order.
+
+    Returns:
+        np.ndarray: float64 array with the drain amounts in sorting order.
+    """
+    # Each rain drain precedes its receiver in the sorting order, so a single forward pass is enough.
+    cascade = np.asarray(drain_amount, dtype=np.float64).tolist()
+    for i, j in enumerate(receiver.tolist()):
+        if j >= 0:
+            cascade[j] += cascade[i]
+
+    return np.array(cascade, dtype=np.float64)
+
+
+def calculate_drain_amount(
+    N: int,
+    height: list,
+    left_x: list,
+    right_x: list,
+    water_amount_per_unit_of_length: float,
+    method: str = "dense",
+    as_frame: bool = True,
+    rainfall_profile: Tuple[list, list] = None,
+    capacity: list = None,
+    precision: str = "fast",
+    presorted: bool = False,
+):
+    """
+    Calculate drain amounts based on given parameters.
+
+    Args:
+        N (int): Number of rain drains.
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        method (str, optional): Resolution algorithm. "dense" walks an array as long as the wall width,
+                                "sweep" works on the compressed x-coordinates of the rain drains, so that its
+                                cost does not depend on the wall width and non-integer coordinates are allowed.
+                                Defaults to "dense".
+        as_frame (bool, optional): If False, the drain amounts are returned as a bare NumPy array and no
+                                   DataFrame is built. Defaults to True.
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+        capacity (list, optional): Maximum flow of each rain drain, as a float or a list of N floats. The water
+                                   exceeding it spills along the rain drain onto the rain drains beneath it
+                                   (see spill_drain_amount()). Defaults to None (unlimited).
+        precision (str, optional): With method="sweep", "fast", "compensated" or "exact" accumulation of the water
+                                   amounts (see catchment_drain_amount()). Defaults to "fast".
+        presorted (bool, optional): If True the rain drains are already sorted by descending height and ascending
+                                    left_x (e.g. the columns of a PackedLayout) and are not sorted again.
+                                    Defaults to False.
+
+    Returns:
+        df: Pandas DataFrame having height, left_x, right_x and drain_amount of the rain drains as columns,
+            or a float64 NumPy array with the drain amounts in the order of the input lists if as_frame is False.
+    """
+    with stage("calculate_drain_amount", n_drains=N, method=method):
+        if method == "dense":
+            if precision != "fast":
+                raise Exception('The "dense" resolution method only supports precision="fast".')
+            drain_amount = dense_drain_amount(
+                height,
+                left_x,
+                right_x,
+                water_amount_per_unit_of_length,
+                rainfall_profile,
+                capacity,
+                presorted,
+            )
+        elif method == "sweep":
+            drain_amount = sweep_drain_amount(
+                height,
+                left_x,
+                right_x,
+                water_amount_per_unit_of_length,
+                rainfall_profile,
+                capacity,
+                precision,
+                presorted,
+            )
+        else:
+            raise Exception('The resolution method must be either "dense" or "sweep".')
+
+    if not as_frame:
+        return drain_amount
+
+    with stage("calculate_drain_amount.frame", n_drains=N):
+        # pandas is only imported when a DataFrame is requested
+        import pandas as pd
+
+        df = pd.DataFrame(
+            {
+                "height": height,
+                "left_x": left_x,
+                "right_x": right_x,
+                "drain_amount": drain_amount,
+            }
+        )
+
+    return df
+
+
+def calculate_drain_amount_scenarios(
+    N: int,
+    height: list,
+    left_x: list,
+    right_x: list,
+    water_amounts_per_unit_of_length: list = None,
+    rainfall_profiles: list = None,
+) -> np.ndarray:
+    """
+    Calculate drain amounts for several water amounts per unit of length, or several rainfall profiles, at once.
+
+    The drain amounts are linear in the rainfall, so the sorting and the routing of the rain drains are computed
+    only once. For water amounts, the drain amounts for a unit water amount are scaled for every scenario. For
+    rainfall profiles, only the water falling on each elementary segment depends on the scenario, and it is
+    cascaded down the same receiver graph.
+
+    Args:
+        N (int): Number of rain drains.
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        water_amounts_per_unit_of_length (list, optional): K amounts of water per unit of length. Defaults to None.
+        rainfall_profiles (list, optional): K rainfall profiles (breakpoints and rates, see
+                                            validate_rainfall_profile()) replacing water_amounts_per_unit_of_length.
+                                            Defaults to None.
+
+    Returns:
+        np.ndarray: N x K float64 array with the drain amounts, the rows following the order of the input
+                    lists and the columns the order of the water amounts or rainfall profiles.
+    """
+    for name, values in (("height", height), ("left_x", left_x), ("right_x", right_x)):
+        if len(values) != N:
+            raise Exception(
+                f"The {name} input list has {len(values)} elements instead of {N}."
+            )
+
+    if (water_amounts_per_unit_of_length is None) == (rainfall_profiles is None):
+        raise Exception(
+            "Either the amounts of water/length or the rainfall profiles of the scenarios must be given."
+        )
+
+    if rainfall_profiles is not None:
+        for rainfall_profile in rainfall_profiles:
+            validate_rainfall_profile(rainfall_profile)
+
+        order, x_coordinates, segment_owner, receiver = route_drains(height, left_x, right_x)
+        exposed = segment_owner >= 0
+        drain_amount = np.empty((len(order), len(rainfall_profiles)), dtype=np.float64)
+        for k, rainfall_profile in enumerate(rainfall_profiles):
+            segment_rain_fall = np.diff(integrate_rainfall_profile(rainfall_profile, x_coordinates))
+            drain_amount[order, k] = cascade_drain_amount(
+                receiver,
+                np.bincount(
+                    segment_owner[exposed], weights=segment_rain_fall[exposed], minlength=len(order)
+                ),
+            )
+        return drain_amount
+
+    water_amounts_per_unit_of_length = np.asarray(
+        water_amounts_per_unit_of_length, dtype=np.float64
+    )
+    if (water_amounts_per_unit_of_length.ndim != 1) or np.any(
+        water_amounts_per_unit_of_length <= 0
+    ):
+        raise Exception(
+            "The amounts of water/length (water_amounts_per_unit_of_length) must be a list of positive floats."
+        )
+
+    unit_drain_amount = sweep_drain_amount(height, left_x, right_x, 1.0)
+
+    return np.outer(unit_drain_amount, water_amounts_per_unit_of_length)
+
+
+def calculate_drainage_network(
+    N: int,
+    height: list,
+    left_x: list,
+    right_x: list,
+    water_amount_per_unit_of_length: float,
+    rainfall_profile: Tuple[list, list] = None,
+    ground_bins: list = None,
+) -> dict:
+    """
+    Calculate the drain amounts together with the routing graph, the upstream catchment widths and the water
+    reaching the ground.
+
+    Everything is derived from a single call to route_drains(): the exposed width of each rain drain is
+    cascaded down the receiver graph like the drain amounts, and the water reaching the ground is the rain
+    falling on the segments not covered by any rain drain plus the water falling from the right ends of the
+    rain drains without receiver.
+
+    Args:
+        N (int): Number of rain drains.
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        water_amount_per_unit_of_length (float): Amount of water per unit of length.
+        rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                        water/length replacing water_amount_per_unit_of_length.
+                                                        Defaults to None.
+        ground_bins (list, optional): Increasing x-coordinates delimiting the ground intervals over which the
+                                      water reaching the ground is aggregated. As in np.histogram(), every
+                                      interval is closed on the left and open on the right except the last one.
+                                      Defaults to None (the elementary segments of route_drains()).
+
+    Returns:
+        dict:
+            - drain_amount: float64 array with the drain amounts.
+            - receiver: location of the receiver of each rain drain (-1 if the water falls to the ground).
+            - edges: M x 2 array of the (sender, receiver) locations of the M rain drains whose water falls
+                     on another rain drain.
+            - catchment_width: float64 array with the width of the top edge of the wall draining into each
+                               rain drain, directly or through the rain drains above it.
+            - ground_bins: x-coordinates delimiting the ground intervals.
+            - ground_discharge: float64 array with the water reaching the ground in each ground interval.
+        The arrays indexed by rain drain follow the order of the input lists.
+    """
+    order, x_coordinates, segment_owner, receiver = route_drains(height, left_x, right_x)
+    right_x = np.asarray(right_x)
+
+    # Water and width captured directly from the top edge of the wall by each rain drain
+    segment_width = np.diff(x_coordinates).astype(np.float64)
+    if rainfall_profile is None:
+        segment_rain_fall = water_amount_per_unit_of_length * segment_width
+    else:
+        segment_rain_fall = np.diff(
+            integrate_rainfall_profile(rainfall_profile, x_coordinates)
+        )
+    exposed = segment_owner >= 0
+    catchment_width = cascade_drain_amount(
+        receiver,
+        np.bincount(
+            segment_owner[exposed], weights=segment_width[exposed], minlength=len(order)
+        ),
+    )
+    if rainfall_profile is None:
+        # The drain amounts are proportional to the catchment widths
+        drain_amount = water_amount_per_unit_of_length * catchment_width
+    else:
+        drain_amount = cascade_drain_amount(
+            receiver,
+            np.bincount(
+                segment_owner[exposed], weights=segment_rain_fall[exposed], minlength=len(order)
+            ),
+        )
+
+    # Rain falling directly on the ground: cumulative amount over the uncovered segments at the bin edges
+    if ground_bins is None:
+        ground_bins = x_coordinates
+    ground_bins = np.asarray(ground_bins)
+    if (ground_bins.ndim != 1) or (len(ground_bins) < 2) or np.any(np.diff(ground_bins) <= 0):
+        raise Exception("The ground bins must be at least two increasing x-coordinates.")
+    uncovered_rain_fall = np.where(exposed, 0.0, segment_rain_fall)
+    cumulative_rain_fall = np.concatenate(([0.0], np.cumsum(uncovered_rain_fall)))
+    edges_x = np.clip(ground_bins, x_coordinates[0], x_coordinates[-1])
+    segment = np.clip(
+        np.searchsorted(x_coordinates, edges_x, side="right") - 1, 0, len(segment_owner) - 1
+    )
+    if rainfall_profile is None:
+        partial_rain_fall = water_amount_per_unit_of_length * (edges_x - x_coordinates[segment])
+    else:
+        partial_rain_fall = integrate_rainfall_profile(
+            rainfall_profile, edges_x
+        ) - integrate_rainfall_profile(rainfall_profile, x_coordinates[segment])
+    ground_rain_fall = cumulative_rain_fall[segment] + np.where(
+        exposed[segment], 0.0, partial_rain_fall
+    )
+
+    # Water falling from the right ends of the rain drains without receiver
+    to_ground = order[receiver < 0]
+    ground_discharge = np.diff(ground_rain_fall) + np.histogram(
+        right_x[to_ground], bins=ground_bins, weights=drain_amount[receiver < 0]
+    )[0]
+
+    # Rearranging the results to match the order of the provided input lists
+    result = {
+        "drain_amount": np.empty(len(order), dtype=np.float64),
+        "receiver": np.empty(len(order), dtype=np.int64),
+        "catchment_width": np.empty(len(order), dtype=np.float64),
+    }
+    result["drain_amount"][order] = drain_amount
+    result["receiver"][order] = np.where(receiver >= 0, order[receiver], -1)
+    result["catchment_width"][order] = catchment_width
+    senders = np.flatnonzero(result["receiver"] >= 0)
+    result["edges"] = np.column_stack((senders, result["receiver"][senders]))
+    result["ground_bins"] = ground_bins
+    result["ground_discharge"] = ground_discharge
+
+    return result
+
+
+def simulate_drain_outflow(
+    N: int,
+    height: list,
+    left_x: list,
+    right_x: list,
+    rainfall: list,
+    lag: list = None,
+    capacity: list = None,
+    dtype: type = np.float64,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Simulate the outflow of the rain drains for a rainfall varying over time.
+
+    At every timestep t each rain drain receives rainfall[t] times its exposed width, plus the outflow of the rain
+    drains above it leaving them lag timesteps earlier. The outflow of a rain drain is its inflow, limited to its
+    capacity if given. As in calculate_drain_amount(), the excess spills uniformly along the rain drain onto the
+    rain drains (or the ground) beneath it, at the same timestep (see spill_pieces()). The rain drains are
+    processed in the routing order of route_drains(), where each rain drain precedes its receiver and the rain
+    drains beneath it, and each one is advanced over all the timesteps at once with array operations, so that the
+    cost is O(N logN + N T) with only N Python iterations. With a constant rainfall and no lag the outflow at every
+    timestep equals the drain amounts of calculate_drain_amount() with the same capacities.
+
+    Args:
+        N (int): Number of rain drains.
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        rainfall (list): Amount of water per unit of length falling at each of the T timesteps.
+        lag (list, optional): Number of timesteps taken by the water falling from the right end of each rain drain
+                              to reach its receiver or the ground, as an integer or a list of N integers. The water
+                              arriving after the last timestep is not returned. Defaults to None (no lag).
+        capacity (list, optional): Maximum outflow of each rain drain per timestep, as a float or a list of N
+                                   floats. Defaults to None (unlimited).
+        dtype (type, optional): Floating point type of the outflow matrix, which is allocated directly in that
+                                type: with np.float32 the N x T matrix, and therefore the peak memory for large
+                                N T, is half the size. The ground outflow stays float64. Defaults to np.float64.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: N x T array with the outflow of each rain drain (rows following the order of
+                                       the input lists) and array with the water reaching the ground at each
+                                       timestep (rain on the uncovered segments, outflow of the rain drains
+                                       without receiver and spills reaching the ground).
+    """
+    rainfall = np.asarray(rainfall, dtype=np.float64)
+    if (rainfall.ndim != 1) or np.any(rainfall < 0):
+        raise Exception("The rainfall must be a list of non-negative amounts of water/length.")
+    T = len(rainfall)
+
+    order, x_coordinates, segment_owner, receiver = route_drains(height, left_x, right_x)
+    n_drains = len(order)
+
+    if lag is None:
+        lag = 0
+    lag = np.broadcast_to(np.asarray(lag), (n_drains,))
+    if (lag.dtype.kind not in "iu") or np.any(lag < 0):
+        raise Exception("The lags must be non-negative integers.")
+    if capacity is not None:
+        capacity = validate_capacity(capacity, n_drains)
+
+    # Width of the top edge of the wall exposed to the rain through each rain drain, or through none of them
+    segment_width = np.diff(x_coordinates).astype(np.float64)
+    exposed = segment_owner >= 0
+    exposed_width = np.bincount(
+        segment_owner[exposed], weights=segment_width[exposed], minlength=n_drains
+    )
+    ground_outflow = segment_width[~exposed].sum() * rainfall
+
+    # Direct inflow of the rain drains, stored in the order of the input lists and completed in place
+    # with the inflow from the rain drains above
+    width = np.empty(n_drains, dtype=np.float64)
+    width[order] = exposed_width
+    outflow = np.empty((n_drains, T), dtype=dtype)
+    np.multiply.outer(width.astype(dtype), rainfall.astype(dtype), out=outflow)
+
+    if capacity is not None:
+        # Pieces of the rain drains and of the ground beneath each rain drain, grouped by spilling rain drain
+        sorted_left_x = np.asarray(left_x)[order]
+        sorted_right_x = np.asarray(right_x)[order]
+        piece_offsets, piece_source, piece_start, piece_end = spill_pieces(
+            np.searchsorted(x_coordinates, sorted_left_x).tolist(),
+            np.searchsorted(x_coordinates, sorted_right_x).tolist(),
+            len(x_coordinates) - 1,
+        )
+        piece_row = np.full(len(piece_source), -1, dtype=np.int64)
+        piece_row[: piece_offsets[-1]] = np.repeat(order, np.diff(piece_offsets))
+        piece_width = x_coordinates[piece_end] - x_coordinates[piece_start]
+        spilled = np.flatnonzero(piece_source >= 0)
+        spilled = spilled[np.argsort(piece_source[spilled], kind="stable")]
+        spill_offsets = np.searchsorted(piece_source[spilled], np.arange(n_drains + 1))
+        drain_width = (sorted_right_x - sorted_left_x).astype(np.float64)
+
+    for i, j in enumerate(receiver.tolist()):
+        k = order[i]
+        drain_outflow = outflow[k]
+        if capacity is not None:
+            overflow = drain_outflow - capacity[k]
+            np.maximum(overflow, 0.0, out=overflow)
+            np.minimum(drain_outflow, capacity[k], out=drain_outflow)
+
+            # The overflow spills uniformly along the rain drain onto the pieces beneath it
+            pieces = spilled[spill_offsets[i] : spill_offsets[i + 1]]
+            rows = piece_row[pieces]
+            on_ground = rows < 0
+            spill = overflow / drain_width[i]
+            ground_outflow += piece_width[pieces[on_ground]].sum() * spill
+            np.add.at(
+                outflow,
+                rows[~on_ground],
+                np.multiply.outer(piece_width[pieces[~on_ground]], spill).astype(dtype, copy=False),
+            )
+
+        # Water falling from the right end of the rain drain, lag[k] timesteps later
+        target = outflow[order[j]] if j >= 0 else ground_outflow
+        delay = int(lag[k])
+        if delay < T:
+            target[delay:] += drain_outflow[: T - delay]
+
+    return outflow, ground_outflow
+
+
+def generate_raindrops(
+    num_drops: int,
+    x_min: int,
+    x_max: int,
+    y_min: int,
+    y_max: int,
+    seed_value: int = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate random raindrop coordinates within specified ranges.
+
+    Args:
+        num_drops (int): Number of raindrops to generate.
+        x_min (int): Minimum x-coordinate value.
+        x_max (int): Maximum x-coordinate value.
+        y_min (int): Minimum y-coordinate value.
+        y_max (int): Maximum y-coordinate value.
+        seed_value (int, optional): Seed value for random number generator. Default is None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Two NumPy arrays representing x and y coordinates of raindrops.
+    """
+    if seed_value is not None:
+        np.random.seed(seed_value)
+
+    # Generation of the random raindrops positions
+    x = np.random.uniform(x_min, x_max, num_drops)
+    y = np.random.uniform(y_min, y_max, num_drops)
+
+    return x, y
+
+
+def generate_raindrop_chunks(
+    num_drops: int,
+    x_min: int,
+    x_max: int,
+    y_min: int,
+    y_max: int,
+    seed_value: int = None,
+    chunk_size: int = 1000000,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Generate random raindrop coordinates within specified ranges, chunk by chunk.
+
+    The x-coordinates and the y-coordinates are drawn from two PCG64 streams, the second one starting where
+    the first one ends, so the raindrops are the same as np.random.default_rng(seed_value) drawing all the
+    x-coordinates and then all the y-coordinates, whatever the chunk size.
+
+    Args:
+        num_drops (int): Number of raindrops to generate.
+        x_min (int): Minimum x-coordinate value.
+        x_max (int): Maximum x-coordinate value.
+        y_min (int): Minimum y-coordinate value.
+        y_max (int): Maximum y-coordinate value.
+        seed_value (int, optional): Seed value for random number generator. Default is None.
+        chunk_size (int, optional): Maximum number of raindrops per chunk. Defaults to 1000000.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: Two NumPy arrays representing x and y coordinates of the raindrops of a chunk.
+    """
+    if (type(chunk_size) != int) or (chunk_size <= 0):
+        raise Exception("chunk_size must be a positive integer.")
+
+    if seed_value is None:
+        seed_value = np.random.SeedSequence().entropy
+
+    # Each uniform draw consumes exactly one output of the bit generator
+    x_bit_generator = np.random.PCG64(seed_value)
+    y_bit_generator = np.random.PCG64(seed_value)
+    y_bit_generator.advance(num_drops)
+    x_generator = np.random.Generator(x_bit_generator)
+    y_generator = np.random.Generator(y_bit_generator)
+
+    for start in range(0, num_drops, chunk_size):
+        size = min(chunk_size, num_drops - start)
+        yield x_generator.uniform(x_min, x_max, size), y_generator.uniform(
+            y_min, y_max, size
+        )
+
+
+def filter_raindrop_chunks(
+    skyline: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    chunks: Iterable[Tuple[np.ndarray, np.ndarray]],
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Remove the raindrops hidden beneath the rain drains from each chunk of raindrops.
+
+    Args:
+        skyline (Tuple[np.ndarray, np.ndarray, np.ndarray]): Skyline of the rain drains (see calculate_skyline()).
+        chunks (Iterable[Tuple[np.ndarray, np.ndarray]]): Chunks of raindrop x-coordinates and y-coordinates.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: x and y coordinates of the visible raindrops of a chunk.
+    """
+    for rain_drops_x, rain_drops_y in chunks:
+        visible = visible_raindrops(skyline, rain_drops_x, rain_drops_y)
+        yield rain_drops_x[visible], rain_drops_y[visible]
+
+
+def calculate_skyline(
+    height: list, left_x: list, right_x: list, routing: tuple = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculate the height of the highest rain drain covering each x-coordinate of the wall.
+
+    The skyline is piecewise constant over the compressed x-coordinates of the rain drains: on each
+    elementary segment it is the height of the rain drain exposed on it (see route_drains()), while at the
+    x-coordinates themselves, which belong to the rain drains ending and starting there, it is the highest of
+    the two adjacent segments.
+
+    Args:
+        height (list): List of heights.
+        left_x (list): List of left x-coordinates.
+        right_x (list): List of right x-coordinates.
+        routing (tuple, optional): Result of route_drains() for the same rain drains, reused instead of routing
+                                   them again. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: sorted distinct x-coordinates of the rain drains, skyline height
+                                                   on each elementary segment and skyline height at each
+                                                   x-coordinate (-inf where no rain drain covers the wall).
+    """
+    if routing is None:
+        routing = route_drains(height, left_x, right_x)
+    order, x_coordinates, segment_owner, _ = routing
+
+    sorted_height = np.asarray(height, dtype=np.float64)[order]
+    segment_height = np.where(
+        segment_owner >= 0, sorted_height[segment_owner], -np.inf
+    )
+    padded_height = np.concatenate(([-np.inf], segment_height, [-np.inf]))
+    point_height = np.maximum(padded_height[:-1], padded_height[1:])
+
+    return x_coordinates, segment_height, point_height
+
+
+def visible_raindrops(
+    skyline: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    rain_drops_x: np.ndarray,
+    rain_drops_y: np.ndarray,
+) -> np.ndarray:
+    """
+    Decide in a single vectorized pass which raindrops are not hidden beneath a rain drain.
+
+    Args:
+        skyline (Tuple[np.ndarray, np.ndarray, np.ndarray]): Skyline of the rain drains (see calculate_skyline()).
+        rain_drops_x (np.ndarray): NumPy array of raindrop x-coordinates.
+        rain_drops_y (np.ndarray): NumPy array of raindrop y-coordinates.
+
+    Returns:
+        np.ndarray: boolean array which is True for the raindrops above the skyline.
+    """
+    x_coordinates, segment_height, point_height = skyline
+
+    # Binning of the raindrops: x_coordinates[k] <= x < x_coordinates[k + 1] for the elementary segment k
+    k = np.searchsorted(x_coordinates, rain_drops_x, side="right") - 1
+    padded_segment_height = np.concatenate((segment_height, [-np.inf, -np.inf]))
+    skyline_height = padded_segment_height[k]
+
+    on_x_coordinate = k >= 0
+    on_x_coordinate[on_x_coordinate] = (
+        x_coordinates[k[on_x_coordinate]] == rain_drops_x[on_x_coordinate]
+    )
+    skyline_height[on_x_coordinate] = point_height[k[on_x_coordinate]]
+
+    return rain_drops_y > skyline_height
@@ -0,0 +1,417 @@
+import numpy as np
+from typing import Tuple, TYPE_CHECKING
+
+from core import (
+    route_drains,
+    cascade_drain_amount,
+    integrate_rainfall_profile,
+    validate_rainfall_profile,
+)
+from instrumentation import stage
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class DrainIndex:
+    """
+    Spatial index answering point and range queries on a solved collection of rain drains.
+
+    The index is built once from the routing of route_drains(). The rain drains are stored in a segment tree over
+    the elementary segments of the wall: every rain drain is attached to the O(logN) nodes decomposing its x-range,
+    so that the rain drains covering an x-coordinate are the ones attached to the ancestors of its leaf. The
+    (node, height) pairs are kept in a single sorted array of integer keys, so the highest or lowest rain drain of a
+    node below or above a given height is found with a binary search, for arrays of points at once. A query
+    therefore takes O(log²N) time independently of the wall width.
+
+    As in the resolution algorithm, a rain drain covers the x-coordinates left_x <= x < right_x. The methods taking
+    x-coordinates accept scalars or arrays and return arrays of the same shape, the rain drains being identified by
+    their location in the input lists (-1 for none).
+    """
+
+    def __init__(
+        self,
+        height: list,
+        left_x: list,
+        right_x: list,
+        water_amount_per_unit_of_length: float = 1.0,
+        rainfall_profile: Tuple[list, list] = None,
+        drain_amount: np.ndarray = None,
+    ):
+        """
+        Build the index.
+
+        Args:
+            height (list): List of heights.
+            left_x (list): List of left x-coordinates.
+            right_x (list): List of right x-coordinates.
+            water_amount_per_unit_of_length (float, optional): Amount of water per unit of length. Defaults to 1.0.
+            rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                            water/length replacing water_amount_per_unit_of_length.
+                                                            Defaults to None.
+            drain_amount (np.ndarray, optional): Drain amounts already solved by calculate_drain_amount(), in the
+                                                 order of the input lists. Defaults to None (solved here).
+        """
+        if len(height) == 0:
+            raise Exception("The index requires at least one rain drain.")
+        if rainfall_profile is not None:
+            validate_rainfall_profile(rainfall_profile)
+
+        self.water_amount_per_unit_of_length = water_amount_per_unit_of_length
+        self.rainfall_profile = rainfall_profile
+
+        with stage("DrainIndex.build", n_drains=len(height)):
+            order, x_coordinates, segment_owner, receiver = route_drains(height, left_x, right_x)
+            N = len(order)
+            n_segments = len(segment_owner)
+
+            # Rain drains in sorting order (descending height, ascending left_x)
+            self._order = order
+            self._x_coordinates = x_coordinates
+            self._segment_owner = segment_owner
+            self._height = np.asarray(height, dtype=np.float64)[order]
+            self._left_x = np.asarray(left_x)[order]
+            self._right_x = np.asarray(right_x)[order]
+
+            # Water falling on each elementary segment and drain amounts
+            segment_rain_fall = self._rain_fall(x_coordinates)
+            if drain_amount is None:
+                exposed = segment_owner >= 0
+                sorted_drain_amount = cascade_drain_amount(
+                    receiver,
+                    np.bincount(
+                        segment_owner[exposed], weights=segment_rain_fall[exposed], minlength=N
+                    ),
+                )
+            else:
+                sorted_drain_amount = np.asarray(drain_amount, dtype=np.float64)[order]
+            self.drain_amount = np.empty(N, dtype=np.float64)
+            self.drain_amount[order] = sorted_drain_amount
+
+            # Last rain drain of the cascade of each rain drain, by pointer jumping along the receiver graph
+            terminal = np.where(receiver >= 0, receiver, np.arange(N))
+            while True:
+                next_terminal = terminal[terminal]
+                if np.array_equal(next_terminal, terminal):
+                    break
+                terminal = next_terminal
+            self._receiver = receiver
+            self._terminal = terminal
+
+            self._heights = np.unique(self._height)
+            rank = np.searchsorted(self._heights, self._height)
+            left_rank = np.searchsorted(x_coordinates, self._left_x)
+            right_rank = np.searchsorted(x_coordinates, self._right_x)
+
+            # Keys of the rain drains at each height: block * stride + rank of the x-coordinate, where the blocks of
+            # rain drains sharing a height are numbered in sorting order. Within a block the left and right
+            # x-coordinates are both increasing, so the two key arrays are sorted.
+            self._x_stride = len(x_coordinates) + 1
+            block = len(self._heights) - 1 - rank
+            self._left_key = block * self._x_stride + left_rank
+            self._right_key = block * self._x_stride + right_rank
+
+            # Segment tree keys: node * (number of heights + 1) + rank of the height of the rain drain
+            self._n_ranks = len(self._heights) + 1
+            a = left_rank + n_segments
+            b = right_rank + n_segments
+            drains = np.arange(N)
+            keys = []
+            key_drains = []
+            while len(drains) > 0:
+                left_node = (a & 1) == 1
+                keys.append(a[left_node] * self._n_ranks + rank[left_node])
+                key_drains.append(drains[left_node])
+                a = a + left_node
+                right_node = (b & 1) == 1
+                b = b - right_node
+                keys.append(b[right_node] * self._n_ranks + rank[right_node])
+                key_drains.append(drains[right_node])
+                a >>= 1
+                b >>= 1
+                remaining = a < b
+                a, b, rank, drains = a[remaining], b[remaining], rank[remaining], drains[remaining]
+            keys = np.concatenate(keys).astype(np.int64)
+            key_order = np.argsort(keys, kind="stable")
+            self._keys = keys[key_order]
+            self._key_drains = np.concatenate(key_drains)[key_order]
+
+            # Water reaching the ground: cumulative rain over the uncovered segments and sorted discharges of the
+            # rain drains without receiver
+            uncovered_rain_fall = np.where(segment_owner >= 0, 0.0, segment_rain_fall)
+            self._ground_rain_fall = np.concatenate(([0.0], np.cumsum(uncovered_rain_fall)))
+            to_ground = np.flatnonzero(receiver < 0)
+            discharge_order = np.argsort(self._right_x[to_ground], kind="stable")
+            self._discharge_x = self._right_x[to_ground][discharge_order]
+            self._discharge = np.concatenate(
+                ([0.0], np.cumsum(sorted_drain_amount[to_ground][discharge_order]))
+            )
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: "pd.DataFrame",
+        water_amount_per_unit_of_length: float = 1.0,
+        rainfall_profile: Tuple[list, list] = None,
+    ) -> "DrainIndex":
+        """
+        Build the index from the DataFrame returned by calculate_drain_amount(), reusing its drain amounts.
+
+        Args:
+            df (pd.DataFrame): DataFrame containing height, left_x, right_x and drain_amount columns.
+            water_amount_per_unit_of_length (float, optional): Amount of water per unit of length used to solve the
+                                                               rain drains. Defaults to 1.0.
+            rainfall_profile (Tuple[list, list], optional): Rainfall profile used to solve the rain drains.
+                                                            Defaults to None.
+
+        Returns:
+            DrainIndex: index whose rain drain locations are the row positions of the DataFrame.
+        """
+        return cls(
+            df["height"].to_numpy(),
+            df["left_x"].to_numpy(),
+            df["right_x"].to_numpy(),
+            water_amount_per_unit_of_length,
+            rainfall_profile,
+            df["drain_amount"].to_numpy(),
+        )
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def _rain_fall(self, x_coordinates: np.ndarray) -> np.ndarray:
+        """
+        Water falling from the top edge of the wall between consecutive x-coordinates.
+        """
+        if self.rainfall_profile is None:
+            return self.water_amount_per_unit_of_length * np.diff(x_coordinates).astype(np.float64)
+        return np.diff(integrate_rainfall_profile(self.rainfall_profile, x_coordinates))
+
+    def _segment(self, x: np.ndarray) -> np.ndarray:
+        """
+        Elementary segment k such that x_coordinates[k] <= x < x_coordinates[k + 1] (-1 outside of the wall).
+        """
+        k = np.searchsorted(self._x_coordinates, x, side="right") - 1
+        return np.where(k < len(self._segment_owner), k, -1)
+
+    def _search(self, x: np.ndarray, rank: np.ndarray, above: bool) -> np.ndarray:
+        """
+        Sorted position of the rain drain covering x with the lowest height rank >= rank (above=True) or the
+        highest height rank <= rank (above=False), -1 if there is none.
+        """
+        k = self._segment(x)
+        best_key = np.full(len(x), -1, dtype=np.int64)
+        best_drain = np.full(len(x), -1, dtype=np.int64)
+        valid = (k >= 0) & (rank >= 0) & (rank < self._n_ranks - 1)
+        node = np.where(valid, k + len(self._segment_owner), 0)
+
+        while np.any(node >= 1):
+            target = node * self._n_ranks + rank
+            if above:
+                position = np.searchsorted(self._keys, target, side="left")
+                found = position < len(self._keys)
+            else:
+                position = np.searchsorted(self._keys, target, side="right") - 1
+                found = position >= 0
+            position = np.clip(position, 0, len(self._keys) - 1)
+            key = self._keys[position]
+            found &= (node >= 1) & (key // self._n_ranks == node)
+            if above:
+                better = found & ((best_drain < 0) | (key % self._n_ranks < best_key))
+            else:
+                better = found & ((best_drain < 0) | (key % self._n_ranks > best_key))
+            best_key[better] = key[better] % self._n_ranks
+            best_drain[better] = self._key_drains[position[better]]
+            node >>= 1
+
+        return best_drain
+
+    def _location(self, sorted_position: np.ndarray) -> np.ndarray:
+        """
+        Location in the input lists of rain drains given by their sorted position (-1 kept as -1).
+        """
+        return np.where(sorted_position >= 0, self._order[np.maximum(sorted_position, 0)], -1)
+
+    def drain_above(self, x, y) -> np.ndarray:
+        """
+        Find the rain drain directly above each point, i.e. the lowest rain drain covering x higher than y.
+
+        Args:
+            x (float or np.ndarray): x-coordinates of the points.
+            y (float or np.ndarray): heights of the points.
+
+        Returns:
+            np.ndarray: location of the rain drain above each point (-1 if there is none).
+        """
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        rank = np.searchsorted(self._heights, y.ravel(), side="right")
+        return self._location(self._search(x.ravel(), rank, above=True)).reshape(x.shape)
+
+    def drain_below(self, x, y=None) -> np.ndarray:
+        """
+        Find the rain drain on which water located at each point lands, i.e. the highest rain drain covering x
+        whose height is not greater than y.
+
+        Args:
+            x (float or np.ndarray): x-coordinates of the points.
+            y (float or np.ndarray, optional): heights of the points. Defaults to None (top edge of the wall).
+
+        Returns:
+            np.ndarray: location of the rain drain below each point (-1 if the water reaches the ground).
+        """
+        if y is None:
+            y = np.inf
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        rank = np.searchsorted(self._heights, y.ravel(), side="right") - 1
+        return self._location(self._search(x.ravel(), rank, above=False)).reshape(x.shape)
+
+    def water_destination(self, x, y=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Follow the water landing at each point down to the ground.
+
+        Args:
+            x (float or np.ndarray): x-coordinates of the points.
+            y (float or np.ndarray, optional): heights of the points. Defaults to None (top edge of the wall).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: location of the rain drain on which the water lands, location
+                                                       of the last rain drain of its cascade (both -1 if the water
+                                                       falls directly to the ground) and x-coordinate where the
+                                                       water reaches the ground.
+        """
+        if y is None:
+            y = np.inf
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        rank = np.searchsorted(self._heights, y.ravel(), side="right") - 1
+        landing = self._search(x.ravel(), rank, above=False)
+        terminal = np.where(landing >= 0, self._terminal[np.maximum(landing, 0)], -1)
+        ground_x = np.where(
+            terminal >= 0, self._right_x[np.maximum(terminal, 0)], x.ravel()
+        )
+
+        return (
+            self._location(landing).reshape(x.shape),
+            self._location(terminal).reshape(x.shape),
+            ground_x.reshape(x.shape),
+        )
+
+    def ground_rain_rate(self, x) -> np.ndarray:
+        """
+        Evaluate the amount of water per unit of length falling directly from the top edge of the wall to the
+        ground at each x-coordinate (zero beneath the rain drains and outside of the wall).
+
+        Args:
+            x (float or np.ndarray): x-coordinates.
+
+        Returns:
+            np.ndarray: float64 array with the rates.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        k = self._segment(x.ravel())
+        uncovered = (k >= 0) & (self._segment_owner[np.maximum(k, 0)] < 0)
+        if self.rainfall_profile is None:
+            rate = np.full(len(k), self.water_amount_per_unit_of_length, dtype=np.float64)
+        else:
+            breakpoints = np.asarray(self.rainfall_profile[0], dtype=np.float64)
+            rates = np.concatenate(([0.0], np.asarray(self.rainfall_profile[1], dtype=np.float64), [0.0]))
+            rate = rates[np.searchsorted(breakpoints, x.ravel(), side="right")]
+
+        return np.where(uncovered, rate, 0.0).reshape(x.shape)
+
+    def ground_discharge(self, x) -> np.ndarray:
+        """
+        Evaluate the water falling to the ground from the right ends of the rain drains at each x-coordinate.
+
+        Args:
+            x (float or np.ndarray): x-coordinates.
+
+        Returns:
+            np.ndarray: float64 array with the water falling to the ground exactly at each x-coordinate.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        start = np.searchsorted(self._discharge_x, x, side="left")
+        end = np.searchsorted(self._discharge_x, x, side="right")
+        return self._discharge[end] - self._discharge[start]
+
+    def ground_amount(self, x_start, x_end) -> np.ndarray:
+        """
+        Evaluate the total water reaching the ground on the intervals [x_start, x_end), directly from the top edge
+        of the wall and from the right ends of the rain drains.
+
+        Args:
+            x_start (float or np.ndarray): left ends of the intervals.
+            x_end (float or np.ndarray): right ends of the intervals.
+
+        Returns:
+            np.ndarray: float64 array with the water reaching the ground on each interval.
+        """
+        x_start, x_end = np.broadcast_arrays(
+            np.asarray(x_start, dtype=np.float64), np.asarray(x_end, dtype=np.float64)
+        )
+        return self._cumulative_ground_amount(x_end) - self._cumulative_ground_amount(x_start)
+
+    def _cumulative_ground_amount(self, x: np.ndarray) -> np.ndarray:
+        """
+        Water reaching the ground to the left of each x-coordinate.
+        """
+        x_coordinates = self._x_coordinates
+        clipped_x = np.clip(x, x_coordinates[0], x_coordinates[-1])
+        k = np.clip(
+            np.searchsorted(x_coordinates, clipped_x, side="right") - 1, 0, len(self._segment_owner) - 1
+        )
+        if self.rainfall_profile is None:
+            partial_rain_fall = self.water_amount_per_unit_of_length * (clipped_x - x_coordinates[k])
+        else:
+            partial_rain_fall = integrate_rainfall_profile(
+                self.rainfall_profile, clipped_x
+            ) - integrate_rainfall_profile(self.rainfall_profile, x_coordinates[k])
+        rain_fall = self._ground_rain_fall[k] + np.where(
+            self._segment_owner[k] >= 0, 0.0, partial_rain_fall
+        )
+
+        return rain_fall + self._discharge[np.searchsorted(self._discharge_x, x, side="left")]
+
+    def drains_at_height(self, y, x_start=-np.inf, x_end=np.inf):
+        """
+        Find the rain drains at given heights intersecting the intervals [x_start, x_end).
+
+        The rain drains at the same height are contiguous in sorting order and do not overlap, so both their left
+        and right x-coordinates are increasing. The keys built in the constructor combine the height block and the
+        rank of the x-coordinates, so the range of each query is located with two binary searches over all the
+        rain drains at once.
+
+        Args:
+            y (float or np.ndarray): Heights.
+            x_start (float or np.ndarray, optional): Left ends of the intervals. Defaults to -inf.
+            x_end (float or np.ndarray, optional): Right ends of the intervals. Defaults to inf.
+
+        Returns:
+            np.ndarray or Tuple[np.ndarray, np.ndarray]: for scalar arguments, the locations of the rain drains from
+                                                         left to right. Otherwise the concatenated locations of all
+                                                         the queries and their offsets: the rain drains of query q
+                                                         are at offsets[q]:offsets[q + 1].
+        """
+        scalar = np.ndim(y) == 0 and np.ndim(x_start) == 0 and np.ndim(x_end) == 0
+        y, x_start, x_end = np.broadcast_arrays(
+            np.asarray(y, dtype=np.float64),
+            np.asarray(x_start, dtype=np.float64),
+            np.asarray(x_end, dtype=np.float64),
+        )
+        y, x_start, x_end = y.ravel(), x_start.ravel(), x_end.ravel()
+
+        k = np.searchsorted(self._heights, y)
+        found = (k < len(self._heights)) & (self._heights[np.minimum(k, len(self._heights) - 1)] == y)
+        block = len(self._heights) - 1 - k
+        first_x = np.searchsorted(self._x_coordinates, x_start, side="right")
+        last_x = np.searchsorted(self._x_coordinates, x_end, side="left")
+        start = np.searchsorted(self._right_key, block * self._x_stride + first_x, side="left")
+        end = np.searchsorted(self._left_key, block * self._x_stride + last_x, side="left")
+        end = np.where(found, np.maximum(start, end), start)
+
+        if scalar:
+            return self._order[start[0] : end[0]]
+
+        lengths = end - start
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - start, lengths)
+        return self._order[positions], offsets
@@ -0,0 +1,598 @@
+import bisect
+import numpy as np
+from typing import Tuple
+
+from core import (
+    route_drains,
+    cascade_drain_amount,
+    integrate_rainfall_profile,
+    validate_rainfall_profile,
+)
+
+# Average number of distinct x-coordinates per leaf of the interval index when it is built
+COORDINATES_PER_LEAF = 4
+# Minimum number of rain drains with an end inside a leaf of the interval index above which the index is built again
+# around the current x-coordinates
+PARTIAL_LIMIT = 64
+
+# Sort keys placed before and after the sort key (-height, left_x, id) of every rain drain
+_FIRST = (-np.inf,)
+_LAST = (np.inf,)
+
+
+class DrainNetwork:
+    """
+    Stateful collection of rain drains whose drain amounts are updated incrementally.
+
+    Each rain drain is identified by the integer id returned when it is added (the rain drains given to the
+    constructor get the ids 0, ..., N - 1). An edit is applied as the removal of the rain drain followed by its
+    insertion at its new coordinates, and each of them only changes the water falling on the x-range of the rain
+    drain. The rain drains are kept in an interval index, a segment tree over ranges of x-coordinates whose nodes
+    hold the sorting keys (descending height, ascending left x) of the rain drains covering them, so the pieces of
+    that x-range exposed to the rain and the rain drains directly below it are found in O(log²N) time per piece.
+    Only those rain drains, the rain drains whose water falls through the x-range and the rain drains downstream of
+    them are updated, whatever the number of rain drains crossing the x-range.
+    """
+
+    def __init__(
+        self,
+        height: list,
+        left_x: list,
+        right_x: list,
+        water_amount_per_unit_of_length: float = 1.0,
+        rainfall_profile: Tuple[list, list] = None,
+    ):
+        """
+        Build the network and solve it from scratch.
+
+        Args:
+            height (list): List of heights.
+            left_x (list): List of left x-coordinates.
+            right_x (list): List of right x-coordinates.
+            water_amount_per_unit_of_length (float, optional): Amount of water per unit of length. Defaults to 1.0.
+            rainfall_profile (Tuple[list, list], optional): breakpoints and rates of a piecewise-constant amount of
+                                                            water/length replacing water_amount_per_unit_of_length.
+                                                            Defaults to None.
+        """
+        if rainfall_profile is not None:
+            validate_rainfall_profile(rainfall_profile)
+
+        self.water_amount_per_unit_of_length = water_amount_per_unit_of_length
+        self.rainfall_profile = rainfall_profile
+
+        N = len(height)
+        capacity = max(N, 16)
+        self._size = N
+        self._count = N
+        self._height = np.zeros(capacity, dtype=np.float64)
+        self._left_x = np.zeros(capacity, dtype=np.float64)
+        self._right_x = np.zeros(capacity, dtype=np.float64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._height[:N] = height
+        self._left_x[:N] = left_x
+        self._right_x[:N] = right_x
+        self._active[:N] = True
+
+        self._solve()
+        self._build_index()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add_drain(self, height: float, left_x: float, right_x: float) -> int:
+        """
+        Add a rain drain to the network.
+
+        Args:
+            height (float): Height of the rain drain.
+            left_x (float): Left x-coordinate of the rain drain.
+            right_x (float): Right x-coordinate of the rain drain.
+
+        Returns:
+            int: Id of the new rain drain.
+        """
+        drain_id = self._size
+        if drain_id == len(self._active):
+            for name in ("_height", "_left_x", "_right_x", "_active"):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate((array, np.zeros_like(array))))
+
+        self._check_drain(drain_id, height, left_x, right_x)
+
+        self._size += 1
+        self._key.append(None)
+        self._direct.append(0.0)
+        self._receiver.append(-1)
+        self._senders.append(set())
+        self._drain_amount.append(0.0)
+        self._edit(drain_id, (height, left_x, right_x))
+
+        return drain_id
+
+    def remove_drain(self, drain_id: int):
+        """
+        Remove a rain drain from the network.
+
+        Args:
+            drain_id (int): Id of the rain drain.
+        """
+        self._check_id(drain_id)
+        self._edit(drain_id, None)
+
+    def move_drain(self, drain_id: int, height: float, left_x: float, right_x: float):
+        """
+        Move a rain drain of the network to new coordinates.
+
+        Args:
+            drain_id (int): Id of the rain drain.
+            height (float): New height of the rain drain.
+            left_x (float): New left x-coordinate of the rain drain.
+            right_x (float): New right x-coordinate of the rain drain.
+        """
+        self._check_id(drain_id)
+        self._check_drain(drain_id, height, left_x, right_x)
+        self._edit(drain_id, (height, left_x, right_x))
+
+    def drain_amount(self, drain_id: int) -> float:
+        """
+        Return the water amount falling from the right end of a rain drain.
+
+        Args:
+            drain_id (int): Id of the rain drain.
+
+        Returns:
+            float: Drain amount of the rain drain.
+        """
+        self._check_id(drain_id)
+        return self._drain_amount[drain_id]
+
+    def receiver(self, drain_id: int) -> int:
+        """
+        Return the id of the rain drain receiving the water of a rain drain.
+
+        Args:
+            drain_id (int): Id of the rain drain.
+
+        Returns:
+            int: Id of the receiving rain drain, -1 if the water falls to the ground.
+        """
+        self._check_id(drain_id)
+        return self._receiver[drain_id]
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Export the rain drains currently in the network.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]: ids, heights, left x-coordinates,
+                                                                               right x-coordinates and drain
+                                                                               amounts of the rain drains.
+        """
+        ids = np.flatnonzero(self._active[: self._size])
+        drain_amount = np.array(self._drain_amount, dtype=np.float64)[ids]
+
+        return (
+            ids,
+            self._height[ids],
+            self._left_x[ids],
+            self._right_x[ids],
+            drain_amount,
+        )
+
+    def _solve(self):
+        # State of each rain drain:
+        #   key: sorting key (-height, left_x, id), None once removed
+        #   direct: water captured directly from the top edge of the wall
+        #   receiver: id of the rain drain receiving its water (-1 for the ground)
+        #   senders: ids of the rain drains whose water it receives
+        #   drain_amount: water falling from its right end
+        # The rain drains discharging to the ground are kept sorted by right x-coordinate in ground, and the rain
+        # drains at each height sorted by left x-coordinate in rows.
+        n = self._size
+        self._key = [None] * n
+        self._direct = [0.0] * n
+        self._receiver = [-1] * n
+        self._senders = [set() for _ in range(n)]
+        self._drain_amount = [0.0] * n
+        self._ground = []
+        self._rows = {}
+
+        ids = np.flatnonzero(self._active[:n])
+        if len(ids) == 0:
+            return
+
+        order, x_coordinates, segment_owner, receiver = route_drains(
+            self._height[ids], self._left_x[ids], self._right_x[ids]
+        )
+        exposed = segment_owner >= 0
+        direct = np.bincount(
+            segment_owner[exposed],
+            weights=self._segment_rain_fall(x_coordinates)[exposed],
+            minlength=len(ids),
+        )
+        drain_amount = cascade_drain_amount(receiver, direct)
+
+        sorted_ids = ids[order]
+        heights = self._height[sorted_ids].tolist()
+        lefts = self._left_x[sorted_ids].tolist()
+        rights = self._right_x[sorted_ids].tolist()
+        sorted_ids = sorted_ids.tolist()
+        for k, i in enumerate(sorted_ids):
+            self._key[i] = (-heights[k], lefts[k], i)
+            self._direct[i] = float(direct[k])
+            self._drain_amount[i] = float(drain_amount[k])
+            if receiver[k] >= 0:
+                self._receiver[i] = sorted_ids[receiver[k]]
+                self._senders[sorted_ids[receiver[k]]].add(i)
+            else:
+                self._ground.append((rights[k], i))
+            self._rows.setdefault(heights[k], []).append((lefts[k], i))
+        self._ground.sort()
+
+    def _build_index(self):
+        # Interval index: segment tree whose leaves are ranges of x-coordinates bounded by quantiles of the
+        # x-coordinates of the rain drains. The first and last leaves extend to infinity, so a new x-coordinate
+        # never requires re-indexing the rain drains. Each node holds the sorted keys of:
+        #   attached: the rain drains covering its range, but not the range of its parent
+        #   below: the rain drains attached to its descendants or with an end inside one of its leaves (for a leaf,
+        #          the rain drains with an end inside it)
+        ids = np.flatnonzero(self._active[: self._size])
+        N = len(ids)
+        left_x = self._left_x[ids]
+        right_x = self._right_x[ids]
+
+        coordinates = np.unique(np.concatenate((left_x, right_x)))
+        n_leaves = max(len(coordinates) // COORDINATES_PER_LEAF, 1)
+        size = 1 << (n_leaves - 1).bit_length()
+        bounds = np.concatenate(
+            ([-np.inf], coordinates[(np.arange(1, size) * len(coordinates)) // size], [np.inf])
+        )
+        self._tree_size = size
+        self._bounds = bounds.tolist()
+
+        order = np.lexsort((left_x, -self._height[ids]))
+        rank = np.empty(N, dtype=np.int64)
+        rank[order] = np.arange(N)
+        sorted_keys = [self._key[i] for i in ids[order].tolist()]
+
+        # Leaves containing the left end and the last covered point of each rain drain, and range [a, b) of the
+        # leaves it covers entirely
+        first_leaf = np.searchsorted(bounds, left_x, side="right") - 1
+        end_leaf = np.searchsorted(bounds, right_x, side="right") - 1
+        last_leaf = end_leaf - (bounds[end_leaf] == right_x)
+        a = first_leaf + (bounds[first_leaf] < left_x)
+        b = end_leaf
+
+        nodes = [np.zeros(0, dtype=np.int64)]
+        node_rank = [np.zeros(0, dtype=np.int64)]
+        start = a + size
+        end = b + size
+        drain_rank = rank
+        while len(start) > 0:
+            remaining = start < end
+            start, end, drain_rank = start[remaining], end[remaining], drain_rank[remaining]
+            left_node = (start & 1) == 1
+            nodes.append(start[left_node])
+            node_rank.append(drain_rank[left_node])
+            start = start + left_node
+            right_node = (end & 1) == 1
+            end = end - right_node
+            nodes.append(end[right_node])
+            node_rank.append(drain_rank[right_node])
+            start >>= 1
+            end >>= 1
+        self._attached = self._grouped(np.concatenate(nodes), np.concatenate(node_rank), sorted_keys)
+
+        # The nodes holding a rain drain in "below" are the nodes whose range intersects its x-range without being
+        # covered by it: they lie on the paths from its first and last leaves to the root.
+        nodes = []
+        node_rank = []
+        for level in range(size.bit_length()):
+            first_node = (first_leaf + size) >> level
+            last_node = (last_leaf + size) >> level
+            for node, partial in (
+                (first_node, np.ones(N, dtype=bool)),
+                (last_node, last_node != first_node),
+            ):
+                partial &= ((node << level) - size < a) | (((node + 1) << level) - size > b)
+                nodes.append(node[partial])
+                node_rank.append(rank[partial])
+        self._below = self._grouped(np.concatenate(nodes), np.concatenate(node_rank), sorted_keys)
+
+        leaf_sizes = [len(keys) for keys in self._below[size:]]
+        self._partial_limit = max(PARTIAL_LIMIT, 2 * max(leaf_sizes))
+
+    def _grouped(self, nodes: np.ndarray, rank: np.ndarray, sorted_keys: list) -> list:
+        # Lists of the keys of the rain drains of each node of the interval index, in sorting order
+        n_keys = max(len(sorted_keys), 1)
+        pairs = np.sort(nodes.astype(np.int64) * n_keys + rank)
+        offsets = np.searchsorted(pairs // n_keys, np.arange(2 * self._tree_size + 1)).tolist()
+        keys = np.fromiter(sorted_keys, dtype=object, count=len(sorted_keys))[pairs % n_keys]
+
+        return [keys[offsets[node] : offsets[node + 1]].tolist() for node in range(2 * self._tree_size)]
+
+    def _check_id(self, drain_id: int):
+        if (drain_id < 0) or (drain_id >= self._size) or (not self._active[drain_id]):
+            raise Exception(f"There is no rain drain with id {drain_id} in the network.")
+
+    def _check_drain(self, drain_id: int, height: float, left_x: float, right_x: float):
+        if right_x <= left_x:
+            raise Exception(
+                "The right x-coordinate of the raind drain must be greater than its left x-coordinate."
+            )
+
+        # The rain drains at a height are disjoint, so only the neighbours of the new left x-coordinate (and the
+        # next one, when a neighbour is the edited rain drain itself) can overlap it.
+        row = self._rows.get(height, [])
+        k = bisect.bisect_left(row, (left_x,))
+        for other_left_x, other_id in row[max(k - 1, 0) : k + 2]:
+            if (
+                (other_id != drain_id)
+                and (other_left_x < right_x)
+                and (self._right_x[other_id] > left_x)
+            ):
+                raise Exception(
+                    f"The rain drain overlaps the rain drain with id {other_id}."
+                )
+
+    def _segment_rain_fall(self, x_coordinates: np.ndarray) -> np.ndarray:
+        if self.rainfall_profile is None:
+            return self.water_amount_per_unit_of_length * np.diff(x_coordinates)
+        return np.diff(integrate_rainfall_profile(self.rainfall_profile, x_coordinates))
+
+    def _rain_fall(self, a: float, b: float) -> float:
+        if self.rainfall_profile is None:
+            return self.water_amount_per_unit_of_length * (b - a)
+        start, end = integrate_rainfall_profile(self.rainfall_profile, [a, b])
+        return float(end - start)
+
+    def _index_nodes(self, drain_id: int) -> Tuple[list, list]:
+        # Nodes of the interval index covered by the rain drain, and leaves with an end of the rain drain inside them
+        bounds = self._bounds
+        size = self._tree_size
+        left_x = self._left_x[drain_id]
+        right_x = self._right_x[drain_id]
+
+        a = bisect.bisect_right(bounds, left_x) - 1
+        b = bisect.bisect_right(bounds, right_x) - 1
+        partial = []
+        if bounds[a] < left_x:
+            partial.append(a + size)
+            a += 1
+        if (bounds[b] < right_x) and (b + 1 != a):
+            partial.append(b + size)
+
+        covered = []
+        a += size
+        b += size
+        while a < b:
+            if a & 1:
+                covered.append(a)
+                a += 1
+            if b & 1:
+                b -= 1
+                covered.append(b)
+            a >>= 1
+            b >>= 1
+
+        return covered, partial
+
+    def _update_index(self, drain_id: int, insert: bool):
+        key = self._key[drain_id]
+        covered, partial = self._index_nodes(drain_id)
+
+        ancestors = set()
+        for node in covered + partial:
+            node >>= 1
+            while node and (node not in ancestors):
+                ancestors.add(node)
+                node >>= 1
+
+        node_keys = [self._attached[node] for node in covered]
+        node_keys += [self._below[node] for node in partial]
+        node_keys += [self._below[node] for node in ancestors]
+        for keys in node_keys:
+            if insert:
+                bisect.insort(keys, key)
+            else:
+                del keys[bisect.bisect_left(keys, key)]
+
+        if insert and any(len(self._below[leaf]) > self._partial_limit for leaf in partial):
+            self._build_index()
+
+    def _envelope(self, a: float, b: float, key: tuple) -> list:
+        # Pieces [start, end, first] of the x-range [a, b), from left to right, where first is the key of the first
+        # rain drain after the given key, in sorting order, covering the piece (_LAST for none). A subtree is only
+        # visited when it holds a rain drain between the key and the first rain drain of its ancestors.
+        bounds = self._bounds
+        size = self._tree_size
+        attached = self._attached
+        below = self._below
+        pieces = []
+
+        def add(start, end, first):
+            if start >= end:
+                return
+            if pieces and (pieces[-1][2] == first):
+                pieces[-1][1] = end
+            else:
+                pieces.append([start, end, first])
+
+        def visit(node, lo, hi, first):
+            keys = attached[node]
+            k = bisect.bisect_right(keys, key)
+            if (k < len(keys)) and (keys[k] < first):
+                first = keys[k]
+
+            start = max(a, bounds[lo])
+            end = min(b, bounds[hi])
+            keys = below[node]
+            k = bisect.bisect_right(keys, key)
+            if (k == len(keys)) or (keys[k] >= first):
+                add(start, end, first)
+            elif node >= size:
+                # Rain drains with an end inside the leaf, compared on the elementary pieces of the leaf
+                candidates = [
+                    k
+                    for k in keys
+                    if (key < k < first) and (k[1] < end) and (self._right_x[k[2]] > start)
+                ]
+                right_x = [self._right_x[k[2]] for k in candidates]
+                x = {start, end}
+                x.update(k[1] for k in candidates if start < k[1] < end)
+                x.update(r for r in right_x if start < r < end)
+                x = sorted(x)
+                for x_start, x_end in zip(x[:-1], x[1:]):
+                    piece_first = first
+                    for k, r in zip(candidates, right_x):
+                        if (k[1] <= x_start < r) and (k < piece_first):
+                            piece_first = k
+                    add(x_start, x_end, piece_first)
+            else:
+                mid = (lo + hi) >> 1
+                if a < bounds[mid]:
+                    visit(2 * node, lo, mid, first)
+                if b > bounds[mid]:
+                    visit(2 * node + 1, mid, hi, first)
+
+        visit(1, 0, size, _LAST)
+
+        return pieces
+
+    def _drain_below(self, x: float, key: tuple) -> int:
+        # First rain drain after the given key, in sorting order, covering the x-coordinate (-1 for none)
+        node = bisect.bisect_right(self._bounds, x) - 1 + self._tree_size
+
+        first = _LAST
+        for k in self._below[node]:
+            if (key < k < first) and (k[1] <= x < self._right_x[k[2]]):
+                first = k
+        while node:
+            keys = self._attached[node]
+            k = bisect.bisect_right(keys, key)
+            if (k < len(keys)) and (keys[k] < first):
+                first = keys[k]
+            node >>= 1
+
+        return first[2] if first != _LAST else -1
+
+    def _attach(self, drain_id: int, receiver: int, dirty: set):
+        self._receiver[drain_id] = receiver
+        if receiver >= 0:
+            self._senders[receiver].add(drain_id)
+            dirty.add(receiver)
+        else:
+            bisect.insort(self._ground, (float(self._right_x[drain_id]), drain_id))
+
+    def _detach(self, drain_id: int, dirty: set):
+        receiver = self._receiver[drain_id]
+        if receiver >= 0:
+            self._senders[receiver].discard(drain_id)
+            dirty.add(receiver)
+        else:
+            del self._ground[
+                bisect.bisect_left(self._ground, (float(self._right_x[drain_id]), drain_id))
+            ]
+
+    def _insert(self, drain_id: int, dirty: set):
+        height = float(self._height[drain_id])
+        left_x = float(self._left_x[drain_id])
+        right_x = float(self._right_x[drain_id])
+        key = (-height, left_x, drain_id)
+        self._key[drain_id] = key
+        self._active[drain_id] = True
+        self._count += 1
+
+        # The rain drain captures the rain of the pieces of its x-range where it is above the exposed rain drain
+        direct = 0.0
+        for start, end, top in self._envelope(left_x, right_x, _FIRST):
+            if top > key:
+                rain_fall = self._rain_fall(start, end)
+                direct += rain_fall
+                if top != _LAST:
+                    self._direct[top[2]] -= rain_fall
+                    dirty.add(top[2])
+        self._direct[drain_id] = direct
+
+        # It receives the water of the rain drains above it falling through its x-range onto the rain drains (or
+        # the ground) directly below it
+        captured = []
+        for start, end, first in self._envelope(left_x, right_x, key):
+            if first == _LAST:
+                senders = self._ground[
+                    bisect.bisect_left(self._ground, (start,)) : bisect.bisect_left(self._ground, (end,))
+                ]
+                senders = [i for _, i in senders]
+            else:
+                senders = [i for i in self._senders[first[2]] if start <= self._right_x[i] < end]
+            captured += [i for i in senders if self._key[i] < key]
+        for i in captured:
+            self._detach(i, dirty)
+            self._attach(i, drain_id, dirty)
+
+        self._attach(drain_id, self._drain_below(right_x, key), dirty)
+        bisect.insort(self._rows.setdefault(height, []), (left_x, drain_id))
+        self._update_index(drain_id, insert=True)
+        dirty.add(drain_id)
+
+    def _remove(self, drain_id: int, dirty: set):
+        key = self._key[drain_id]
+        height, left_x = -key[0], key[1]
+        right_x = float(self._right_x[drain_id])
+
+        # The rain of the pieces where the rain drain is exposed goes to the rain drains directly below it
+        for start, end, top in self._envelope(left_x, right_x, _FIRST):
+            if top == key:
+                for piece_start, piece_end, first in self._envelope(start, end, key):
+                    if first != _LAST:
+                        self._direct[first[2]] += self._rain_fall(piece_start, piece_end)
+                        dirty.add(first[2])
+
+        self._update_index(drain_id, insert=False)
+        row = self._rows[height]
+        del row[bisect.bisect_left(row, (left_x, drain_id))]
+        if not row:
+            del self._rows[height]
+
+        # Its senders are routed to the next rain drain below their right end
+        self._detach(drain_id, dirty)
+        for i in list(self._senders[drain_id]):
+            self._detach(i, dirty)
+            self._attach(i, self._drain_below(self._right_x[i], self._key[i]), dirty)
+
+        self._key[drain_id] = None
+        self._direct[drain_id] = 0.0
+        self._receiver[drain_id] = -1
+        self._drain_amount[drain_id] = 0.0
+        self._senders[drain_id] = set()
+        self._active[drain_id] = False
+        self._count -= 1
+
+    def _edit(self, drain_id: int, coordinates: Tuple[float, float, float]):
+        dirty = set()
+        if self._active[drain_id]:
+            self._remove(drain_id, dirty)
+
+        if coordinates is not None:
+            (
+                self._height[drain_id],
+                self._left_x[drain_id],
+                self._right_x[drain_id],
+            ) = coordinates
+            self._insert(drain_id, dirty)
+
+        self._propagate(dirty)
+
+    def _propagate(self, dirty: set):
+        # The drain amounts can only change on the dirty rain drains and downstream of them. They are
+        # recomputed in sorting order, so that the senders of each rain drain are always up to date.
+        downstream = set()
+        for i in dirty:
+            while (i >= 0) and (i not in downstream) and self._active[i]:
+                downstream.add(i)
+                i = self._receiver[i]
+
+        for i in sorted(downstream, key=self._key.__getitem__):
+            self._drain_amount[i] = self._direct[i] + sum(
+                self._drain_amount[s] for s in self._senders[i]
+            )
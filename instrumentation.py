@@ -0,0 +1,198 @@
+import json
+import time
+import threading
+from contextvars import ContextVar
+from typing import Callable
+
+# Recorders active in the current thread or asyncio task. The stages of the pipeline only build a record when this
+# tuple is not empty, so that the instrumentation costs a single lookup when it is disabled.
+_active_recorders = ContextVar("active_recorders", default=())
+
+
+class _Stage:
+    """
+    Timing of a pipeline stage, delivered to the active recorders when the stage exits.
+    """
+
+    __slots__ = ("name", "metrics", "recorders", "start")
+
+    def __init__(self, name: str, recorders: tuple, metrics: dict):
+        self.name = name
+        self.metrics = metrics
+        self.recorders = recorders
+        self.start = None
+
+    def set(self, **metrics):
+        """
+        Set metrics of the stage (number of rain drains, wall width, array sizes...).
+        """
+        self.metrics.update(metrics)
+
+    def peak(self, name: str, value: int):
+        """
+        Keep the maximum of the values reported for a metric of the stage.
+        """
+        if value > self.metrics.get(name, value - 1):
+            self.metrics[name] = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = {
+            "stage": self.name,
+            "wall_time_s": time.perf_counter() - self.start,
+            "failed": exc_type is not None,
+        }
+        record.update(self.metrics)
+        for recorder in self.recorders:
+            recorder.add_record(record)
+        return False
+
+
+class _NullStage:
+    """
+    Stage returned when no recorder is active: all its methods do nothing.
+    """
+
+    __slots__ = ()
+
+    def set(self, **metrics):
+        pass
+
+    def peak(self, name: str, value: int):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str, **metrics):
+    """
+    Context manager timing a stage of the pipeline.
+
+    The metrics given here or with the set() and peak() methods of the returned object are added to the record of
+    the stage. When no StageRecorder is active a shared object doing nothing is returned.
+
+    Args:
+        name (str): Name of the stage, e.g. "calculate_drain_amount.loop".
+        **metrics: Metrics of the stage known when it starts.
+
+    Returns:
+        Context manager whose __enter__ returns an object with set() and peak() methods.
+    """
+    recorders = _active_recorders.get()
+    if not recorders:
+        return _NULL_STAGE
+    return _Stage(name, recorders, metrics)
+
+
+def is_enabled() -> bool:
+    """
+    Return True if at least one StageRecorder is active, so that metrics costly to compute can be skipped.
+    """
+    return len(_active_recorders.get()) > 0
+
+
+class StageRecorder:
+    """
+    Collector of the records of the instrumented pipeline stages.
+
+    Used as a context manager, the recorder receives the records of all the stages executed in the with block by
+    the current thread or asyncio task (nested recorders all receive them). Each record is a dict with the stage
+    name, its wall time in seconds, whether it raised, and its metrics, e.g. n_drains, wall_width,
+    wall_rain_fall_bytes or drop_array_bytes. The records are passed to the callback as soon as a stage completes
+    and/or kept in memory for records(), summary() and write_records().
+    """
+
+    def __init__(self, callback: Callable[[dict], None] = None, keep_records: bool = True):
+        """
+        Args:
+            callback (Callable[[dict], None], optional): Function called with each record, e.g. to forward it to a
+                                                         metrics collector. Defaults to None.
+            keep_records (bool, optional): If False, the records are only passed to the callback. Defaults to True.
+        """
+        self.callback = callback
+        self.keep_records = keep_records
+        self._records = []
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._tokens.append(_active_recorders.set(_active_recorders.get() + (self,)))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_recorders.reset(self._tokens.pop())
+        return False
+
+    def add_record(self, record: dict):
+        """
+        Add the record of a completed stage.
+
+        Args:
+            record (dict): Record of the stage.
+        """
+        if self.keep_records:
+            with self._lock:
+                self._records.append(record)
+        if self.callback is not None:
+            self.callback(dict(record))
+
+    def records(self) -> list:
+        """
+        Return copies of the kept records, in completion order.
+
+        Returns:
+            list: one dict per executed stage.
+        """
+        with self._lock:
+            return [dict(record) for record in self._records]
+
+    def clear(self):
+        """
+        Discard the kept records.
+        """
+        with self._lock:
+            self._records = []
+
+    def summary(self) -> dict:
+        """
+        Aggregate the kept records by stage.
+
+        Returns:
+            dict: for each stage name, the number of calls, the total and maximum wall times and the maximum of
+                  each numeric metric.
+        """
+        summary = {}
+        for record in self.records():
+            entry = summary.setdefault(
+                record["stage"], {"calls": 0, "total_time_s": 0.0, "max_time_s": 0.0}
+            )
+            entry["calls"] += 1
+            entry["total_time_s"] += record["wall_time_s"]
+            entry["max_time_s"] = max(entry["max_time_s"], record["wall_time_s"])
+            for name, value in record.items():
+                if name in ("stage", "wall_time_s", "failed") or type(value) not in (int, float):
+                    continue
+                entry[name] = max(entry.get(name, value), value)
+
+        return summary
+
+    def write_records(self, path: str):
+        """
+        Write the kept records to a JSON Lines file, one record per line.
+
+        Args:
+            path (str): Path of the output file.
+        """
+        with open(path, "w") as file:
+            for record in self.records():
+                file.write(json.dumps(record) + "\n")
@@ -0,0 +1,296 @@
+import numpy as np
+from typing import Tuple
+
+from core import (
+    validate_input,
+    check_coordinate_types,
+    sorting_order,
+    calculate_drain_amount,
+)
+
+# File layout: a 64-byte header followed by the height, left_x, right_x and order columns, each one starting at a
+# multiple of COLUMN_ALIGNMENT bytes so that the columns can be viewed in place from a memory map.
+MAGIC = b"RDLAYOUT"
+VERSION = 1
+COLUMN_ALIGNMENT = 64
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("flags", "<u4"),
+        ("n_drains", "<u8"),
+        ("dtype", "S8"),
+        ("bounds", "<f8", (4,)),
+    ]
+)
+COORDINATE_DTYPES = ("<i4", "<i8", "<f8")
+ORDER_DTYPE = np.dtype("<i8")
+
+# Header flags
+SORTED_FLAG = 1
+
+
+class PackedLayout:
+    """
+    Compact columnar representation of a rain drain layout.
+
+    The heights, left x-coordinates and right x-coordinates are stored as packed int32, int64 or float64 columns
+    sorted by descending height and ascending left x-coordinate, together with the input location of each rain
+    drain (order column) and the bounds of the layout (minimum and maximum height, minimum left x-coordinate and
+    maximum right x-coordinate). Since the columns are already sorted, validate() and solve() run directly on them
+    with presorted=True: the rain drains are neither converted to lists, nor copied into a DataFrame, nor sorted
+    again. A layout saved with save() is loaded with load() through a memory map, the columns being views on the
+    mapped file.
+    """
+
+    def __init__(
+        self,
+        height: np.ndarray,
+        left_x: np.ndarray,
+        right_x: np.ndarray,
+        order: np.ndarray,
+        bounds: np.ndarray = None,
+    ):
+        """
+        Wrap columns which are already sorted. Use from_arrays() to pack unsorted rain drains.
+
+        Args:
+            height (np.ndarray): Sorted heights.
+            left_x (np.ndarray): Sorted left x-coordinates.
+            right_x (np.ndarray): Sorted right x-coordinates.
+            order (np.ndarray): Input location of each sorted rain drain.
+            bounds (np.ndarray, optional): Minimum height, maximum height, minimum left x-coordinate and maximum right
+                                           x-coordinate. Defaults to None (computed from the columns).
+        """
+        if not (len(height) == len(left_x) == len(right_x) == len(order)):
+            raise Exception("The columns of the packed layout have different lengths.")
+        if len(height) == 0:
+            raise Exception("The packed layout requires at least one rain drain.")
+
+        self.height = height
+        self.left_x = left_x
+        self.right_x = right_x
+        self.order = order
+        if bounds is None:
+            # The heights are sorted in descending order
+            bounds = np.array([height[-1], height[0], left_x.min(), right_x.max()], dtype=np.float64)
+        self.bounds = bounds
+
+    @classmethod
+    def from_arrays(cls, height: list, left_x: list, right_x: list, dtype: str = None) -> "PackedLayout":
+        """
+        Sort and pack the rain drains of a layout.
+
+        Args:
+            height (list): List of heights.
+            left_x (list): List of left x-coordinates.
+            right_x (list): List of right x-coordinates.
+            dtype (str, optional): dtype of the columns, "int32", "int64" or "float64". Defaults to None (int32 if
+                                   the coordinates are integers whose differences fit in int32, int64 for other
+                                   integers and float64 otherwise).
+
+        Returns:
+            PackedLayout: packed layout.
+        """
+        for name, values in (("height", height), ("left_x", left_x), ("right_x", right_x)):
+            check_coordinate_types(name, values, integer_coordinates=False)
+        if not (len(height) == len(left_x) == len(right_x)):
+            raise Exception("The height, left_x and right_x input lists have different lengths.")
+
+        height = np.asarray(height)
+        left_x = np.asarray(left_x)
+        right_x = np.asarray(right_x)
+
+        if dtype is None:
+            if all(values.dtype.kind in "iu" for values in (height, left_x, right_x)):
+                low = min(height.min(), left_x.min())
+                high = max(height.max(), right_x.max())
+                dtype = "int32" if (-(2**30) <= low) and (high < 2**30) else "int64"
+            else:
+                dtype = "float64"
+        dtype = np.dtype(dtype).newbyteorder("<")
+        if dtype.str not in COORDINATE_DTYPES:
+            raise Exception('The dtype of a packed layout must be "int32", "int64" or "float64".')
+
+        order = sorting_order(height, left_x)
+        return cls(
+            height[order].astype(dtype),
+            left_x[order].astype(dtype),
+            right_x[order].astype(dtype),
+            order.astype(ORDER_DTYPE),
+        )
+
+    @classmethod
+    def from_buffer(cls, buffer) -> "PackedLayout":
+        """
+        View a packed layout stored in a buffer (bytes, memory map or shared memory) without copying it.
+
+        Args:
+            buffer: Object supporting the buffer protocol, holding a header and the columns written by save().
+
+        Returns:
+            PackedLayout: packed layout whose columns are views on the buffer.
+        """
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        if len(data) < HEADER_DTYPE.itemsize:
+            raise Exception("The buffer is too short to contain a packed layout header.")
+        header = data[: HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header["magic"] != MAGIC:
+            raise Exception("The buffer does not contain a packed layout.")
+        if header["version"] != VERSION:
+            raise Exception(f"Unsupported packed layout version {header['version']}.")
+        if not header["flags"] & SORTED_FLAG:
+            raise Exception("The columns of the packed layout are not sorted.")
+
+        dtype = np.dtype(header["dtype"].decode())
+        N = int(header["n_drains"])
+        offsets = column_offsets(N, dtype)
+        if len(data) < offsets[-1]:
+            raise Exception(f"The buffer is too short to contain {N} packed rain drains.")
+        columns = [
+            data[start : start + N * column_dtype.itemsize].view(column_dtype)
+            for start, column_dtype in zip(offsets[:-1], (dtype, dtype, dtype, ORDER_DTYPE))
+        ]
+
+        return cls(*columns, bounds=header["bounds"].copy())
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "PackedLayout":
+        """
+        Load a packed layout file.
+
+        Args:
+            path (str): Path of the file written by save().
+            mmap (bool, optional): If True the file is memory-mapped, so that only the accessed pages are read.
+                                   Defaults to True.
+
+        Returns:
+            PackedLayout: packed layout.
+        """
+        if mmap:
+            return cls.from_buffer(np.memmap(path, dtype=np.uint8, mode="r"))
+        with open(path, "rb") as file:
+            return cls.from_buffer(file.read())
+
+    def save(self, path: str):
+        """
+        Write the packed layout to a file.
+
+        Args:
+            path (str): Path of the output file.
+        """
+        dtype = self.height.dtype.newbyteorder("<")
+        N = len(self)
+        offsets = column_offsets(N, dtype)
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["flags"] = SORTED_FLAG
+        header["n_drains"] = N
+        header["dtype"] = dtype.str.encode()
+        header["bounds"] = self.bounds
+
+        data = np.zeros(offsets[-1], dtype=np.uint8)
+        data[: HEADER_DTYPE.itemsize] = header.view(np.uint8)
+        for start, column, column_dtype in zip(
+            offsets[:-1],
+            (self.height, self.left_x, self.right_x, self.order),
+            (dtype, dtype, dtype, ORDER_DTYPE),
+        ):
+            data[start : start + N * column_dtype.itemsize] = np.ascontiguousarray(
+                column, dtype=column_dtype
+            ).view(np.uint8)
+        data.tofile(path)
+
+    def __len__(self) -> int:
+        return len(self.height)
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return the sorted height, left_x and right_x columns.
+        """
+        return self.height, self.left_x, self.right_x
+
+    def validate(
+        self,
+        water_amount_per_unit_of_length: float,
+        rainfall_profile: Tuple[list, list] = None,
+    ):
+        """
+        Validate the packed layout with validate_input() without sorting it: the sorting order of the columns is
+        only checked in O(N). The locations reported in the error messages are the sorted positions of the rain
+        drains (see the order column).
+
+        Args:
+            water_amount_per_unit_of_length (float): Amount of water per unit of length.
+            rainfall_profile (Tuple[list, list], optional): Rainfall profile. Defaults to None.
+        """
+        validate_input(
+            self.height,
+            self.left_x,
+            self.right_x,
+            len(self),
+            water_amount_per_unit_of_length,
+            rainfall_profile,
+            integer_coordinates=(self.height.dtype.kind in "iu"),
+            presorted=True,
+        )
+
+    def solve(
+        self,
+        water_amount_per_unit_of_length: float,
+        method: str = "sweep",
+        input_order: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        """
+        Calculate the drain amounts of the packed layout with calculate_drain_amount() without sorting it.
+
+        Args:
+            water_amount_per_unit_of_length (float): Amount of water per unit of length.
+            method (str, optional): Resolution algorithm (see calculate_drain_amount()). Defaults to "sweep".
+            input_order (bool, optional): If True the drain amounts are returned in the order of the lists given to
+                                          from_arrays() instead of the sorted order of the columns.
+                                          Defaults to False.
+            **kwargs: Other arguments of calculate_drain_amount() (rainfall_profile, capacity, precision).
+
+        Returns:
+            np.ndarray: float64 array with the drain amounts.
+        """
+        drain_amount = calculate_drain_amount(
+            len(self),
+            self.height,
+            self.left_x,
+            self.right_x,
+            water_amount_per_unit_of_length,
+            method=method,
+            as_frame=False,
+            presorted=True,
+            **kwargs,
+        )
+        if not input_order:
+            return drain_amount
+
+        result = np.empty_like(drain_amount)
+        result[self.order] = drain_amount
+        return result
+
+
+def column_offsets(N: int, dtype: np.dtype) -> list:
+    """
+    Compute the byte offsets of the columns of a packed layout of N rain drains.
+
+    Args:
+        N (int): Number of rain drains.
+        dtype (np.dtype): dtype of the coordinate columns.
+
+    Returns:
+        list: start offsets of the height, left_x, right_x and order columns followed by the total size.
+    """
+    offsets = [HEADER_DTYPE.itemsize]
+    for itemsize in (dtype.itemsize, dtype.itemsize, dtype.itemsize, ORDER_DTYPE.itemsize):
+        end = offsets[-1] + N * itemsize
+        offsets.append(-(-end // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT)
+
+    return offsets
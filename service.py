@@ -0,0 +1,405 @@
+import asyncio
+import numpy as np
+from typing import Tuple, Iterable
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from core import validate_input, validate_parameters, check_coordinate_types, calculate_drain_amount
+from batch import pack_walls
+from cache import layout_fingerprint
+
+
+class ServiceOverloaded(Exception):
+    """
+    Raised by DrainService.solve() when its queue is full and the request is not allowed to wait.
+    """
+
+
+def solve_side_by_side(
+    height: np.ndarray,
+    left_x: np.ndarray,
+    right_x: np.ndarray,
+    offsets: np.ndarray,
+    water_amounts: list,
+    method: str = "sweep",
+    validate: bool = True,
+) -> Tuple[np.ndarray, list]:
+    """
+    Validate and solve several walls packed by pack_walls() with a single call to calculate_drain_amount().
+
+    The walls are shifted along the x-axis so that they are placed side by side with a gap of one unit of length:
+    since no water can flow from one wall to the next, the drain amounts of the combined wall are the drain amounts
+    of the individual walls. The walls are solved for a unit amount of water/length and scaled by the water amount
+    of each wall, the drain amounts being linear in it.
+
+    Args:
+        height (np.ndarray): Concatenated heights.
+        left_x (np.ndarray): Concatenated left x-coordinates.
+        right_x (np.ndarray): Concatenated right x-coordinates.
+        offsets (np.ndarray): Offsets of the walls.
+        water_amounts (list): Amount of water per unit of length of each wall.
+        method (str, optional): Resolution algorithm (see calculate_drain_amount()). Defaults to "sweep".
+        validate (bool, optional): If True, each wall is checked with validate_input() first. Defaults to True.
+
+    Returns:
+        Tuple[np.ndarray, list]: concatenated drain amounts (NaN for the walls that failed) and, for each wall,
+                                 the error message or None.
+    """
+    drain_amount = np.full(len(height), np.nan, dtype=np.float64)
+    errors = []
+    valid = np.zeros(len(height), dtype=bool)
+    shift = np.zeros(len(height), dtype=left_x.dtype)
+    scale = np.zeros(len(height), dtype=np.float64)
+    next_left_x = 0
+
+    for w, (start, end) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+        try:
+            if validate:
+                validate_input(
+                    height[start:end],
+                    left_x[start:end],
+                    right_x[start:end],
+                    end - start,
+                    water_amounts[w],
+                    integer_coordinates=(method == "dense"),
+                )
+            elif end == start:
+                raise Exception("The wall has no rain drains.")
+            scale[start:end] = water_amounts[w]
+        except Exception as error:
+            errors.append(str(error))
+            continue
+
+        errors.append(None)
+        valid[start:end] = True
+        shift[start:end] = next_left_x - left_x[start:end].min()
+        next_left_x += right_x[start:end].max() - left_x[start:end].min() + 1
+
+    if valid.any():
+        unit_drain_amount = calculate_drain_amount(
+            int(valid.sum()),
+            height[valid],
+            left_x[valid] + shift[valid],
+            right_x[valid] + shift[valid],
+            1.0,
+            method=method,
+            as_frame=False,
+        )
+        drain_amount[valid] = unit_drain_amount * scale[valid]
+
+    return drain_amount, errors
+
+
+class DrainService:
+    """
+    Asyncio front end solving drain amount requests on a bounded executor.
+
+    The requests are put in a bounded queue and dispatched by a background task:
+        - coalescing: a request for the same layout and water amount/length as a request still in flight waits
+          for the result of that request instead of being queued again.
+        - micro-batching: the requests with at most small_layout_size rain drains are collected for up to
+          batch_delay seconds (or max_batch_size requests) and solved together with solve_side_by_side().
+        - backpressure: at most max_workers solves run on the executor at the same time. When they are all busy
+          the queue fills up, and when the queue is full solve() waits for a free slot, or raises ServiceOverloaded
+          if the service was created with block=False.
+
+    The service runs in the event loop of its caller, so it can be exercised in-process, e.g. with
+    solve_requests(), without any external service.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_pending: int = 1024,
+        max_batch_size: int = 64,
+        batch_delay: float = 0.001,
+        small_layout_size: int = 1024,
+        method: str = "sweep",
+        validate: bool = True,
+        block: bool = True,
+        executor: Executor = None,
+    ):
+        """
+        Args:
+            max_workers (int, optional): Maximum number of solves running at the same time. Defaults to 4.
+            max_pending (int, optional): Maximum number of queued requests. Defaults to 1024.
+            max_batch_size (int, optional): Maximum number of requests solved together. Defaults to 64.
+            batch_delay (float, optional): Maximum time, in seconds, waited for other small requests before solving
+                                           a batch. Defaults to 0.001.
+            small_layout_size (int, optional): Maximum number of rain drains of the requests that are batched.
+                                               Defaults to 1024.
+            method (str, optional): Resolution algorithm (see calculate_drain_amount()). Defaults to "sweep".
+            validate (bool, optional): If True, each layout is checked with validate_input(). Defaults to True.
+            block (bool, optional): If False, solve() raises ServiceOverloaded instead of waiting when the queue is
+                                    full. Defaults to True.
+            executor (Executor, optional): Executor running the solves, e.g. a ProcessPoolExecutor. Defaults to None
+                                           (a ThreadPoolExecutor with max_workers threads owned by the service).
+        """
+        for name, value in (
+            ("max_workers", max_workers),
+            ("max_pending", max_pending),
+            ("max_batch_size", max_batch_size),
+        ):
+            if (type(value) != int) or (value <= 0):
+                raise Exception(f"{name} must be a positive integer.")
+        if method not in ("dense", "sweep"):
+            raise Exception('The resolution method must be either "dense" or "sweep".')
+
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_batch_size = max_batch_size
+        self.batch_delay = batch_delay
+        self.small_layout_size = small_layout_size
+        self.method = method
+        self.validate = validate
+        self.block = block
+
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._queue = None
+        self._slots = None
+        self._dispatcher = None
+        self._jobs = set()
+        self._in_flight = {}
+        self._stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "solves": 0,
+            "batched_requests": 0,
+        }
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    async def start(self):
+        """
+        Start the dispatcher task in the running event loop.
+        """
+        if self._dispatcher is not None:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def close(self):
+        """
+        Wait for the queued requests to be solved and stop the dispatcher.
+        """
+        if self._dispatcher is None:
+            return
+        await self._queue.join()
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the service.
+
+        Returns:
+            dict: numbers of requests received, coalesced with a request in flight and rejected, number of solves
+                  submitted to the executor, number of requests solved in batches of several requests and number of
+                  queued requests.
+        """
+        return dict(self._stats, pending=0 if self._queue is None else self._queue.qsize())
+
+    async def solve(
+        self,
+        height: list,
+        left_x: list,
+        right_x: list,
+        water_amount_per_unit_of_length: float,
+    ) -> np.ndarray:
+        """
+        Calculate the drain amounts of a layout without blocking the event loop.
+
+        Args:
+            height (list): List of heights.
+            left_x (list): List of left x-coordinates.
+            right_x (list): List of right x-coordinates.
+            water_amount_per_unit_of_length (float): Amount of water per unit of length.
+
+        Returns:
+            np.ndarray: float64 array with the drain amounts in the order of the input lists.
+
+        Raises:
+            Exception: If the layout is not valid.
+            ServiceOverloaded: If the queue is full and the service does not block.
+        """
+        if self._dispatcher is None:
+            raise Exception("The drain service is not started.")
+        self._stats["requests"] += 1
+
+        # Malformed layouts are rejected here, so that the dispatcher only handles sequences of equal lengths
+        if any(np.ndim(values) != 1 for values in (height, left_x, right_x)):
+            raise Exception("The height, left_x and right_x inputs must be one-dimensional lists or arrays.")
+        if len({len(height), len(left_x), len(right_x)}) != 1:
+            raise Exception("The height, left_x and right_x input lists have different lengths.")
+
+        # The values are checked before the fingerprint lookup, which does not tell apart 1 from 1.0 or True: the
+        # result of a request must not depend on the other requests in flight
+        for name, values in (("height", height), ("left_x", left_x), ("right_x", right_x)):
+            check_coordinate_types(name, values, integer_coordinates=(self.method == "dense"))
+        if self.validate:
+            validate_parameters(len(height), water_amount_per_unit_of_length)
+
+        key = (layout_fingerprint(height, left_x, right_x), water_amount_per_unit_of_length)
+        result = self._in_flight.get(key)
+        if result is not None:
+            self._stats["coalesced"] += 1
+        else:
+            result = asyncio.get_running_loop().create_future()
+            request = (height, left_x, right_x, water_amount_per_unit_of_length, result)
+            if self.block:
+                self._in_flight[key] = result
+                try:
+                    await self._queue.put(request)
+                except BaseException:
+                    del self._in_flight[key]
+                    raise
+            else:
+                try:
+                    self._queue.put_nowait(request)
+                except asyncio.QueueFull:
+                    self._stats["rejected"] += 1
+                    raise ServiceOverloaded(
+                        f"The drain service has {self.max_pending} pending requests."
+                    ) from None
+                self._in_flight[key] = result
+            result.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # The shared result is shielded, so that cancelling one of the coalesced requests does not cancel the others
+        drain_amount = await asyncio.shield(result)
+        return drain_amount.copy()
+
+    async def _dispatch(self):
+        """
+        Collect the queued requests into batches and submit them to the executor.
+
+        An unexpected error only fails the requests of the batch being collected: the dispatcher keeps serving the
+        following requests.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                if len(batch[0][0]) <= self.small_layout_size:
+                    deadline = loop.time() + self.batch_delay
+                    while len(batch) < self.max_batch_size:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            request = await asyncio.wait_for(self._queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                        if len(request[0]) <= self.small_layout_size:
+                            batch.append(request)
+                        else:
+                            await self._submit([request])
+                await self._submit(batch)
+            except Exception as error:
+                self._fail(batch, error)
+
+    def _fail(self, batch: list, error: Exception):
+        """
+        Deliver an error to the requests of a batch which could not be submitted.
+        """
+        for request in batch:
+            if not request[4].done():
+                request[4].set_exception(Exception(str(error)))
+            self._queue.task_done()
+
+    async def _submit(self, batch: list):
+        """
+        Wait for a free executor slot and solve a batch of requests in the background.
+        """
+        await self._slots.acquire()
+        self._stats["solves"] += 1
+        if len(batch) > 1:
+            self._stats["batched_requests"] += len(batch)
+        job = asyncio.get_running_loop().create_task(self._run(batch))
+        self._jobs.add(job)
+        job.add_done_callback(self._jobs.discard)
+
+    async def _run(self, batch: list):
+        """
+        Solve a batch of requests on the executor and deliver the results.
+        """
+        try:
+            try:
+                height, left_x, right_x, offsets, errors = pack_walls(
+                    [request[:3] for request in batch], integer_coordinates=(self.method == "dense")
+                )
+                water_amounts = [request[3] for request in batch]
+                drain_amount, solve_errors = await asyncio.get_running_loop().run_in_executor(
+                    self._executor,
+                    solve_side_by_side,
+                    height,
+                    left_x,
+                    right_x,
+                    offsets,
+                    water_amounts,
+                    self.method,
+                    self.validate,
+                )
+            except Exception as error:
+                drain_amount, errors, solve_errors = None, [None] * len(batch), [str(error)] * len(batch)
+
+            for w, request in enumerate(batch):
+                result = request[4]
+                if result.done():
+                    continue
+                error = errors[w] or solve_errors[w]
+                if error is not None:
+                    result.set_exception(Exception(error))
+                else:
+                    result.set_result(drain_amount[offsets[w] : offsets[w + 1]])
+        finally:
+            self._slots.release()
+            for _ in batch:
+                self._queue.task_done()
+
+
+def solve_requests(
+    requests: Iterable[Tuple[list, list, list, float]], **service_options
+) -> Tuple[list, list, dict]:
+    """
+    In-process client: submit requests concurrently to a DrainService running in a new event loop.
+
+    Args:
+        requests (Iterable[Tuple[list, list, list, float]]): height, left_x, right_x and water amount/length of
+                                                             each request.
+        **service_options: Arguments of DrainService.
+
+    Returns:
+        Tuple[list, list, dict]: for each request, in input order, the float64 array of its drain amounts (None if
+                                 it failed) and its error message (None if it succeeded), and the counters of the
+                                 service.
+    """
+
+    async def run():
+        async with DrainService(**service_options) as service:
+            results = await asyncio.gather(
+                *(service.solve(*request) for request in requests), return_exceptions=True
+            )
+            return results, service.stats()
+
+    results, stats = asyncio.run(run())
+    drain_amounts = [None if isinstance(result, BaseException) else result for result in results]
+    errors = [str(result) if isinstance(result, BaseException) else None for result in results]
+
+    return drain_amounts, errors, stats
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from core import generate_random_drains, calculate_drain_amount
+from batch import pack_walls, calculate_drain_amount_batch
+
+
+def random_walls(n_walls: int):
+    return [
+        generate_random_drains(5 + seed % 20, 0, 100, 0, 80, 3, seed, method="vectorized")
+        for seed in range(n_walls)
+    ]
+
+
+def test_packed_walls_keep_their_drains():
+    walls = random_walls(5)
+    walls[2] = ([1, 2], [0, 1.5], [3, 4])
+    height, left_x, right_x, offsets, errors = pack_walls(walls)
+
+    assert height.dtype == np.int64
+    assert errors[2] is not None and "float" in errors[2]
+    assert offsets[3] == offsets[2]
+    for w in (0, 1, 3, 4):
+        assert errors[w] is None
+        np.testing.assert_array_equal(height[offsets[w] : offsets[w + 1]], walls[w][0])
+        np.testing.assert_array_equal(right_x[offsets[w] : offsets[w + 1]], walls[w][2])
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_batch_matches_individual_solves_in_input_order(max_workers):
+    walls = random_walls(30)
+    drain_amounts, errors = calculate_drain_amount_batch(walls, 1.5, max_workers=max_workers, walls_per_task=4)
+
+    assert errors == [None] * len(walls)
+    for (height, left_x, right_x), drain_amount in zip(walls, drain_amounts):
+        expected = calculate_drain_amount(len(height), height, left_x, right_x, 1.5, method="sweep", as_frame=False)
+        np.testing.assert_allclose(drain_amount, expected)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_invalid_walls_only_fail_themselves(max_workers):
+    walls = random_walls(6)
+    walls[1] = ([1, 1], [0, 2], [3, 5])
+    walls[4] = ([1, 2], [0], [3, 5])
+    drain_amounts, errors = calculate_drain_amount_batch(walls, 1.0, max_workers=max_workers, walls_per_task=2)
+
+    assert "overlaps" in errors[1]
+    assert "different lengths" in errors[4]
+    assert drain_amounts[1] is None and drain_amounts[4] is None
+    for w in (0, 2, 3, 5):
+        assert errors[w] is None
+        height, left_x, right_x = walls[w]
+        np.testing.assert_allclose(
+            drain_amounts[w],
+            calculate_drain_amount(len(height), height, left_x, right_x, 1.0, method="sweep", as_frame=False),
+        )
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from core import generate_random_drains, calculate_drain_amount
+from cache import DrainCache, layout_fingerprint
+
+
+def random_wall(seed: int, N: int = 30):
+    return generate_random_drains(N, 0, 100, 0, 4 * N, 3, seed, method="vectorized")
+
+
+def test_cached_drain_amounts_are_scaled_by_the_water_amount():
+    cache = DrainCache()
+    h, l, r = random_wall(0)
+    for water in (1.0, 2.5, 0.1):
+        drain_amount = cache.calculate_drain_amount(len(h), h, l, r, water, method="sweep", as_frame=False)
+        expected = calculate_drain_amount(len(h), h, l, r, water, method="sweep", as_frame=False)
+        np.testing.assert_allclose(drain_amount, expected)
+
+    stats = cache.stats()
+    assert stats["solve_misses"] == 1
+    assert stats["solve_hits"] == 2
+
+
+def test_validation_hit_still_checks_the_value_types():
+    cache = DrainCache()
+    cache.validate_input([1, 2], [0, 0], [3, 3], 2, 1.0)
+    cache.validate_input([1, 2], [0, 0], [3, 3], 2, 1.0)
+    assert cache.stats()["validate_hits"] == 1
+
+    assert layout_fingerprint([True, 2], [0, 0], [3, 3]) == layout_fingerprint([1, 2], [0, 0], [3, 3])
+    with pytest.raises(Exception, match="bool"):
+        cache.validate_input([True, 2], [0, 0], [3, 3], 2, 1.0)
+    with pytest.raises(Exception, match="positive float"):
+        cache.validate_input([1, 2], [0, 0], [3, 3], 2, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = DrainCache(max_entries=2)
+    walls = [random_wall(seed) for seed in range(3)]
+    for h, l, r in walls:
+        cache.calculate_drain_amount(len(h), h, l, r, 1.0, method="sweep", as_frame=False)
+
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    h, l, r = walls[0]
+    cache.calculate_drain_amount(len(h), h, l, r, 1.0, method="sweep", as_frame=False)
+    assert cache.stats()["solve_misses"] == 4
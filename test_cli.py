@@ -0,0 +1,85 @@
+import json
+import numpy as np
+import pytest
+
+from core import generate_random_drains, calculate_drain_amount, calculate_to_height
+from cli import load_layout, save_results, main
+
+
+def random_wall(seed: int = 0, N: int = 30):
+    return generate_random_drains(N, 0, 100, 0, 4 * N, 3, seed, method="vectorized")
+
+
+def write_layout(path, height, left_x, right_x):
+    if path.suffix == ".npy" and not path.stem.endswith("structured"):
+        np.save(path, np.column_stack((height, left_x, right_x)))
+    else:
+        save_results(str(path), {"height": height, "left_x": left_x, "right_x": right_x})
+
+
+def load_results(path) -> dict:
+    if path.suffix == ".csv":
+        import pandas as pd
+
+        df = pd.read_csv(path)
+        return {column: df[column].to_numpy() for column in df.columns}
+    if path.suffix == ".npy":
+        array = np.load(path)
+        return {column: array[column] for column in array.dtype.names}
+    with np.load(path) as arrays:
+        return dict(arrays)
+
+
+@pytest.mark.parametrize("name", ["layout.csv", "layout.npz", "layout.npy", "layout_structured.npy", "layout.parquet"])
+def test_layout_round_trip(tmp_path, name):
+    if name.endswith(".parquet"):
+        pytest.importorskip("pyarrow")
+    height, left_x, right_x = random_wall()
+    path = tmp_path / name
+    write_layout(path, height, left_x, right_x)
+
+    for column, expected in zip(load_layout(str(path)), (height, left_x, right_x)):
+        np.testing.assert_array_equal(column, expected)
+
+
+@pytest.mark.parametrize("output_format", [None, "csv", "npy"])
+def test_cli_writes_the_results_of_every_layout(tmp_path, output_format):
+    walls = [random_wall(seed) for seed in range(3)]
+    paths = []
+    for seed, wall in enumerate(walls):
+        paths.append(tmp_path / f"wall{seed}.npz")
+        write_layout(paths[-1], *wall)
+    output_dir = tmp_path / "results"
+
+    arguments = [str(path) for path in paths] + ["-w", "2.0", "-o", str(output_dir)]
+    if output_format is not None:
+        arguments += ["--format", output_format]
+    assert main(arguments) == 0
+
+    extension = "." + (output_format or "npz")
+    for seed, (height, left_x, right_x) in enumerate(walls):
+        results = load_results(output_dir / f"wall{seed}_drain_amount{extension}")
+        np.testing.assert_array_equal(results["height"], height)
+        np.testing.assert_allclose(
+            results["drain_amount"],
+            calculate_drain_amount(len(height), height, left_x, right_x, 2.0, method="sweep", as_frame=False),
+        )
+        to_height, receiver = calculate_to_height(height, left_x, right_x)
+        np.testing.assert_array_equal(results["to_height"], to_height)
+        np.testing.assert_array_equal(results["receiver"], receiver)
+
+
+def test_failed_layouts_do_not_stop_the_others(tmp_path, capsys):
+    write_layout(tmp_path / "overlapping.csv", [1, 1], [0, 2], [3, 5])
+    write_layout(tmp_path / "valid.csv", *random_wall())
+    (tmp_path / "layout.txt").write_text("")
+    metrics = tmp_path / "metrics.jsonl"
+
+    paths = [str(tmp_path / name) for name in ("overlapping.csv", "layout.txt", "valid.csv")]
+    assert main(paths + ["-w", "1.0", "-o", str(tmp_path / "results"), "--metrics", str(metrics)]) == 1
+
+    error = capsys.readouterr().err
+    assert "overlaps" in error and "unsupported format" in error
+    assert (tmp_path / "results" / "valid_drain_amount.csv").exists()
+    records = [json.loads(line) for line in metrics.read_text().splitlines()]
+    assert sum(record["stage"] == "process_layout" for record in records) == 3
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from core import generate_random_drains, calculate_drain_amount, calculate_receivers
+from drain_index import DrainIndex
+
+
+def random_layout(seed: int, N: int = 60, wall_width: int = 200):
+    rng = np.random.default_rng(seed)
+    return generate_random_drains(
+        N, 0, wall_width, 0, 4 * N, 3, int(rng.integers(10000)), method="vectorized"
+    )
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_drain_index_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    height, left_x, right_x = (np.asarray(values) for values in random_layout(seed))
+    N = len(height)
+    index = DrainIndex(height, left_x, right_x)
+    drain_amount = calculate_drain_amount(N, height, left_x, right_x, 1.0, method="sweep", as_frame=False)
+    receiver = calculate_receivers(height, left_x, right_x)
+
+    x = rng.uniform(-10.0, 210.0, 300)
+    x[:50] = rng.integers(-10, 210, 50)
+    y = rng.uniform(-5.0, 250.0, 300)
+    y[:50] = height[rng.integers(0, N, 50)]
+
+    below = index.drain_below(x, y)
+    above = index.drain_above(x, y)
+    landing, terminal, ground_x = index.water_destination(x, y)
+    for k in range(len(x)):
+        covering = (left_x <= x[k]) & (x[k] < right_x)
+        candidates = np.flatnonzero(covering & (height <= y[k]))
+        expected_below = candidates[np.argmax(height[candidates])] if len(candidates) else -1
+        candidates = np.flatnonzero(covering & (height > y[k]))
+        expected_above = candidates[np.argmin(height[candidates])] if len(candidates) else -1
+        assert below[k] == expected_below
+        assert above[k] == expected_above
+
+        expected_terminal = expected_below
+        while (expected_terminal >= 0) and (receiver[expected_terminal] >= 0):
+            expected_terminal = receiver[expected_terminal]
+        assert landing[k] == expected_below
+        assert terminal[k] == expected_terminal
+        assert ground_x[k] == (right_x[expected_terminal] if expected_terminal >= 0 else x[k])
+
+    # Water reaching the ground on integer intervals: the uncovered units and the right ends of the rain drains
+    # discharging to the ground
+    x_start = rng.integers(-10, 210, 100)
+    x_end = x_start + rng.integers(0, 60, 100)
+    covered = np.zeros(400, dtype=bool)
+    for l, r in zip(left_x, right_x):
+        covered[l + 100 : r + 100] = True
+    ground_amount = index.ground_amount(x_start, x_end)
+    for k in range(len(x_start)):
+        a = max(x_start[k], left_x.min())
+        b = min(x_end[k], right_x.max())
+        expected = float(np.sum(~covered[a + 100 : b + 100])) if a < b else 0.0
+        discharging = (receiver < 0) & (x_start[k] <= right_x) & (right_x < x_end[k])
+        expected += drain_amount[discharging].sum()
+        assert ground_amount[k] == pytest.approx(expected)
+
+    # Rain drains at a given height intersecting an interval, from left to right
+    for k in range(100):
+        h = height[rng.integers(0, N)] if k % 4 else rng.uniform(-5.0, 250.0)
+        a, b = np.sort(rng.uniform(-10.0, 210.0, 2))
+        expected = np.flatnonzero((height == h) & (left_x < b) & (right_x > a))
+        expected = expected[np.argsort(left_x[expected])]
+        assert index.drains_at_height(h, a, b).tolist() == expected.tolist()
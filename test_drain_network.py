@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import drain_network
+from core import generate_random_drains, calculate_drain_amount, calculate_receivers
+from drain_network import DrainNetwork
+
+RAINFALL_PROFILE = ([-5.0, 40.0, 90.0, 500.0], [1.0, 3.0, 0.25])
+
+
+def random_layout(seed: int, N: int = 40, wall_width: int = 200):
+    rng = np.random.default_rng(seed)
+    return generate_random_drains(
+        N, 0, wall_width, 0, 4 * N, 3, int(rng.integers(10000)), method="vectorized"
+    )
+
+
+def check_network(network: DrainNetwork, rainfall_profile):
+    ids, H, L, R, drain_amount = network.to_arrays()
+    assert len(network) == len(ids)
+    expected = calculate_drain_amount(
+        len(H), H, L, R, 1.0, method="sweep", as_frame=False, rainfall_profile=rainfall_profile
+    )
+    np.testing.assert_allclose(drain_amount, expected, rtol=1e-9, atol=1e-9)
+
+    receiver = calculate_receivers(H, L, R)
+    expected_receiver = np.where(receiver >= 0, ids[receiver], -1)
+    assert [network.receiver(int(i)) for i in ids] == expected_receiver.tolist()
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("rainfall_profile", [None, RAINFALL_PROFILE])
+@pytest.mark.parametrize("partial_limit", [64, 1])
+def test_network_edits_match_full_solve(seed, rainfall_profile, partial_limit, monkeypatch):
+    # With a partial limit of 1 the interval index is built again after most insertions
+    monkeypatch.setattr(drain_network, "PARTIAL_LIMIT", partial_limit)
+    rng = np.random.default_rng(seed)
+    height, left_x, right_x = random_layout(seed)
+    network = DrainNetwork(height, left_x, right_x, 1.0, rainfall_profile)
+
+    for _ in range(40):
+        ids = network.to_arrays()[0]
+        edit = rng.integers(3)
+        h = float(rng.integers(0, 160))
+        l = float(rng.uniform(-10, 190)) if seed % 2 else float(rng.integers(0, 190))
+        r = l + float(rng.integers(1, 60))
+        try:
+            if edit == 0:
+                network.add_drain(h, l, r)
+            elif (edit == 1) and (len(ids) > 1):
+                network.remove_drain(int(rng.choice(ids)))
+            else:
+                network.move_drain(int(rng.choice(ids)), h, l, r)
+        except Exception as exception:
+            if "overlaps" not in str(exception):
+                raise
+
+        check_network(network, rainfall_profile)
+
+
+def test_network_built_from_empty_layout():
+    network = DrainNetwork([], [], [])
+    assert len(network) == 0
+
+    first = network.add_drain(5, 0, 10)
+    second = network.add_drain(3, 5, 20)
+    assert network.receiver(first) == second
+    check_network(network, None)
+
+    with pytest.raises(Exception, match="overlaps"):
+        network.add_drain(5, 9, 12)
+    with pytest.raises(Exception, match="overlaps"):
+        network.move_drain(second, 5, -5, 1)
+    network.move_drain(second, 5, 11, 20)
+    assert network.receiver(first) == -1
+    check_network(network, None)
+
+    network.remove_drain(first)
+    with pytest.raises(Exception, match="no rain drain"):
+        network.drain_amount(first)
+    assert network.drain_amount(second) == pytest.approx(9.0)
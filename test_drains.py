@@ -0,0 +1,440 @@
+import time
+from fractions import Fraction
+import numpy as np
+import pytest
+
+from core import (
+    generate_random_drains,
+    validate_input,
+    find_overlapping_drains,
+    validate_rainfall_profile,
+    integrate_rainfall_profile,
+    compensated_prefix_sums,
+    calculate_receivers,
+    calculate_drain_amount,
+    spill_drain_amount,
+    simulate_drain_outflow,
+    calculate_drain_amount_scenarios,
+    generate_raindrop_chunks,
+    filter_raindrop_chunks,
+    calculate_skyline,
+    visible_raindrops,
+    calculate_drainage_network,
+)
+
+RAINFALL_PROFILE = ([-5.0, 40.0, 90.0, 500.0], [1.0, 3.0, 0.25])
+
+
+def random_layout(seed: int, N: int = 60, wall_width: int = 200):
+    rng = np.random.default_rng(seed)
+    return generate_random_drains(
+        N, 0, wall_width, 0, 4 * N, 3, int(rng.integers(10000)), method="vectorized"
+    )
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("with_capacity", [False, True])
+@pytest.mark.parametrize("rainfall_profile", [None, RAINFALL_PROFILE])
+def test_dense_matches_sweep(seed, with_capacity, rainfall_profile):
+    height, left_x, right_x = random_layout(seed)
+    N = len(height)
+    capacity = None
+    if with_capacity:
+        capacity = np.random.default_rng(seed).uniform(1.0, 50.0, N)
+
+    dense = calculate_drain_amount(
+        N, height, left_x, right_x, 1.5, method="dense", as_frame=False,
+        rainfall_profile=rainfall_profile, capacity=capacity,
+    )
+    sweep = calculate_drain_amount(
+        N, height, left_x, right_x, 1.5, method="sweep", as_frame=False,
+        rainfall_profile=rainfall_profile, capacity=capacity,
+    )
+
+    np.testing.assert_allclose(dense, sweep, rtol=1e-9, atol=1e-9)
+
+
+def test_spill_scaling():
+    # Staircase of disjoint rain drains, each one replacing the runs of segments near the start of the wall:
+    # an O(N logN) resolution takes about 4 times longer on 4 times more rain drains, a quadratic one 16 times.
+    def wall_time(N):
+        height = np.arange(N, 0, -1)
+        left_x = np.arange(N)[::-1] * 3
+        right_x = left_x + 2
+        best = np.inf
+        for _ in range(3):
+            start = time.perf_counter()
+            calculate_drain_amount(
+                N, height, left_x, right_x, 1.0, method="sweep", as_frame=False, capacity=1e9
+            )
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    assert wall_time(100000) < 8 * wall_time(25000)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_simulation_with_capacity_matches_spill(seed):
+    height, left_x, right_x = random_layout(seed, N=40)
+    N = len(height)
+    capacity = np.random.default_rng(seed).uniform(0.5, 30.0, N)
+
+    outflow, ground_outflow = simulate_drain_outflow(
+        N, height, left_x, right_x, [1.0, 1.0, 1.0], capacity=capacity
+    )
+    drain_amount, _ = spill_drain_amount(height, left_x, right_x, 1.0, capacity)
+
+    for t in range(3):
+        np.testing.assert_allclose(outflow[:, t], drain_amount, rtol=1e-9, atol=1e-9)
+    # All the rain falling on the wall reaches the ground
+    np.testing.assert_allclose(ground_outflow, max(right_x) - min(left_x))
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_simulation_with_constant_rainfall_matches_drain_amounts(seed):
+    height, left_x, right_x = random_layout(seed, N=40)
+    N = len(height)
+
+    outflow, ground_outflow = simulate_drain_outflow(N, height, left_x, right_x, [2.0] * 5)
+    drain_amount = calculate_drain_amount(N, height, left_x, right_x, 2.0, method="sweep", as_frame=False)
+
+    assert outflow.shape == (N, 5)
+    for t in range(5):
+        np.testing.assert_allclose(outflow[:, t], drain_amount, rtol=1e-12)
+    np.testing.assert_allclose(ground_outflow, 2.0 * (max(right_x) - min(left_x)))
+
+
+def test_simulation_lag_delays_the_received_water():
+    # The upper rain drain [0, 4) discharges onto the lower one [2, 10), which discharges to the ground
+    outflow, ground_outflow = simulate_drain_outflow(
+        2, [5, 3], [0, 2], [4, 10], [1.0, 0.0, 0.0, 0.0, 0.0], lag=[2, 1]
+    )
+
+    np.testing.assert_allclose(outflow[0], [4.0, 0.0, 0.0, 0.0, 0.0])
+    np.testing.assert_allclose(outflow[1], [6.0, 0.0, 4.0, 0.0, 0.0])
+    np.testing.assert_allclose(ground_outflow, [0.0, 6.0, 0.0, 4.0, 0.0])
+
+
+def test_simulation_float32_outflow():
+    height, left_x, right_x = random_layout(0, N=40)
+    N = len(height)
+    rainfall = np.random.default_rng(0).uniform(0.0, 2.0, 50)
+
+    outflow, _ = simulate_drain_outflow(N, height, left_x, right_x, rainfall, lag=1)
+    outflow_32, _ = simulate_drain_outflow(N, height, left_x, right_x, rainfall, lag=1, dtype=np.float32)
+
+    assert outflow_32.dtype == np.float32
+    assert outflow_32.nbytes * 2 == outflow.nbytes
+    np.testing.assert_allclose(outflow_32, outflow, rtol=1e-5, atol=1e-4)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_scenarios_match_individual_solves(seed):
+    height, left_x, right_x = random_layout(seed)
+    N = len(height)
+    water_amounts = [0.5, 1.0, 3.25]
+    rainfall_profiles = [RAINFALL_PROFILE, ([0.0, 100.0, 200.0], [2.0, 0.5])]
+
+    drain_amount = calculate_drain_amount_scenarios(N, height, left_x, right_x, water_amounts)
+    assert drain_amount.shape == (N, 3)
+    for k, water in enumerate(water_amounts):
+        expected = calculate_drain_amount(N, height, left_x, right_x, water, method="sweep", as_frame=False)
+        np.testing.assert_allclose(drain_amount[:, k], expected, rtol=1e-12)
+
+    drain_amount = calculate_drain_amount_scenarios(
+        N, height, left_x, right_x, rainfall_profiles=rainfall_profiles
+    )
+    assert drain_amount.shape == (N, 2)
+    for k, rainfall_profile in enumerate(rainfall_profiles):
+        expected = calculate_drain_amount(
+            N, height, left_x, right_x, 1.0, method="sweep", as_frame=False, rainfall_profile=rainfall_profile
+        )
+        np.testing.assert_allclose(drain_amount[:, k], expected, rtol=1e-12)
+
+
+def test_scenarios_reject_invalid_arguments():
+    height, left_x, right_x = [3, 1], [0, 2], [4, 6]
+    with pytest.raises(Exception, match="3 elements instead of 2"):
+        calculate_drain_amount_scenarios(2, height + [0], left_x, right_x, [1.0])
+    with pytest.raises(Exception, match="instead of 3"):
+        calculate_drain_amount_scenarios(3, height, left_x, right_x, [1.0])
+    with pytest.raises(Exception, match="Either"):
+        calculate_drain_amount_scenarios(2, height, left_x, right_x)
+    with pytest.raises(Exception, match="Either"):
+        calculate_drain_amount_scenarios(2, height, left_x, right_x, [1.0], [RAINFALL_PROFILE])
+    with pytest.raises(Exception, match="positive floats"):
+        calculate_drain_amount_scenarios(2, height, left_x, right_x, [1.0, -2.0])
+
+
+@pytest.mark.parametrize("method", ["dense", "sweep"])
+def test_constant_rainfall_profile_matches_water_amount(method):
+    height, left_x, right_x = random_layout(0)
+    N = len(height)
+    rainfall_profile = ([min(left_x) - 3, max(right_x) + 3], [2.5])
+
+    expected = calculate_drain_amount(N, height, left_x, right_x, 2.5, method=method, as_frame=False)
+    drain_amount = calculate_drain_amount(
+        N, height, left_x, right_x, 1.0, method=method, as_frame=False, rainfall_profile=rainfall_profile
+    )
+    np.testing.assert_allclose(drain_amount, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("method", ["dense", "sweep"])
+def test_rainfall_profile_is_integrated_over_the_exposed_segments(method):
+    # The upper rain drain [0, 10) receives 1 on [0, 4) and 3 on [4, 10); the lower one [6, 20) is only exposed
+    # on [10, 20), where no water flows down beyond x = 15, and receives the water of the upper one.
+    rainfall_profile = ([-5, 4, 15], [1.0, 3.0])
+    assert integrate_rainfall_profile(rainfall_profile, [-10, -5, 4, 10, 15, 30]).tolist() == [
+        0.0, 0.0, 9.0, 27.0, 42.0, 42.0
+    ]
+
+    drain_amount = calculate_drain_amount(
+        2, [5, 2], [0, 6], [10, 20], 1.0, method=method, as_frame=False, rainfall_profile=rainfall_profile
+    )
+    np.testing.assert_allclose(drain_amount, [22.0, 37.0])
+
+
+@pytest.mark.parametrize(
+    "rainfall_profile, message",
+    [
+        (([0, 1, 2],), "pair of lists"),
+        (([0, 1], []), "non-empty"),
+        (([0, 1], [1.0, 2.0]), "2 breakpoints instead of 3"),
+        (([0, 2, 1], [1.0, 2.0]), "strictly increasing"),
+        (([0, 1, 2], [1.0, -2.0]), "non-negative"),
+    ],
+)
+def test_invalid_rainfall_profiles_are_rejected(rainfall_profile, message):
+    with pytest.raises(Exception, match=message):
+        validate_rainfall_profile(rainfall_profile)
+    with pytest.raises(Exception, match=message):
+        validate_input([3, 1], [0, 2], [4, 6], 2, None, rainfall_profile)
+
+
+def test_rainfall_profile_replaces_the_water_amount_in_validation():
+    validate_input([3, 1], [0, 2], [4, 6], 2, None, ([0, 10], [1.0]))
+    with pytest.raises(Exception, match="positive float"):
+        validate_input([3, 1], [0, 2], [4, 6], 2, None)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_overlapping_pairs_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    N = 80
+    height = rng.integers(0, 8, N)
+    left_x = rng.integers(0, 100, N)
+    right_x = left_x + rng.integers(1, 15, N)
+
+    expected = {
+        (min(i, j), max(i, j))
+        for i in range(N)
+        for j in range(i + 1, N)
+        if (height[i] == height[j]) and (left_x[i] < right_x[j]) and (left_x[j] < right_x[i])
+    }
+    pairs = find_overlapping_drains(height, left_x, right_x)
+    assert {(min(i, j), max(i, j)) for i, j in pairs.tolist()} == expected
+    assert len(pairs) == len(expected)
+
+
+def test_validation_reports_every_overlapping_pair():
+    # Rain drains touching at one end do not overlap
+    validate_input([2, 2, 2], [0, 4, 8], [4, 8, 12], 3, 1.0)
+
+    with pytest.raises(Exception) as error:
+        validate_input([2, 5, 2, 2], [0, 0, 3, 5], [4, 9, 6, 7], 4, 1.0)
+    message = str(error.value)
+    assert "location 0 overlaps the rain drain at location 2" in message
+    assert "location 2 overlaps the rain drain at location 3" in message
+    assert "location 1" not in message
+
+
+def test_overlap_validation_does_not_depend_on_the_wall_width():
+    # A per-unit scan of a wall of 10**15 units would not complete
+    validate_input([1, 1, 2], [0, 10**15 - 10, 0], [10**14, 10**15, 10**15], 3, 1.0)
+    with pytest.raises(Exception, match="overlaps"):
+        validate_input([1, 1], [0, 10**14 - 1], [10**14, 10**15], 2, 1.0)
+
+
+def test_raindrop_chunks_do_not_depend_on_the_chunk_size():
+    rng = np.random.default_rng(7)
+    expected_x = rng.uniform(-5, 150, 1000)
+    expected_y = rng.uniform(0, 60, 1000)
+
+    for chunk_size in (1, 7, 333, 1000, 5000):
+        chunks = list(generate_raindrop_chunks(1000, -5, 150, 0, 60, 7, chunk_size=chunk_size))
+        assert max(len(x) for x, _ in chunks) == min(chunk_size, 1000)
+        np.testing.assert_array_equal(np.concatenate([x for x, _ in chunks]), expected_x)
+        np.testing.assert_array_equal(np.concatenate([y for _, y in chunks]), expected_y)
+
+    with pytest.raises(Exception, match="chunk_size"):
+        next(generate_raindrop_chunks(10, 0, 1, 0, 1, 7, chunk_size=0))
+
+
+def test_filtered_chunks_match_filtering_all_the_raindrops():
+    height, left_x, right_x = random_layout(2)
+    skyline = calculate_skyline(height, left_x, right_x)
+    (rain_drops_x, rain_drops_y), = generate_raindrop_chunks(3000, -10, 210, 0, 250, 3, chunk_size=3000)
+    visible = visible_raindrops(skyline, rain_drops_x, rain_drops_y)
+
+    chunks = list(filter_raindrop_chunks(skyline, generate_raindrop_chunks(3000, -10, 210, 0, 250, 3, chunk_size=256)))
+    np.testing.assert_array_equal(np.concatenate([x for x, _ in chunks]), rain_drops_x[visible])
+    np.testing.assert_array_equal(np.concatenate([y for _, y in chunks]), rain_drops_y[visible])
+
+
+@pytest.mark.parametrize("N, maximum_n_drains_per_height", [(1, 2), (50, 3), (200000, 5)])
+def test_vectorized_generator_produces_valid_layouts(N, maximum_n_drains_per_height):
+    state = np.random.get_state()
+    height, left_x, right_x = generate_random_drains(
+        N, -20, 5000, 10, 10 + N, maximum_n_drains_per_height, 3, method="vectorized"
+    )
+    # The global NumPy random generator is left untouched
+    assert np.array_equal(np.random.get_state()[1], state[1])
+
+    assert all(isinstance(values, np.ndarray) and (len(values) == N) for values in (height, left_x, right_x))
+    assert (height.min() >= 10) and (height.max() < 10 + N)
+    assert (left_x.min() >= -20) and (right_x.max() <= 5000)
+    assert np.unique(height, return_counts=True)[1].max() <= maximum_n_drains_per_height - 1
+    validate_input(height, left_x, right_x, N, 1.0)
+
+    again = generate_random_drains(N, -20, 5000, 10, 10 + N, maximum_n_drains_per_height, 3, method="vectorized")
+    for values, values_again in zip((height, left_x, right_x), again):
+        np.testing.assert_array_equal(values, values_again)
+
+
+def test_legacy_generator_keeps_its_layouts():
+    first = generate_random_drains(20, 0, 100, 0, 40, 3, 5)
+    assert all(isinstance(values, list) for values in first)
+    assert generate_random_drains(20, 0, 100, 0, 40, 3, 5) == first
+    assert generate_random_drains(20, 0, 100, 0, 40, 3, 6) != first
+    validate_input(*first, 20, 1.0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("rainfall_profile", [None, RAINFALL_PROFILE])
+def test_drainage_network_matches_the_drain_amounts(seed, rainfall_profile):
+    height, left_x, right_x = random_layout(seed)
+    network = calculate_drainage_network(len(height), height, left_x, right_x, 1.5, rainfall_profile)
+
+    receiver = calculate_receivers(height, left_x, right_x)
+    np.testing.assert_array_equal(network["receiver"], receiver)
+    senders = np.flatnonzero(receiver >= 0)
+    np.testing.assert_array_equal(network["edges"], np.column_stack((senders, receiver[senders])))
+    np.testing.assert_allclose(
+        network["drain_amount"],
+        calculate_drain_amount(
+            len(height), height, left_x, right_x, 1.5, method="sweep", rainfall_profile=rainfall_profile,
+            as_frame=False,
+        ),
+    )
+    if rainfall_profile is None:
+        np.testing.assert_allclose(1.5 * network["catchment_width"], network["drain_amount"])
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("rainfall_profile", [None, RAINFALL_PROFILE])
+def test_all_the_rain_reaches_the_ground(seed, rainfall_profile):
+    height, left_x, right_x = random_layout(seed)
+    network = calculate_drainage_network(len(height), height, left_x, right_x, 1.5, rainfall_profile)
+
+    wall = np.array([np.min(left_x), np.max(right_x)])
+    if rainfall_profile is None:
+        rain_fall = 1.5 * (wall[1] - wall[0])
+    else:
+        rain_fall = np.diff(integrate_rainfall_profile(rainfall_profile, wall))[0]
+    assert np.all(network["ground_discharge"] >= -1e-9)
+    np.testing.assert_allclose(network["ground_discharge"].sum(), rain_fall)
+
+
+def test_ground_discharge_is_aggregated_over_the_ground_bins():
+    height, left_x, right_x = random_layout(0)
+    network = calculate_drainage_network(len(height), height, left_x, right_x, 1.0)
+    fine_bins = network["ground_bins"]
+
+    # Bins made of every fourth segment boundary sum the discharge of the elementary segments they contain
+    coarse_bins = np.unique(np.append(fine_bins[::4], fine_bins[-1]))
+    coarse = calculate_drainage_network(len(height), height, left_x, right_x, 1.0, ground_bins=coarse_bins)
+    cumulative_discharge = np.concatenate(([0.0], np.cumsum(network["ground_discharge"])))
+    np.testing.assert_allclose(
+        coarse["ground_discharge"], np.diff(cumulative_discharge[np.searchsorted(fine_bins, coarse_bins)])
+    )
+
+    # The rain falling outside of the wall is not counted
+    wide = calculate_drainage_network(len(height), height, left_x, right_x, 1.0, ground_bins=[-1000, 0, 1000])
+    np.testing.assert_allclose(wide["ground_discharge"].sum(), network["ground_discharge"].sum())
+
+    for ground_bins in ([5], [5, 5], [[0, 1], [2, 3]]):
+        with pytest.raises(Exception, match="ground bins"):
+            calculate_drainage_network(len(height), height, left_x, right_x, 1.0, ground_bins=ground_bins)
+
+
+def exact_rain_fall(rainfall_profile, a, b) -> Fraction:
+    # Integral of the rainfall profile over [a, b] with rational numbers
+    breakpoints, rates = rainfall_profile
+    rain_fall = Fraction(0)
+    for lower, upper, rate in zip(breakpoints[:-1], breakpoints[1:], rates):
+        lower, upper = max(Fraction(lower), Fraction(a)), min(Fraction(upper), Fraction(b))
+        if upper > lower:
+            rain_fall += Fraction(rate) * (upper - lower)
+    return rain_fall
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("precision", ["compensated", "exact"])
+@pytest.mark.parametrize("rainfall_profile", [None, RAINFALL_PROFILE])
+def test_precise_drain_amounts_match_the_cascade(seed, precision, rainfall_profile):
+    height, left_x, right_x = random_layout(seed)
+    drain_amount = calculate_drain_amount(
+        len(height), height, left_x, right_x, 0.7, method="sweep", rainfall_profile=rainfall_profile,
+        precision=precision, as_frame=False,
+    )
+    expected = calculate_drain_amount(
+        len(height), height, left_x, right_x, 0.7, method="sweep", rainfall_profile=rainfall_profile,
+        as_frame=False,
+    )
+    np.testing.assert_allclose(drain_amount, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("rainfall_profile", [None, ([0.0, 0.3, 700.0, 1e6], [1e-3, 0.1, 7e3])])
+def test_exact_precision_is_correctly_rounded_on_a_staircase(rainfall_profile):
+    # Rain drain k covers [x[k], x[k + 2]] below rain drain k - 1: it drains the whole top edge left of x[k + 2]
+    N = 500
+    x = np.sort(np.random.default_rng(0).uniform(0, 1e6, N + 2))
+    height, left_x, right_x = np.arange(N, 0, -1), x[:-2], x[2:]
+    profile = ([x[0], x[-1]], [0.1]) if rainfall_profile is None else rainfall_profile
+    expected = np.array([float(exact_rain_fall(profile, x[0], end)) for end in right_x])
+
+    def solve(precision):
+        return calculate_drain_amount(
+            N, height, left_x, right_x, 0.1, method="sweep", rainfall_profile=rainfall_profile,
+            precision=precision, as_frame=False,
+        )
+
+    np.testing.assert_array_equal(solve("exact"), expected)
+    np.testing.assert_allclose(solve("compensated"), expected, rtol=4e-16)
+    np.testing.assert_allclose(solve("fast"), expected, rtol=1e-10)
+
+
+def test_compensated_prefix_sums_match_rational_sums():
+    rng = np.random.default_rng(1)
+    breakpoints = np.sort(rng.uniform(-1e5, 1e5, 300))
+    rates = rng.uniform(0, 10, 299) * 10.0 ** rng.integers(-8, 8, 299)
+    prefix_value, prefix_error = compensated_prefix_sums(breakpoints, rates)
+
+    assert (prefix_value[0] == 0.0) and (prefix_error[0] == 0.0)
+    exact = Fraction(0)
+    for k in range(len(rates)):
+        exact += Fraction(rates[k]) * (Fraction(breakpoints[k + 1]) - Fraction(breakpoints[k]))
+        approximation = Fraction(prefix_value[k + 1]) + Fraction(prefix_error[k + 1])
+        assert abs(approximation - exact) <= Fraction(1e-28) * exact
+
+
+def test_invalid_precisions_are_rejected():
+    height, left_x, right_x = random_layout(0)
+    with pytest.raises(Exception, match="precision must be"):
+        calculate_drain_amount(len(height), height, left_x, right_x, 1.0, method="sweep", precision="double")
+    with pytest.raises(Exception, match='require precision="fast"'):
+        calculate_drain_amount(
+            len(height), height, left_x, right_x, 1.0, method="sweep", capacity=5.0, precision="exact"
+        )
+    with pytest.raises(Exception, match='only supports precision="fast"'):
+        calculate_drain_amount(len(height), height, left_x, right_x, 1.0, method="dense", precision="compensated")
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+import core
+import functions
+from functions import (
+    generate_random_drains,
+    calculate_receivers,
+    calculate_to_height,
+    calculate_drain_amount,
+    generate_raindrops,
+    process_to_height_and_raindrops,
+)
+
+
+def random_frame(seed: int, N: int = 40):
+    height, left_x, right_x = generate_random_drains(N, 0, 150, 0, 4 * N, 3, seed, method="vectorized")
+    return calculate_drain_amount(N, height, left_x, right_x, 1.0, method="sweep")
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_skyline_matches_loop(seed):
+    df = random_frame(seed)
+    N = len(df)
+    rain_drops_x, rain_drops_y = generate_raindrops(2000, -10, 160, 0, 4 * N, seed)
+    # Raindrops exactly on the x-coordinates and heights of the rain drains
+    rain_drops_x[:200] = df["left_x"].to_numpy()[np.arange(200) % N]
+    rain_drops_y[:200] = df["height"].to_numpy()[np.arange(200) % N]
+    rain_drops_x[200:400] = df["right_x"].to_numpy()[np.arange(200) % N]
+
+    loop_df, loop_x, loop_y = process_to_height_and_raindrops(N, df, rain_drops_x, rain_drops_y, method="loop")
+    skyline_df, skyline_x, skyline_y = process_to_height_and_raindrops(
+        N, df, rain_drops_x, rain_drops_y, method="skyline"
+    )
+
+    assert skyline_df.equals(loop_df)
+    np.testing.assert_array_equal(skyline_x, loop_x)
+    np.testing.assert_array_equal(skyline_y, loop_y)
+
+
+def test_skyline_routes_the_rain_drains_once(monkeypatch):
+    df = random_frame(0)
+    rain_drops_x, rain_drops_y = generate_raindrops(100, 0, 150, 0, 160, 0)
+
+    # route_drains() is counted both when called from functions.py and from the functions of core.py
+    calls = []
+    route_drains = core.route_drains
+
+    def counting_route_drains(*args, **kwargs):
+        calls.append(args)
+        return route_drains(*args, **kwargs)
+
+    monkeypatch.setattr(functions, "route_drains", counting_route_drains)
+    monkeypatch.setattr(core, "route_drains", counting_route_drains)
+
+    process_to_height_and_raindrops(len(df), df, rain_drops_x, rain_drops_y, method="skyline")
+    assert len(calls) == 1
+
+
+def brute_force_receivers(height, left_x, right_x):
+    # First rain drain in sorting order (descending height, ascending left x) after each rain drain covering its
+    # right end
+    receiver = []
+    for i in range(len(height)):
+        candidates = [
+            j
+            for j in range(len(height))
+            if ((height[j] < height[i]) or ((height[j] == height[i]) and (left_x[j] > left_x[i])))
+            and (left_x[j] <= right_x[i] < right_x[j])
+        ]
+        receiver.append(min(candidates, key=lambda j: (-height[j], left_x[j])) if candidates else -1)
+    return np.array(receiver)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_receivers_match_brute_force(seed):
+    height, left_x, right_x = generate_random_drains(60, 0, 150, 0, 40, 4, seed, method="vectorized")
+    expected = brute_force_receivers(height, left_x, right_x)
+
+    np.testing.assert_array_equal(calculate_receivers(height, left_x, right_x), expected)
+    to_height, receiver = calculate_to_height(height, left_x, right_x)
+    np.testing.assert_array_equal(receiver, expected)
+    np.testing.assert_array_equal(to_height, np.where(expected >= 0, np.asarray(height)[expected], min(height)))
+
+
+def test_receiver_column_uses_the_index_labels():
+    df = random_frame(1)
+    df.index = df.index * 10 + 7
+    rain_drops_x, rain_drops_y = generate_raindrops(10, 0, 150, 0, 160, 0)
+
+    result, _, _ = process_to_height_and_raindrops(len(df), df, rain_drops_x, rain_drops_y)
+
+    expected = brute_force_receivers(df["height"].to_numpy(), df["left_x"].to_numpy(), df["right_x"].to_numpy())
+    labels = np.where(expected >= 0, df.index.to_numpy()[expected], -1)
+    assert result["receiver"].to_dict() == dict(zip(df.index, labels))
+    assert result["to_height"].to_dict() == dict(
+        zip(df.index, np.where(expected >= 0, df["height"].to_numpy()[expected], df["height"].min()))
+    )
@@ -0,0 +1,78 @@
+import json
+import threading
+import pytest
+
+from core import generate_random_drains, calculate_drain_amount
+from instrumentation import stage, is_enabled, StageRecorder
+
+
+def random_wall(seed: int, N: int = 30):
+    return generate_random_drains(N, 0, 100, 0, 4 * N, 3, seed, method="vectorized")
+
+
+def test_pipeline_stages_are_recorded():
+    h, l, r = random_wall(0)
+    with StageRecorder() as recorder:
+        calculate_drain_amount(len(h), h, l, r, 1.0, method="sweep", as_frame=False)
+
+    records = {record["stage"]: record for record in recorder.records()}
+    assert {"calculate_drain_amount", "sweep_drain_amount.route", "sweep_drain_amount.accumulate"} <= set(records)
+    assert records["calculate_drain_amount"]["n_drains"] == len(h)
+    assert records["calculate_drain_amount"]["method"] == "sweep"
+    assert records["sweep_drain_amount.route"]["n_segments"] > 0
+    assert all((record["wall_time_s"] >= 0) and not record["failed"] for record in records.values())
+
+
+def test_metrics_failures_and_nested_recorders():
+    sent = []
+    with StageRecorder(callback=sent.append, keep_records=False) as outer:
+        with StageRecorder() as inner:
+            with stage("peak", n_drains=3) as timed:
+                timed.peak("drop_array_bytes", 10)
+                timed.peak("drop_array_bytes", 5)
+                timed.set(wall_width=2.5)
+        with pytest.raises(ValueError):
+            with stage("failing"):
+                raise ValueError
+
+    assert outer.records() == []
+    assert [record["stage"] for record in sent] == ["peak", "failing"]
+    assert [record["stage"] for record in inner.records()] == ["peak"]
+    assert sent[0]["drop_array_bytes"] == 10 and sent[0]["wall_width"] == 2.5 and sent[0]["n_drains"] == 3
+    assert sent[1]["failed"]
+
+
+def test_summary_and_json_lines(tmp_path):
+    with StageRecorder() as recorder:
+        for n_drains in (4, 9, 2):
+            with stage("solve", n_drains=n_drains, method="sweep"):
+                pass
+
+    summary = recorder.summary()["solve"]
+    assert summary["calls"] == 3
+    assert summary["n_drains"] == 9
+    assert "method" not in summary
+    assert summary["max_time_s"] <= summary["total_time_s"]
+
+    path = tmp_path / "metrics.jsonl"
+    recorder.write_records(str(path))
+    assert [json.loads(line) for line in path.read_text().splitlines()] == recorder.records()
+    recorder.clear()
+    assert recorder.records() == []
+
+
+def test_nothing_is_recorded_outside_of_a_recorder():
+    h, l, r = random_wall(1)
+    recorder = StageRecorder()
+    assert not is_enabled()
+    calculate_drain_amount(len(h), h, l, r, 1.0, method="sweep", as_frame=False)
+    with recorder:
+        assert is_enabled()
+        # The stages run by other threads are not delivered to the recorder of this one
+        thread = threading.Thread(
+            target=calculate_drain_amount, args=(len(h), h, l, r, 1.0), kwargs={"as_frame": False}
+        )
+        thread.start()
+        thread.join()
+    assert not is_enabled()
+    assert recorder.records() == []
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from core import generate_random_drains, calculate_drain_amount, calculate_to_height
+from packed_layout import PackedLayout
+from cli import main
+
+
+def random_wall(seed: int, N: int = 40):
+    return (np.asarray(values) for values in generate_random_drains(N, 0, 150, 0, 4 * N, 3, seed, method="vectorized"))
+
+
+@pytest.mark.parametrize("dtype", ["int32", "int64", "float64"])
+@pytest.mark.parametrize("mmap", [True, False])
+def test_saved_layout_is_loaded_unchanged(tmp_path, dtype, mmap):
+    height, left_x, right_x = random_wall(0)
+    layout = PackedLayout.from_arrays(height, left_x, right_x, dtype=dtype)
+    path = str(tmp_path / "layout.rdl")
+    layout.save(path)
+
+    loaded = PackedLayout.load(path, mmap=mmap)
+    assert len(loaded) == len(height)
+    assert loaded.height.dtype == np.dtype(dtype)
+    for column, expected in zip(loaded.columns() + (loaded.order,), layout.columns() + (layout.order,)):
+        np.testing.assert_array_equal(column, expected)
+    # Columns sorted by descending height and ascending left x, pointing back to the input rain drains
+    np.testing.assert_array_equal(loaded.height, height[loaded.order])
+    np.testing.assert_array_equal(loaded.left_x, left_x[loaded.order])
+    assert np.all(np.diff(loaded.height) <= 0)
+
+
+def test_solve_matches_calculate_drain_amount():
+    height, left_x, right_x = random_wall(1)
+    layout = PackedLayout.from_arrays(height, left_x, right_x)
+    layout.validate(1.5)
+
+    expected = calculate_drain_amount(len(height), height, left_x, right_x, 1.5, method="sweep", as_frame=False)
+    np.testing.assert_allclose(layout.solve(1.5, input_order=True), expected)
+    np.testing.assert_allclose(layout.solve(1.5), expected[layout.order])
+
+
+def test_validate_rejects_overlapping_drains():
+    layout = PackedLayout.from_arrays([3, 3, 1], [0, 2, 0], [4, 6, 8])
+    with pytest.raises(Exception):
+        layout.validate(1.0)
+
+
+def test_cli_writes_packed_layout_results_in_input_order(tmp_path):
+    height, left_x, right_x = random_wall(2)
+    path = str(tmp_path / "layout.rdl")
+    PackedLayout.from_arrays(height, left_x, right_x).save(path)
+    output_dir = tmp_path / "results"
+
+    assert main([path, "--water-amount", "2.0", "--output-dir", str(output_dir)]) == 0
+
+    with np.load(output_dir / "layout_drain_amount.npz") as results:
+        np.testing.assert_array_equal(results["height"], height)
+        np.testing.assert_array_equal(results["left_x"], left_x)
+        np.testing.assert_array_equal(results["right_x"], right_x)
+        np.testing.assert_allclose(
+            results["drain_amount"],
+            calculate_drain_amount(len(height), height, left_x, right_x, 2.0, method="sweep", as_frame=False),
+        )
+        to_height, receiver = calculate_to_height(height, left_x, right_x)
+        np.testing.assert_array_equal(results["to_height"], to_height)
+        np.testing.assert_array_equal(results["receiver"], receiver)
@@ -0,0 +1,80 @@
+import asyncio
+import numpy as np
+import pytest
+
+from core import generate_random_drains, calculate_drain_amount
+from service import DrainService, ServiceOverloaded, solve_requests
+
+
+def random_wall(seed: int, N: int = 30):
+    return generate_random_drains(N, 0, 100, 0, 4 * N, 3, seed, method="vectorized")
+
+
+def test_batched_requests_match_individual_solves():
+    walls = [random_wall(seed, N=10 + seed) for seed in range(12)]
+    requests = [(h, l, r, 0.5 + seed) for seed, (h, l, r) in enumerate(walls)]
+
+    drain_amounts, errors, stats = solve_requests(requests, batch_delay=0.05)
+
+    assert errors == [None] * len(requests)
+    assert stats["batched_requests"] > 0
+    for (h, l, r, water), drain_amount in zip(requests, drain_amounts):
+        expected = calculate_drain_amount(len(h), h, l, r, water, method="sweep", as_frame=False)
+        np.testing.assert_allclose(drain_amount, expected)
+
+
+def test_identical_requests_are_coalesced():
+    h, l, r = random_wall(0)
+    drain_amounts, errors, stats = solve_requests([(h, l, r, 1.0)] * 5)
+
+    assert errors == [None] * 5
+    assert stats["coalesced"] == 4
+    for drain_amount in drain_amounts[1:]:
+        np.testing.assert_array_equal(drain_amount, drain_amounts[0])
+
+
+@pytest.mark.parametrize(
+    "valid, invalid",
+    [
+        (([3, 2], [0, 0], [4, 4], 1.0), ([3, 2], [0, 0], [4, 4], 1)),
+        (([1, 2], [0, 0], [4, 4], 1.0), ([True, 2], [0, 0], [4, 4], 1.0)),
+    ],
+)
+def test_result_does_not_depend_on_requests_in_flight(valid, invalid):
+    # An invalid request sharing the fingerprint of a valid one fails whatever the order of the requests
+    for valid_index in (0, 1):
+        requests = [valid, invalid] if valid_index == 0 else [invalid, valid]
+        drain_amounts, errors, _ = solve_requests(requests, method="dense")
+        assert errors[valid_index] is None
+        assert errors[1 - valid_index] is not None
+        assert drain_amounts[1 - valid_index] is None
+
+
+def test_malformed_requests_do_not_stop_the_service():
+    h, l, r = random_wall(1)
+    requests = [
+        (np.zeros((2, 2)), [0, 1], [1, 2], 1.0),
+        ([1, 2], [0], [1, 2], 1.0),
+        (h, l, r, 1.0),
+    ]
+    drain_amounts, errors, _ = solve_requests(requests)
+
+    assert errors[0] is not None and errors[1] is not None
+    assert errors[2] is None
+    np.testing.assert_allclose(
+        drain_amounts[2], calculate_drain_amount(len(h), h, l, r, 1.0, method="sweep", as_frame=False)
+    )
+
+
+def test_full_queue_rejects_requests_without_blocking():
+    walls = [random_wall(seed) for seed in range(8)]
+
+    async def run():
+        async with DrainService(max_workers=1, max_pending=1, block=False) as service:
+            return await asyncio.gather(
+                *(service.solve(h, l, r, 1.0) for h, l, r in walls), return_exceptions=True
+            )
+
+    results = asyncio.run(run())
+    assert any(isinstance(result, ServiceOverloaded) for result in results)
+    assert any(isinstance(result, np.ndarray) for result in results)